@@ -1,6 +1,7 @@
 # app/config.py
 import json
 import logging
+import shutil
 from functools import lru_cache
 from typing import Dict, Any, Optional, List
 from pydantic import field_validator, model_validator
@@ -23,20 +24,39 @@ class Settings(BaseSettings):
     openai_model: str = "gpt-5"
     openai_model_for_markup: str = "gpt-4o"
 
+    # Разметка SSML: "rules" - локальная по правилам, "expressive" - через LLM
+    markup_mode: str = "rules"
+
     # Таймауты для OpenAI (в секундах)
     openai_timeout_connect: float = 30.0
     openai_timeout_read: float = 900.0
 
+    # Пул соединений общего клиента OpenAI
+    openai_max_connections: int = 100
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_expiry: float = 60.0  # секунды
+    openai_http2: bool = True
+    openai_max_retries: int = 2
+
     # === БАЗА ДАННЫХ ===
     database_url: str
     database_pool_size: int = 20
     database_max_overflow: int = 30
+    database_pool_timeout: float = 30.0  # Сколько ждать свободного соединения, сек
+    database_pool_recycle: int = 1800  # Переоткрывать соединения старше, сек
+    database_pool_pre_ping: bool = True  # Проверять соединение перед выдачей из пула
+    database_statement_cache_size: int = 100  # Кэш подготовленных запросов asyncpg, 0 - за pgbouncer
+    database_statement_timeout_ms: int = 30000  # statement_timeout на стороне Postgres
 
     # === SELECTEL S3 ===
     selectel_access_key: str
     selectel_secret_key: str
     selectel_bucket_name: str
     selectel_domain: str
+    selectel_endpoint_url: str = "https://s3.ru-1.storage.selcloud.ru"
+    selectel_region: str = "ru-1"
+    s3_max_pool_connections: int = 16  # Не меньше blocking_io_max_workers
+    s3_max_attempts: int = 3  # Попытки запроса к S3 с учетом первой
 
     # === GOOGLE CLOUD ===
     google_cloud_project_id: Optional[str] = None
@@ -47,6 +67,13 @@ class Settings(BaseSettings):
     yandex_api_key: str
     yandex_folder_id: str
 
+    # Пул соединений к Yandex SpeechKit
+    yandex_tts_max_connections: int = 20
+    yandex_tts_keepalive_timeout: float = 60.0  # секунды
+    yandex_tts_dns_cache_ttl: int = 300  # секунды
+    yandex_tts_timeout_connect: float = 10.0
+    yandex_tts_timeout_read: float = 120.0
+
     # === БЕЗОПАСНОСТЬ ===
     allowed_origins: List[str] = [
         "http://127.0.0.1:8000"
@@ -64,6 +91,53 @@ class Settings(BaseSettings):
     max_request_size_mb: int = 10
     rate_limit_requests_per_minute: int = 3
     story_generation_timeout: int = 600  # 10 минут
+    generation_max_concurrent_per_user: int = 1  # Одновременные генерации одного пользователя/IP
+    generation_max_concurrent_total: int = 8  # Одновременные генерации во всем сервисе
+    generation_retry_after_seconds: int = 30  # Retry-After при превышении лимита параллельности
+    page_size_default: int = 20  # Записей на странице списков сказок и коллекций
+    page_size_max: int = 100  # Больше клиент запросить не может
+
+    # === ФОНОВЫЕ ГЕНЕРАЦИИ ===
+    generation_jobs_max_concurrent: int = 4  # Одновременно выполняемые пайплайны
+    generation_jobs_ttl_seconds: int = 3600  # Сколько хранить результат завершенной задачи
+    generation_jobs_max_pending: int = 20  # Размер очереди ожидающих задач, дальше - 503
+    generation_jobs_max_per_user: int = 2  # Выполняющиеся и ожидающие задачи одного пользователя/IP, дальше - 429
+
+    # === КЭШ ГОТОВЫХ СКАЗОК ===
+    tale_cache_enabled: bool = False
+    tale_cache_ttl_seconds: int = 86400  # Сутки
+    tale_cache_max_size_mb: int = 64
+    tale_cache_default_policy: str = "reuse"  # "reuse" - отдавать из кэша, "fresh" - всегда генерировать
+
+    # === ОЗВУЧКА ===
+    yandex_tts_max_concurrency: int = 4  # Одновременно озвучиваемые чанки одной сказки
+    google_tts_max_concurrency: int = 4
+    tts_chunk_max_retries: int = 2  # Повторы озвучки чанка при ошибке
+    tts_chunk_retry_delay: float = 1.0  # Задержка перед первым повтором, дальше удваивается
+
+    # Потоки для синхронных SDK хранилищ (boto3, Google Cloud Storage)
+    blocking_io_max_workers: int = 16
+
+    # Сжатие LINEAR16 от Google Cloud TTS в MP3 (процессы с ffmpeg)
+    audio_encoding_max_workers: int = 2
+    google_tts_mp3_bitrate: str = "48k"  # Моно речь, достаточно 32-64 кбит/с
+
+    # Аудио загружается в S3 частями по мере озвучки (S3 требует не меньше 5 МБ на часть)
+    s3_multipart_part_size: int = 8 * 1024 * 1024
+
+    # === КЭШ ОЗВУЧКИ ===
+    # Кэш пишет на диск до tts_cache_max_size_mb, поэтому по умолчанию выключен.
+    # Включается TTS_CACHE_ENABLED=true, каталог - на постоянном диске: /tmp на сервере
+    # может быть tmpfs (кэш занимает память) или PrivateTmp (кэш пропадает при перезапуске).
+    # По умолчанию каталог в StateDirectory сервиса (deploy/fairytails.service)
+    tts_cache_enabled: bool = False
+    tts_cache_dir: str = "/var/lib/fairytails/tts_cache"
+    tts_cache_max_size_mb: int = 2048  # Локальный диск, при превышении удаляются давно не использованные чанки
+    tts_cache_s3_enabled: bool = False  # Общий для всех инстансов уровень кэша в S3
+
+    # === ПРОДОЛЖЕНИЕ ГЕНЕРАЦИИ ПОСЛЕ СБОЯ ===
+    generation_checkpoints_enabled: bool = True
+    generation_checkpoint_ttl_seconds: int = 86400  # Сколько хранить прогресс незавершенной генерации
 
     # === ЛОГИРОВАНИЕ ===
     log_level: str = "INFO"
@@ -106,6 +180,36 @@ class Settings(BaseSettings):
             raise ValueError(f"Модель {v} не поддерживается. Доступны: {allowed_models}")
         return v
 
+    @field_validator("markup_mode")
+    @classmethod
+    def validate_markup_mode(cls, v: str) -> str:
+        allowed_modes = ["rules", "expressive"]
+        if v not in allowed_modes:
+            raise ValueError(f"MARKUP_MODE должен быть одним из: {allowed_modes}")
+        return v
+
+    @field_validator("tale_cache_default_policy")
+    @classmethod
+    def validate_tale_cache_policy(cls, v: str) -> str:
+        allowed_policies = ["reuse", "fresh"]
+        if v not in allowed_policies:
+            raise ValueError(f"TALE_CACHE_DEFAULT_POLICY должен быть одним из: {allowed_policies}")
+        return v
+
+    @field_validator("google_tts_mp3_bitrate")
+    @classmethod
+    def validate_mp3_bitrate(cls, v: str) -> str:
+        if not v.endswith("k") or not v[:-1].isdigit():
+            raise ValueError("GOOGLE_TTS_MP3_BITRATE должен быть в формате ffmpeg, например 48k")
+        return v
+
+    @field_validator("s3_multipart_part_size")
+    @classmethod
+    def validate_multipart_part_size(cls, v: int) -> int:
+        if v < 5 * 1024 * 1024:
+            raise ValueError("S3_MULTIPART_PART_SIZE должен быть не меньше 5 МБ (5242880)")
+        return v
+
     @field_validator("database_url")
     @classmethod
     def validate_database_url(cls, v: str) -> str:
@@ -230,9 +334,10 @@ class Settings(BaseSettings):
                 "Authorization",
                 "Accept",
                 "Accept-Language",
-                "X-Request-ID"
+                "X-Request-ID",
+                "Idempotency-Key"
             ],
-            "expose_headers": ["X-Request-ID"],
+            "expose_headers": ["X-Request-ID", "Retry-After"],
             "max_age": 3600 if not self.is_development else 600
         }
 
@@ -288,6 +393,10 @@ def validate_all_settings() -> bool:
         assert current_settings.database_url, "Database URL не установлен"
         assert current_settings.yandex_api_key, "Yandex API key не установлен"
 
+        # pydub кодирует MP3 для Google TTS через ffmpeg - без него озвучка ENG/FRA
+        # падала бы уже после оплаченных запросов к Google
+        assert shutil.which("ffmpeg"), "ffmpeg не найден в PATH (нужен для озвучки Google TTS)"
+
         print("✅ Все настройки корректны")
         return True
 
@@ -1,26 +1,109 @@
 import os
+import time
 from typing import Annotated
-from app.config import settings
+from app.config import Settings, settings
 
 from dotenv import load_dotenv
 from fastapi import Depends
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import Session
 
+from app.services.metrics import (DB_CONNECTION_CHECKOUT_DURATION, DB_POOL_CONNECTIONS, DB_POOL_WAIT_DURATION,
+                                  registry)
+
 load_dotenv()
 
 #Получение из env url
 DATABASE_URL = settings.database_url
 
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Пул соединений, который измеряет ожидание свободного соединения"""
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_DURATION.observe(time.perf_counter() - started_at)
+
+
+def create_engine_from_settings(current_settings: Settings) -> AsyncEngine:
+    """
+    Асинхронный движок с настройками пула из конфигурации.
+    Для asyncpg дополнительно задаются кэш подготовленных запросов
+    (0 - выключен, нужно за pgbouncer в режиме transaction) и statement_timeout на сервере
+    """
+    connect_args = {}
+    if make_url(current_settings.database_url).get_driver_name() == "asyncpg":
+        connect_args = {
+            "statement_cache_size": current_settings.database_statement_cache_size,
+            "prepared_statement_cache_size": current_settings.database_statement_cache_size,
+            "server_settings": {
+                "statement_timeout": str(current_settings.database_statement_timeout_ms),
+            },
+        }
+
+    return create_async_engine(
+        current_settings.database_url,
+        echo=False,
+        poolclass=InstrumentedAsyncPool,
+        pool_size=current_settings.database_pool_size,
+        max_overflow=current_settings.database_max_overflow,
+        pool_timeout=current_settings.database_pool_timeout,
+        pool_recycle=current_settings.database_pool_recycle,
+        pool_pre_ping=current_settings.database_pool_pre_ping,
+        connect_args=connect_args
+    )
+
+
 #Создание асинхронного движка
-engine = create_async_engine(DATABASE_URL, echo=False)
+engine = create_engine_from_settings(settings)
 
 new_session = async_sessionmaker(engine, expire_on_commit=False)
 
 
+# Сколько соединение остается взятым из пула: долгие значения означают,
+# что сессия держит соединение во время обращений к внешним сервисам
+@event.listens_for(engine.sync_engine, "checkout")
+def on_connection_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["checked_out_at"] = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def on_connection_checkin(dbapi_connection, connection_record):
+    checked_out_at = connection_record.info.pop("checked_out_at", None)
+    if checked_out_at is not None:
+        DB_CONNECTION_CHECKOUT_DURATION.observe(time.perf_counter() - checked_out_at)
+
+
+def get_pool_stats() -> dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # Отрицательное значение - сколько еще соединений можно открыть до pool_size
+        "overflow": pool.overflow(),
+        "max_overflow": settings.database_max_overflow,
+    }
+
+
+def collect_pool_metrics() -> None:
+    for state, value in get_pool_stats().items():
+        if state != "max_overflow":
+            DB_POOL_CONNECTIONS.set(value, state=state)
+
+
+registry.add_collector(collect_pool_metrics)
+
+
 async def get_session():
     async with new_session() as session:
         yield session
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
\ No newline at end of file
+SessionDep = Annotated[Session, Depends(get_session)]
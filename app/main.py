@@ -6,10 +6,16 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import get_settings, validate_all_settings
 from app.i18n_config import setup_i18n
+from app.services.audio_encoding import audio_encoder
+from app.services.blocking_io import blocking_io
+from app.services.generation_jobs import generation_job_manager
+from app.services.openai_client import openai_client_manager
+from app.services.tts_cache import tts_chunk_cache
 
 from app.routers import (home, all_users, docs,
                          questionnaire_options, delete_story, delete_collection, all_collection,
-                         collections_detail, generation, creating_sequels, display_stories)
+                         collections_detail, generation, creating_sequels, display_stories,
+                         service_stats, metrics)
 
 if not validate_all_settings():
     exit(1)
@@ -24,8 +30,18 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info(f"Starting application in {settings.environment} mode...")
     setup_i18n()
+    openai_client_manager.start()
+    blocking_io.start()
+    audio_encoder.start()
+    await tts_chunk_cache.start()
+    await generation.yandex_audio_maker.start()
     yield
     logger.info("Shutting down application...")
+    await generation_job_manager.shutdown()
+    await openai_client_manager.close()
+    await generation.yandex_audio_maker.close()
+    blocking_io.shutdown()
+    audio_encoder.shutdown()
 
 app = FastAPI(
     lifespan=lifespan,
@@ -50,6 +66,8 @@ app.include_router(all_users.router)
 app.include_router(delete_story.router)
 app.include_router(delete_collection.router)
 app.include_router(all_collection.router)
+app.include_router(service_stats.router)
+app.include_router(metrics.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -16,7 +16,7 @@ sys.path.insert(0, str(project_root))
 
 # Now import your models - this should work
 try:
-    from app.models import User, Collection, Story
+    from app.models import User, Collection, Story, GenerationCheckpoint
     from app.schemas import EthnographyEnum, LanguageEnum, GenderEnum
 except ImportError as e:
     print(f"Import error: {e}")
@@ -0,0 +1,58 @@
+"""Add composite indexes for listing queries
+
+Revision ID: 7d2a9c41e5b8
+Revises: c4e81f2a7d35
+Create Date: 2026-10-18 14:05:12.374019
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2a9c41e5b8'
+down_revision: Union[str, Sequence[str], None] = 'c4e81f2a7d35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя индекса, таблица, колонки). id DESC - в порядке курсора страниц (created_at DESC, id DESC)
+LISTING_INDEXES = [
+    ('ix_story_user_id_created_at', 'story', ['user_id', sa.text('created_at DESC'), sa.text('id DESC')]),
+    ('ix_story_collection_id_created_at', 'story',
+     ['collection_id', sa.text('created_at DESC'), sa.text('id DESC')]),
+    ('ix_collection_user_id_created_at', 'collection',
+     ['user_id', sa.text('created_at DESC'), sa.text('id DESC')]),
+]
+
+# Индексы на id дублируют индексы первичных ключей
+REDUNDANT_ID_INDEXES = [
+    ('ix_user_id', 'user'),
+    ('ix_collection_id', 'collection'),
+    ('ix_story_id', 'story'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY не блокирует запись в таблицы, но не работает внутри транзакции.
+    # if_not_exists позволяет перезапустить миграцию после сбоя; если построение
+    # прервалось, невалидный индекс нужно удалить вручную (DROP INDEX CONCURRENTLY)
+    with op.get_context().autocommit_block():
+        for name, table, columns in LISTING_INDEXES:
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+        for name, table in REDUNDANT_ID_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table in REDUNDANT_ID_INDEXES:
+            op.create_index(name, table, ['id'], unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+        for name, table, _ in LISTING_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,43 @@
+"""Add generation checkpoints
+
+Revision ID: c4e81f2a7d35
+Revises: bdf613a9994e
+Create Date: 2026-10-18 10:12:31.508214
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e81f2a7d35'
+down_revision: Union[str, Sequence[str], None] = 'bdf613a9994e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('generationcheckpoint',
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('key_hash', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False),
+    sa.Column('stage', sqlmodel.sql.sqltypes.AutoString(length=20), nullable=False),
+    sa.Column('tale_text', sa.Text(), nullable=True),
+    sa.Column('target_length', sa.Integer(), nullable=True),
+    sa.Column('markup_text', sa.Text(), nullable=True),
+    sa.Column('audio_url', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('duration_seconds', sa.Float(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sa.Uuid(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('key_hash')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('generationcheckpoint')
@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime, UTC
 from typing import Optional, List
 
-from sqlalchemy import Column, Text
+from sqlalchemy import Column, Index, Text
 from sqlalchemy import TIMESTAMP
 from sqlalchemy.types import JSON
 from sqlmodel import Field, SQLModel, Enum, Relationship
@@ -11,7 +11,7 @@ from app.schemas import LanguageEnum, GenderEnum
 
 
 class Base(SQLModel):
-    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, index=True, nullable=False)
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, nullable=False)
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(UTC).replace(tzinfo=None),
         nullable=False
@@ -62,3 +62,34 @@ class Story(Base, table=True):
     # Relationship для связи с таблицей Юзер
     user: User = Relationship(back_populates="story")
     collection: Collection = Relationship(back_populates="story")
+
+class GenerationCheckpoint(Base, table=True):
+    """Промежуточные результаты генерации сказки для продолжения после сбоя"""
+    # Хеш пользователя и ключа запроса (Idempotency-Key или хеш анкеты)
+    key_hash: str = Field(max_length=64, unique=True, nullable=False)
+    # Последний завершенный этап: created → generated → expanded → marked_up → voiced
+    stage: str = Field(default="created", max_length=20, nullable=False)
+    tale_text: Optional[str] = Field(default=None, sa_column=Column(Text))
+    target_length: Optional[int] = Field(default=None)
+    markup_text: Optional[str] = Field(default=None, sa_column=Column(Text))
+    audio_url: Optional[str] = Field(default=None)
+    duration_seconds: Optional[float] = Field(default=None)
+    updated_at: datetime = Field(
+        default_factory=lambda: datetime.now(UTC).replace(tzinfo=None),
+        nullable=False
+    )
+
+    user_id: uuid.UUID = Field(foreign_key="user.id")
+
+
+# Индексы под выборки списков: фильтр по владельцу и сортировка от новых к старым.
+# id в конце - тот же порядок, что у курсора страниц (created_at DESC, id DESC), поэтому
+# записи с одинаковым created_at тоже упорядочены индексом и сортировка не нужна.
+# Отдельный индекс на id не нужен - его покрывает первичный ключ
+Index("ix_story_user_id_created_at", Story.user_id, Story.created_at.desc(), Story.id.desc())
+Index("ix_story_collection_id_created_at", Story.collection_id, Story.created_at.desc(), Story.id.desc())
+Index("ix_collection_user_id_created_at", Collection.user_id, Collection.created_at.desc(), Collection.id.desc())
+
+# Колонки превью для списков: без content_story (десятки КБ текста) и interests
+STORY_PREVIEW_COLUMNS = (Story.id, Story.title, Story.created_at, Story.duration_seconds)
+COLLECTION_PREVIEW_COLUMNS = (Collection.id, Collection.title, Collection.created_at, Collection.total_Listening_time)
@@ -1,10 +1,13 @@
-from fastapi import APIRouter
-from sqlmodel import select, desc
+from typing import Optional
+
+from fastapi import APIRouter, Query
+from sqlmodel import select
 
 from app.database import SessionDep
-from app.models import Collection, Story
+from app.models import STORY_PREVIEW_COLUMNS, Collection, Story
 from app.schemas import CollectionDetailsSchema, StoryPreviewResponseSchema
 from app.services.conversion_time import seconds_to_minutes
+from app.services.pagination import InvalidCursor, keyset_page, page_size, split_page
 
 router = APIRouter()
 
@@ -12,15 +15,25 @@ router = APIRouter()
 @router.get("/collections/{id}", response_model=CollectionDetailsSchema)
 async def get_collection_details(
         id: str | None,
-        session: SessionDep
+        session: SessionDep,
+        cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+        limit: Optional[int] = Query(None, ge=1, description="Размер страницы, не больше page_size_max"),
 ):
+    limit = page_size(limit)
+    try:
+        collection_detail = keyset_page(
+            select(*STORY_PREVIEW_COLUMNS).where(Story.collection_id == id),
+            Story.created_at, Story.id, cursor, limit
+        )
+    except InvalidCursor as e:
+        raise e.to_http_exception()
+
     stmt_for_title = select(Collection.title).where(Collection.id == id)
     result = await session.execute(stmt_for_title)
     title_collection = result.scalars().first()
 
-    collection_detail = select(Story).where(Story.collection_id == id).order_by(desc(Story.created_at))
     result_collection_detail = await session.execute(collection_detail)
-    all_fairy_tails_in_collection = result_collection_detail.scalars().all()
+    all_fairy_tails_in_collection, next_cursor = split_page(result_collection_detail.all(), limit)
 
     fairy_tails = [
         StoryPreviewResponseSchema(
@@ -35,5 +48,6 @@ async def get_collection_details(
 
     return CollectionDetailsSchema(
         title=title_collection,
-        stories=fairy_tails
+        stories=fairy_tails,
+        next_cursor=next_cursor
     )
\ No newline at end of file
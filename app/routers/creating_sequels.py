@@ -1,43 +1,82 @@
+import asyncio
 import json
 import time
 from datetime import datetime, UTC
 
 from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException
-from openai import AsyncOpenAI
+from fastapi import APIRouter, HTTPException, Request
 from sqlalchemy import func
 from sqlmodel import select
 
 from app.config import settings
-from app.database import SessionDep
+from app.database import new_session
 from app.services.prompt_continue import prompt_continue_builder
 from app.schemas import FollowUpQuestionnaire, StoryGenerationResponse
 from app.models import Story, Collection
-from app.routers.generation import google_audio_maker, yandex_audio_maker
-from app.services.markup_prompt import create_markup_prompt_from_ru, create_markup_prompt_from_euro
+from app.routers.generation import create_story_markup_and_audio
+from app.services.admission import AdmissionRejected, generation_admission, get_client_key
+from app.services.metrics import record_llm_usage, track_pipeline, track_stage, update_pipeline_labels
+from app.services.openai_client import get_openai_client
+from app.services.ssml_markup import get_provider
 
 load_dotenv()
 router = APIRouter()
 
-OPENAI_API_KEY = settings.openai_api_key
 OPENAI_MODEL = settings.openai_model
-OPENAI_MODEL_FOR_MARKUP = settings.openai_model_for_markup
 
 
 @router.post("/stories/{story_id}/make_continue")
 async def make_continue_for_story(
-        session: SessionDep,
+        http_request: Request,
         story_id: str,
         data: FollowUpQuestionnaire
 ):
+    try:
+        # Лимиты считаются по вызывающему клиенту (у запроса нет пользователя - по IP),
+        # а не по владельцу сказки, и проверяются до обращения к базе
+        with generation_admission.admit(get_client_key(http_request)):
+            # Исходную сказку читаем в короткой сессии: соединение возвращается в пул
+            # до обращений к OpenAI и TTS, которые идут несколько минут
+            async with new_session() as session:
+                result = await session.execute(select(Story).where(Story.id == story_id))
+                basis_for_continuation = result.scalars().first()
+
+            if basis_for_continuation is None:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Story with ID {story_id} not found"
+                )
+
+            with track_pipeline(
+                    "make_continue",
+                    model=OPENAI_MODEL,
+                    story_duration_minutes=data.story_duration_minutes
+            ):
+                async with asyncio.timeout(settings.story_generation_timeout):
+                    return await create_continuation(basis_for_continuation, data)
+
+    except AdmissionRejected as e:
+        raise e.to_http_exception()
+    except TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail=f"Генерация продолжения не завершилась за {settings.story_generation_timeout} сек"
+        )
+
+
+async def create_continuation(
+        basis_for_continuation: Story,
+        data: FollowUpQuestionnaire
+) -> StoryGenerationResponse:
     start_time = time.time()
 
     try:
-        client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+        client = get_openai_client()
 
-        stmt = select(Story).where(Story.id == story_id)
-        result = await session.execute(stmt)
-        basis_for_continuation = result.scalars().first()
+        update_pipeline_labels(
+            language=basis_for_continuation.language.value,
+            provider=get_provider(basis_for_continuation.language)
+        )
 
         story_created_at = basis_for_continuation.created_at
         continuation_created_at = datetime.now(UTC).replace(tzinfo=None)
@@ -60,18 +99,20 @@ async def make_continue_for_story(
 
         )
 
-        response = await client.chat.completions.create(
-            model=OPENAI_MODEL,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": f"{prompt_for_continuation['system']}. Всегда возвращай ответ в формате JSON."},
-                {"role": "user",
-                 "content": f"{prompt_for_continuation['user']}\n\nВерни ответ в формате JSON с полями: 'tale' (текст сказки), "
-                                                f"'word_count' (количество слов), 'target_words_usage' (словарь использования целевых слов)."}
-            ],
-            temperature=1,
-            max_completion_tokens=16384
-        )
+        with track_stage("generation"):
+            response = await client.chat.completions.create(
+                model=OPENAI_MODEL,
+                response_format={"type": "json_object"},
+                messages=[
+                    {"role": "system", "content": f"{prompt_for_continuation['system']}. Всегда возвращай ответ в формате JSON."},
+                    {"role": "user",
+                     "content": f"{prompt_for_continuation['user']}\n\nВерни ответ в формате JSON с полями: 'tale' (текст сказки), "
+                                                    f"'word_count' (количество слов), 'target_words_usage' (словарь использования целевых слов)."}
+                ],
+                temperature=1,
+                max_completion_tokens=16384
+            )
+            record_llm_usage(OPENAI_MODEL, response.usage)
 
         # Парсим JSON ответ
         tale_data = json.loads(response.choices[0].message.content)
@@ -86,110 +127,19 @@ async def make_continue_for_story(
             detail=f"Ошибка генерации сказки: {str(e)}"
         )
 
-    if basis_for_continuation.language == "РУС":
-        try:
-            client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-
-            markup_prompt = create_markup_prompt_from_ru(tale_text)
-
-            response = await client.chat.completions.create(
-                model=OPENAI_MODEL_FOR_MARKUP,
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system",
-                     "content": f"{markup_prompt['system_prompt_markup']}. Всегда возвращай ответ в формате JSON."},
-                    {"role": "user",
-                     "content": f"{markup_prompt['user_prompt_markup']}\n\nВерни ответ в формате JSON с полями: 'markup_tale' (текст сказки), "
-                                f"'word_count' (количество слов), 'target_words_usage' (словарь использования целевых слов)."}
-                ],
-                temperature=1,
-                max_completion_tokens=16384
-            )
-
-            # Парсим JSON ответ
-            markup_tale_data = json.loads(response.choices[0].message.content)
-
-            markup_tale_text = markup_tale_data['markup_tale']
-
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Ошибка разметки сказки: {str(e)}"
-            )
-
-        try:
-            audio_url = await yandex_audio_maker.make_story_audio(markup_tale_text)
-
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Ошибка озвучивания сказки: {str(e)}"
-            )
-
-    else:
-        try:
-            client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-            markup_prompt = create_markup_prompt_from_euro(tale_text)
-            response = await client.chat.completions.create(
-                model=OPENAI_MODEL_FOR_MARKUP,
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system",
-                     "content": f"{markup_prompt['system_prompt_markup']}. Always return a response in JSON format.."},
-                    {"role": "user",
-                     "content": f"{markup_prompt['user_prompt_markup']}\n\nReturn the response in JSON format with the fields: 'markup_tale' (text of the fairy tale), "
-                                f"'word_count' (number of words), 'target_words_usage' (dictionary of the use of target words)."}
-                ],
-                temperature=0.9
-            )
-
-            # Парсим JSON ответ
-
-            markup_tale_data = json.loads(response.choices[0].message.content)
-            markup_tale_text = markup_tale_data['markup_tale']
-
-
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Ошибка разметки сказки: {str(e)}"
-            )
-
-        if basis_for_continuation.language == "FRA":
-            voice_name = "fr-FR-Studio-A"
-            language_code = "fr-FR"
-
-            try:
-
-                audio_url = await google_audio_maker.make_story_audio(
-                    story_text=markup_tale_text,
-                    voice_name=voice_name,
-                    language_code=language_code
-                )
-
-            except Exception as e:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Ошибка озвучивания сказки: {str(e)}"
-                )
-
-        else:
-            voice_name = "en-US-Studio-O"
-            language_code = "en-US"
-
-            try:
-
-                audio_url = await google_audio_maker.make_story_audio(
-                    story_text=markup_tale_text,
-                    voice_name=voice_name,
-                    language_code=language_code
-                )
+    try:
+        markup_tale_text, audio_url = await create_story_markup_and_audio(
+            client,
+            tale_text,
+            basis_for_continuation.language,
+            expressive_markup=data.expressive_markup
+        )
 
-            except Exception as e:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Ошибка озвучивания сказки: {str(e)}"
-                )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка разметки и озвучивания сказки: {str(e)}"
+        )
 
     new_story = Story(
         user_id=basis_for_continuation.user_id,
@@ -205,30 +155,8 @@ async def make_continue_for_story(
         gender=basis_for_continuation.gender
     )
 
-    session.add(new_story)
-    await session.commit()
-    await session.refresh(new_story)
-
-    # Получаем коллекцию
-    collection_statement = select(Collection).where(Collection.id == basis_for_continuation.collection_id)
-    collection_result = await session.execute(collection_statement)
-    collection = collection_result.scalars().first()
-
-    if not collection:
-        raise ValueError(f"Collection with ID {basis_for_continuation.collection_id} not found")
-
-    # Вычисляем сумму времени всех сказок в коллекции
-    total_time_statement = select(func.coalesce(func.sum(Story.duration_seconds), 0)).where(
-        Story.collection_id == basis_for_continuation.collection_id
-    )
-    total_time_result = await session.execute(total_time_statement)
-    total_listening_time = total_time_result.scalar()
-
-    # Обновляем коллекцию
-    collection.total_Listening_time = total_listening_time
-
-    await session.commit()
-    await session.refresh(collection)
+    with track_stage("db_save"):
+        await save_continuation(new_story)
 
     elapsed = time.time() - start_time
     print(f"Конец ендпоинта. Время создания: {elapsed} сек")
@@ -239,4 +167,33 @@ async def make_continue_for_story(
         title=new_story.title,
         content=new_story.content_story,
         url=new_story.audio_url
-    )
\ No newline at end of file
+    )
+
+
+async def save_continuation(new_story: Story) -> None:
+    """
+    Сохраняет продолжение и пересчитывает время прослушивания коллекции
+    одной транзакцией в новой сессии, уже после обращений к провайдерам
+    """
+    async with new_session() as session:
+        # Получаем коллекцию
+        collection_statement = select(Collection).where(Collection.id == new_story.collection_id)
+        collection_result = await session.execute(collection_statement)
+        collection = collection_result.scalars().first()
+
+        if not collection:
+            raise ValueError(f"Collection with ID {new_story.collection_id} not found")
+
+        session.add(new_story)
+        await session.flush()
+
+        # Вычисляем сумму времени всех сказок в коллекции
+        total_time_statement = select(func.coalesce(func.sum(Story.duration_seconds), 0)).where(
+            Story.collection_id == new_story.collection_id
+        )
+        total_time_result = await session.execute(total_time_statement)
+
+        # Обновляем коллекцию
+        collection.total_Listening_time = total_time_result.scalar()
+
+        await session.commit()
@@ -1,40 +1,111 @@
+import asyncio
 import json
 import os
 import time
 import uuid
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Callable, Awaitable
 
 from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from openai import AsyncOpenAI
 from sqlmodel import select
 
 from app.config import settings
-from app.database import SessionDep
+from app.database import new_session
 from app.models import User, Collection, Story
-from app.schemas import Questionnaire, StoryGenerationResponse, UserAccessRequest
+from app.schemas import Questionnaire, StoryGenerationResponse, UserAccessRequest, GenerationJobResponse
 from app.services.audio_maker import YandexSpeechKitAudioMaker, GoogleCloudAudioMaker
+from app.services.admission import AdmissionRejected, generation_admission, get_client_key
+from app.services.generation_checkpoints import generation_checkpoints, stage_reached
+from app.services.generation_jobs import GenerationJob, StageCallback, generation_job_manager
+from app.services.openai_client import get_openai_client
 from app.services.markup_prompt import create_markup_prompt_from_ru, create_markup_prompt_from_euro
 from app.services.prompt_builder import prompt_user_builder
+from app.services.metrics import record_llm_usage, track_pipeline, track_stage
+from app.services.ssml_markup import build_ssml_markup, get_provider
+from app.services.single_flight import ClientDisconnected, InFlightCall, generation_single_flight
+from app.services.tale_cache import CachedTale, questionnaire_cache_key, tale_cache
+from app.services.streaming import JsonStringFieldExtractor, SSMLParagraphSplitter, format_sse_event
 
 load_dotenv()
 router = APIRouter()
 
-OPENAI_API_KEY = settings.openai_api_key
 OPENAI_MODEL = settings.openai_model
 OPENAI_MODEL_FOR_MARKUP = settings.openai_model_for_markup
 
 
+# Колбэк, получающий очередной фрагмент текста сказки при потоковой генерации
+TaleDeltaCallback = Callable[[str], None]
+
+# Колбэк, получающий готовую разметку до окончания озвучки
+MarkupReadyCallback = Callable[[str], Awaitable[None]]
+
+# Голоса Google Cloud для европейских языков
+EUROPEAN_VOICES = {
+    "FRA": {"voice_name": "fr-FR-Studio-A", "language_code": "fr-FR"},
+    # По умолчанию английский для остальных языков
+    "default": {"voice_name": "en-US-Studio-O", "language_code": "en-US"}
+}
+
 yandex_audio_maker = YandexSpeechKitAudioMaker()
 google_audio_maker = GoogleCloudAudioMaker()
 
 
-async def generate_tale_content(client: AsyncOpenAI, data: Questionnaire) -> Dict[str, Any]:
-    """Генерация основного содержания сказки"""
+async def create_json_completion(client: AsyncOpenAI, on_field_delta: Optional[TaleDeltaCallback],
+                                 stream_field: str = "tale", **request_params) -> str:
+    """
+    Выполняет запрос к модели и возвращает JSON-строку ответа.
+    Без колбэка ждет ответ целиком, с колбэком - читает поток и по мере
+    поступления токенов отдает раскодированный текст поля stream_field.
+    """
+    if on_field_delta is None:
+        response = await client.chat.completions.create(**request_params)
+        record_llm_usage(request_params["model"], response.usage)
+        return response.choices[0].message.content
+
+    stream = await client.chat.completions.create(
+        stream=True,
+        stream_options={"include_usage": True},
+        **request_params
+    )
+    extractor = JsonStringFieldExtractor(stream_field)
+    content_parts = []
+
+    async for chunk in stream:
+        # Последний фрагмент потока содержит только usage
+        if chunk.usage:
+            record_llm_usage(request_params["model"], chunk.usage)
+
+        if not chunk.choices:
+            continue
+
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+
+        content_parts.append(delta)
+        field_delta = extractor.feed(delta)
+        if field_delta:
+            on_field_delta(field_delta)
+
+    return "".join(content_parts)
+
+
+async def generate_tale_content(client: AsyncOpenAI, data: Questionnaire,
+                                on_tale_delta: Optional[TaleDeltaCallback] = None) -> Dict[str, Any]:
+    """
+    Генерация основного содержания сказки.
+    Если передан on_tale_delta, ответ модели читается потоком и текст сказки
+    отдается в колбэк по мере генерации.
+    """
     prompt = prompt_user_builder(data)
 
     print("Начали генерацию сказки")
-    response = await client.chat.completions.create(
+    content = await create_json_completion(
+        client,
+        on_tale_delta,
         model=OPENAI_MODEL,
         response_format={"type": "json_object"},
         messages=[
@@ -47,7 +118,7 @@ async def generate_tale_content(client: AsyncOpenAI, data: Questionnaire) -> Dic
         max_completion_tokens=16384
     )
 
-    tale_data = json.loads(response.choices[0].message.content)
+    tale_data = json.loads(content)
     tale_text = tale_data['tale']
 
     answer = {
@@ -58,7 +129,8 @@ async def generate_tale_content(client: AsyncOpenAI, data: Questionnaire) -> Dic
     return answer
 
 
-async def expand_tale_if_needed(client: AsyncOpenAI, tale_text: str, target_length: int) -> str:
+async def expand_tale_if_needed(client: AsyncOpenAI, tale_text: str, target_length: int,
+                                on_tale_delta: Optional[TaleDeltaCallback] = None) -> str:
     """Расширение сказки при необходимости"""
     print("Начинаем увеличение сказки")
     expand_prompt = f"""
@@ -68,7 +140,9 @@ async def expand_tale_if_needed(client: AsyncOpenAI, tale_text: str, target_leng
         {tale_text}
         """
 
-    response = await client.chat.completions.create(
+    content = await create_json_completion(
+        client,
+        on_tale_delta,
         model=OPENAI_MODEL,
         response_format={"type": "json_object"},
         messages=[{"role": "user",
@@ -78,16 +152,20 @@ async def expand_tale_if_needed(client: AsyncOpenAI, tale_text: str, target_leng
         max_completion_tokens=16384
     )
 
-    expanded_data = json.loads(response.choices[0].message.content)
+    expanded_data = json.loads(content)
     return expanded_data['tale']
 
 
-async def create_markup_russian(client: AsyncOpenAI, tale_text: str) -> str:
+async def create_markup_russian(client: AsyncOpenAI, tale_text: str,
+                                on_markup_delta: Optional[TaleDeltaCallback] = None) -> str:
     """Создание разметки для русского текста"""
     print("Приступаем к разметке (РУС)")
     markup_prompt = create_markup_prompt_from_ru(tale_text)
 
-    response = await client.chat.completions.create(
+    content = await create_json_completion(
+        client,
+        on_markup_delta,
+        stream_field="markup_tale",
         model=OPENAI_MODEL,
         response_format={"type": "json_object"},
         messages=[
@@ -100,16 +178,20 @@ async def create_markup_russian(client: AsyncOpenAI, tale_text: str) -> str:
         temperature=1
     )
 
-    markup_data = json.loads(response.choices[0].message.content)
+    markup_data = json.loads(content)
     return markup_data['markup_tale']
 
 
-async def create_markup_european(client: AsyncOpenAI, tale_text: str) -> str:
+async def create_markup_european(client: AsyncOpenAI, tale_text: str,
+                                  on_markup_delta: Optional[TaleDeltaCallback] = None) -> str:
     """Создание разметки для европейских языков"""
     print("Приступаем к разметке (EUR)")
     markup_prompt = create_markup_prompt_from_euro(tale_text)
 
-    response = await client.chat.completions.create(
+    content = await create_json_completion(
+        client,
+        on_markup_delta,
+        stream_field="markup_tale",
         model=OPENAI_MODEL_FOR_MARKUP,
         response_format={"type": "json_object"},
         messages=[
@@ -122,37 +204,153 @@ async def create_markup_european(client: AsyncOpenAI, tale_text: str) -> str:
         temperature=1
     )
 
-    markup_data = json.loads(response.choices[0].message.content)
+    markup_data = json.loads(content)
     return str(markup_data['markup_tale'])
 
 
-async def create_audio_russian(markup_text: str) -> Dict[str, Any]:
+async def create_audio_russian(markup_text: str, chunk_store=None) -> Dict[str, Any]:
     """Создание аудио для русского текста через Yandex"""
     print("Начинаем озвучку (Yandex)")
-    return await yandex_audio_maker.make_story_audio(markup_text)
+    return await yandex_audio_maker.make_story_audio(markup_text, chunk_store=chunk_store)
 
 
-async def create_audio_european(markup_text: str, language: str) -> Dict[str, Any]:
+async def create_audio_european(markup_text: str, language: str, chunk_store=None) -> Dict[str, Any]:
     """Создание аудио для европейских языков через Google Cloud"""
-    voice_config = {
-        "FRA": {"voice_name": "fr-FR-Studio-A", "language_code": "fr-FR"},
-        # По умолчанию английский для остальных языков
-        "default": {"voice_name": "en-US-Studio-O", "language_code": "en-US"}
-    }
-
-    config = voice_config.get(language, voice_config["default"])
+    config = EUROPEAN_VOICES.get(language, EUROPEAN_VOICES["default"])
     print(f"Начинаем озвучку (Google Cloud - {language})")
 
     return await google_audio_maker.make_story_audio(
         story_text=markup_text,
         voice_name=config["voice_name"],
-        language_code=config["language_code"]
+        language_code=config["language_code"],
+        chunk_store=chunk_store
     )
 
 
-async def save_to_database(session: SessionDep, user_id: uuid.UUID, tale_title: str,
+async def create_story_audio(markup_text: str, language: str, chunk_store=None) -> Dict[str, Any]:
+    """Озвучка готовой разметки провайдером для языка сказки"""
+    if language == "РУС":
+        return await create_audio_russian(markup_text, chunk_store)
+    return await create_audio_european(markup_text, language, chunk_store)
+
+
+async def create_markup_and_audio(client: AsyncOpenAI, tale_text: str, language: str,
+                                  on_markup_done: Optional[Callable[[], None]] = None,
+                                  on_markup_ready: Optional[MarkupReadyCallback] = None,
+                                  chunk_store=None
+                                  ) -> tuple[str, Dict[str, Any]]:
+    """
+    Конвейер разметка → озвучка.
+    Разметка читается из LLM потоком, и каждый завершенный <p> блок сразу
+    передается TTS, поэтому озвучка первых абзацев идет параллельно
+    с разметкой остальных.
+    """
+    blocks: asyncio.Queue = asyncio.Queue()
+    splitter = SSMLParagraphSplitter()
+
+    def on_markup_delta(text: str) -> None:
+        for block in splitter.feed(text):
+            blocks.put_nowait(block)
+
+    async def markup() -> str:
+        try:
+            if language == "РУС":
+                with track_stage("markup", model=OPENAI_MODEL):
+                    markup_text = await create_markup_russian(client, tale_text, on_markup_delta)
+            else:
+                with track_stage("markup", model=OPENAI_MODEL_FOR_MARKUP):
+                    markup_text = await create_markup_european(client, tale_text, on_markup_delta)
+
+            for block in splitter.finish():
+                blocks.put_nowait(block)
+            if on_markup_done:
+                on_markup_done()
+            if on_markup_ready:
+                await on_markup_ready(markup_text)
+            return markup_text
+
+        except BaseException as e:
+            # Передаем ошибку озвучке, чтобы она не загрузила частичное аудио
+            blocks.put_nowait(e)
+            raise
+
+        finally:
+            blocks.put_nowait(None)
+
+    async def block_stream():
+        while True:
+            block = await blocks.get()
+            if block is None:
+                return
+            if isinstance(block, BaseException):
+                raise Exception(f"Разметка прервана: {block}")
+            yield block
+
+    markup_task = asyncio.create_task(markup())
+
+    try:
+        if language == "РУС":
+            print("Начинаем потоковую озвучку (Yandex)")
+            audio_data = await yandex_audio_maker.make_story_audio_from_blocks(block_stream(), chunk_store)
+        else:
+            config = EUROPEAN_VOICES.get(language, EUROPEAN_VOICES["default"])
+            print(f"Начинаем потоковую озвучку (Google Cloud - {language})")
+            audio_data = await google_audio_maker.make_story_audio_from_blocks(
+                block_stream(),
+                voice_name=config["voice_name"],
+                language_code=config["language_code"],
+                chunk_store=chunk_store
+            )
+
+        markup_text = await markup_task
+
+    except BaseException:
+        markup_task.cancel()
+        raise
+
+    return markup_text, audio_data
+
+
+def use_expressive_markup(expressive_markup: bool) -> bool:
+    """LLM разметка включается по запросу клиента или глобально через MARKUP_MODE"""
+    return expressive_markup or settings.markup_mode == "expressive"
+
+
+async def create_story_markup_and_audio(client: AsyncOpenAI, tale_text: str, language: str,
+                                        expressive_markup: bool = False,
+                                        on_markup_done: Optional[Callable[[], None]] = None,
+                                        on_markup_ready: Optional[MarkupReadyCallback] = None,
+                                        chunk_store=None
+                                        ) -> tuple[str, Dict[str, Any]]:
+    """
+    Разметка и озвучка сказки.
+    По умолчанию разметка строится локально по правилам за миллисекунды,
+    выразительная LLM разметка (конвейером с озвучкой) - только по запросу.
+    """
+    if use_expressive_markup(expressive_markup):
+        return await create_markup_and_audio(client, tale_text, language, on_markup_done,
+                                             on_markup_ready, chunk_store)
+
+    with track_stage("markup", model="rules"):
+        markup_text = build_ssml_markup(tale_text, language)
+    print(f"Разметка по правилам выполнена: {len(markup_text)} символов")
+    if on_markup_done:
+        on_markup_done()
+    if on_markup_ready:
+        await on_markup_ready(markup_text)
+
+    audio_data = await create_story_audio(markup_text, language, chunk_store)
+
+    return markup_text, audio_data
+
+
+async def save_to_database(user_id: uuid.UUID, tale_title: str,
                            tale_text: str, audio_data: Dict[str, Any], data: Questionnaire) -> Story:
-    """Сохранение данных в базу данных"""
+    """
+    Сохранение данных в базу данных.
+    Коллекция и сказка пишутся одной короткой транзакцией в собственной сессии:
+    соединение из пула берется только на время записи, а не на весь пайплайн
+    """
     print("Сохраняем данные в БД")
 
     # Создание коллекции
@@ -162,10 +360,6 @@ async def save_to_database(session: SessionDep, user_id: uuid.UUID, tale_title:
         total_Listening_time=audio_data["duration"]
     )
 
-    session.add(new_collection)
-    await session.commit()
-    await session.refresh(new_collection)
-
     # Создание истории
     new_story = Story(
         user_id=user_id,
@@ -181,83 +375,103 @@ async def save_to_database(session: SessionDep, user_id: uuid.UUID, tale_title:
         interests=data.subcategories
     )
 
-    session.add(new_story)
-    await session.commit()
-    await session.refresh(new_story)
+    async with new_session() as session:
+        session.add(new_collection)
+        await session.flush()
+        session.add(new_story)
+        await session.commit()
 
     return new_story
 
 
-@router.post("/generation-tale", response_model=StoryGenerationResponse)
-async def generate_tale_and_check_user(
-        session: SessionDep,
-        request: UserAccessRequest,
-        data: Questionnaire
-):
-    start_total_time = time.time()
-    user_id = request.user_id
-
-    # Проверяем получал-ли пользователь свой uuid, если нет то создаем его
-    if user_id is None:
-        new_user = User()
-        session.add(new_user)
-        await session.commit()
-        await session.refresh(new_user)
-        user_id = new_user.id
-
-    statement = select(User).where(User.id == user_id)
-    result = await session.execute(statement)
-    existing_user = result.scalars().first()
+# Этапы пайплайна и прогресс (0.0 - 1.0) на момент начала каждого этапа
+PIPELINE_STAGES = {
+    "generation": 0.0,
+    "expansion": 0.35,
+    "markup": 0.45,
+    "audio": 0.6,
+    "saving": 0.95,
+}
+
+
+async def get_or_create_user(user_id: uuid.UUID | None) -> uuid.UUID:
+    """
+    Проверяем получал-ли пользователь свой uuid, если нет то создаем его.
+    Сессия закрывается сразу после проверки, чтобы соединение не удерживалось
+    на время генерации
+    """
+    async with new_session() as session:
+        if user_id is None:
+            new_user = User()
+            session.add(new_user)
+            await session.commit()
+            return new_user.id
+
+        statement = select(User.id).where(User.id == user_id)
+        result = await session.execute(statement)
+        existing_user = result.scalars().first()
 
     if not existing_user:
         raise HTTPException(
             status_code=404,
-            detail=f"User with ID {request.user_id} not found"
+            detail=f"User with ID {user_id} not found"
         )
 
-    try:
-        client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-
-        # Этап 1: Генерация сказки (последовательно, так как зависят друг от друга)
-        start_time = time.time()
-        answer_after_generation = await generate_tale_content(client, data)
-        tale_text = answer_after_generation['tale_text']
-
-        # Расширение при необходимости
-        if len(tale_text) <= answer_after_generation['awg']:
-            tale_text = await expand_tale_if_needed(client, tale_text, answer_after_generation['awg'])
-
-        tale_title = " ".join(tale_text.split()[:2]) + "..."
-        print(f"Генерация сказки завершена: {time.time() - start_time:.1f} сек")
-        print(f"Длина сказки: {len(tale_text)} символов")
-
-        # Этап 2: Параллельная обработка разметки и подготовка к озвучке
-        start_time = time.time()
-
-        if data.language == "РУС":
-            # Для русского: разметка → озвучка
-            markup_text = await create_markup_russian(client, tale_text)
-            print(f"Разметка выполнена: {time.time() - start_time:.1f} сек")
-
-            start_audio_time = time.time()
-            audio_data = await create_audio_russian(markup_text)
-            print(f"Озвучка завершена: {time.time() - start_audio_time:.1f} сек")
+    return user_id
+
+
+async def run_generation_pipeline(
+        user_id: uuid.UUID,
+        data: Questionnaire,
+        on_stage: Optional[StageCallback] = None,
+        on_tale_delta: Optional[TaleDeltaCallback] = None,
+        cache_policy: Optional[str] = None,
+        generation_key: Optional[str] = None
+) -> StoryGenerationResponse:
+    """
+    Полный пайплайн: генерация → расширение → разметка → озвучка → сохранение.
+    Результаты этапов сохраняются под generation_key, поэтому повтор упавшей
+    генерации с тем же ключом продолжает с первого незавершенного этапа
+    """
+    with track_pipeline(
+            "generation-tale",
+            language=data.language.value,
+            provider=get_provider(data.language),
+            model=OPENAI_MODEL,
+            story_duration_minutes=data.story_duration_minutes
+    ):
+        async with asyncio.timeout(settings.story_generation_timeout):
+            return await _run_generation_pipeline(user_id, data, on_stage, on_tale_delta,
+                                                  cache_policy, generation_key)
+
+
+async def _run_generation_pipeline(
+        user_id: uuid.UUID,
+        data: Questionnaire,
+        on_stage: Optional[StageCallback],
+        on_tale_delta: Optional[TaleDeltaCallback],
+        cache_policy: Optional[str],
+        generation_key: Optional[str]
+) -> StoryGenerationResponse:
+    start_total_time = time.time()
 
-        else:
-            # Для европейских языков: разметка → озвучка
-            markup_text = await create_markup_european(client, tale_text)
-            print(f"Разметка выполнена: {time.time() - start_time:.1f} сек")
+    def report(stage: str) -> None:
+        if on_stage:
+            on_stage(stage, PIPELINE_STAGES[stage])
 
-            start_audio_time = time.time()
-            audio_data = await create_audio_european(markup_text, data.language)
-            print(f"Озвучка завершена: {time.time() - start_audio_time:.1f} сек")
+    # Готовая сказка по такой же анкете пропускает все обращения к провайдерам
+    cache_policy = cache_policy or settings.tale_cache_default_policy
+    cached_tale = tale_cache.get(data) if cache_policy == "reuse" else None
 
-        # Этап 3: Сохранение в базу данных
-        start_db_time = time.time()
-        new_story = await save_to_database(session, user_id, tale_title, tale_text, audio_data, data)
-        print(f"Сохранение в БД завершено: {time.time() - start_db_time:.1f} сек")
+    if cached_tale:
+        print("Сказка найдена в кэше, генерация и озвучка пропущены")
+        if on_tale_delta:
+            on_tale_delta(cached_tale.tale_text)
 
-        print(f"Общее время выполнения: {time.time() - start_total_time:.1f} сек")
+        report("saving")
+        with track_stage("db_save"):
+            new_story = await save_to_database(user_id, cached_tale.title, cached_tale.tale_text,
+                                               cached_tale.to_audio_data(), data)
 
         return StoryGenerationResponse(
             user_id=user_id,
@@ -267,6 +481,208 @@ async def generate_tale_and_check_user(
             url=new_story.audio_url
         )
 
+    client = get_openai_client()
+    checkpoint = await generation_checkpoints.start(user_id, generation_key)
+
+    # Этап 1: Генерация сказки (последовательно, так как зависят друг от друга)
+    start_time = time.time()
+    if not stage_reached(checkpoint, "generated"):
+        report("generation")
+        with track_stage("generation"):
+            answer_after_generation = await generate_tale_content(client, data, on_tale_delta)
+        await generation_checkpoints.update(
+            checkpoint,
+            stage="generated",
+            tale_text=answer_after_generation['tale_text'],
+            target_length=answer_after_generation['awg']
+        )
+    elif on_tale_delta:
+        on_tale_delta(checkpoint.tale_text)
+
+    # Расширение при необходимости
+    if not stage_reached(checkpoint, "expanded"):
+        tale_text = checkpoint.tale_text
+        if len(tale_text) <= checkpoint.target_length:
+            report("expansion")
+            with track_stage("expansion"):
+                tale_text = await expand_tale_if_needed(client, tale_text, checkpoint.target_length,
+                                                        on_tale_delta)
+        await generation_checkpoints.update(checkpoint, stage="expanded", tale_text=tale_text)
+
+    tale_text = checkpoint.tale_text
+    tale_title = " ".join(tale_text.split()[:2]) + "..."
+    print(f"Генерация сказки завершена: {time.time() - start_time:.1f} сек")
+    print(f"Длина сказки: {len(tale_text)} символов")
+
+    # Этап 2: Разметка и озвучка
+    start_time = time.time()
+    chunk_store = generation_checkpoints.chunk_store(checkpoint)
+
+    async def save_markup(markup_text: str) -> None:
+        await generation_checkpoints.update(checkpoint, stage="marked_up", markup_text=markup_text)
+
+    if not stage_reached(checkpoint, "marked_up"):
+        report("markup")
+        markup_text, audio_data = await create_story_markup_and_audio(
+            client, tale_text, data.language, data.expressive_markup,
+            on_markup_done=lambda: report("audio"),
+            on_markup_ready=save_markup,
+            chunk_store=chunk_store
+        )
+        await generation_checkpoints.update(
+            checkpoint, stage="voiced", audio_url=audio_data["url"], duration_seconds=audio_data["duration"]
+        )
+    elif not stage_reached(checkpoint, "voiced"):
+        # Разметка уже есть, озвучиваем только чанки, которых нет в сохраненном прогрессе
+        report("audio")
+        markup_text = checkpoint.markup_text
+        audio_data = await create_story_audio(markup_text, data.language, chunk_store)
+        await generation_checkpoints.update(
+            checkpoint, stage="voiced", audio_url=audio_data["url"], duration_seconds=audio_data["duration"]
+        )
+    else:
+        markup_text = checkpoint.markup_text
+        audio_data = {
+            "url": checkpoint.audio_url,
+            "duration": checkpoint.duration_seconds,
+            "service": "checkpoint"
+        }
+    print(f"Разметка и озвучка завершены: {time.time() - start_time:.1f} сек")
+
+    tale_cache.put(data, CachedTale(
+        title=tale_title,
+        tale_text=tale_text,
+        markup_text=markup_text,
+        audio_url=audio_data["url"],
+        duration=audio_data["duration"]
+    ))
+
+    # Этап 3: Сохранение в базу данных
+    report("saving")
+    start_db_time = time.time()
+    with track_stage("db_save"):
+        new_story = await save_to_database(user_id, tale_title, tale_text, audio_data, data)
+    print(f"Сохранение в БД завершено: {time.time() - start_db_time:.1f} сек")
+
+    await generation_checkpoints.complete(checkpoint)
+
+    print(f"Общее время выполнения: {time.time() - start_total_time:.1f} сек")
+
+    return StoryGenerationResponse(
+        user_id=user_id,
+        created_at=new_story.created_at,
+        title=new_story.title,
+        content=new_story.content_story,
+        url=new_story.audio_url
+    )
+
+
+def job_to_response(job: GenerationJob) -> GenerationJobResponse:
+    return GenerationJobResponse(
+        job_id=job.id,
+        status=job.status.value,
+        stage=job.stage,
+        progress=job.progress,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+        result=job.result,
+        error=job.error
+    )
+
+
+def get_coalescing_key(http_request: Request, user_id: Optional[uuid.UUID], data: Questionnaire,
+                       idempotency_key: Optional[str]) -> Optional[str]:
+    """
+    Ключ объединения одинаковых запросов: клиент и его Idempotency-Key,
+    а без него - пользователь и хеш анкеты.
+    Idempotency-Key выбирает клиент, поэтому он всегда дополняется пользователем (или IP):
+    иначе чужой запрос с тем же ключом получил бы результат чужой генерации.
+    Новому пользователю без Idempotency-Key присоединяться не к чему - ключа нет
+    """
+    if idempotency_key:
+        return f"idempotency:{get_client_key(http_request, user_id)}:{idempotency_key}"
+    if user_id is None:
+        return None
+    return f"questionnaire:{user_id}:{questionnaire_cache_key(data)}"
+
+
+def generation_pipeline(request: UserAccessRequest, data: Questionnaire, generation_key: Optional[str],
+                        stream_tale: bool = False) -> Callable[[InFlightCall], Awaitable[StoryGenerationResponse]]:
+    """
+    Пайплайн для generation_single_flight. Этапы (и при stream_tale - фрагменты текста)
+    публикуются событиями вызова, их получают все присоединившиеся запросы и задачи
+    """
+    async def pipeline(call: InFlightCall) -> StoryGenerationResponse:
+        # Новый пользователь создается только после допуска
+        user_id = request.user_id or await get_or_create_user(None)
+        return await run_generation_pipeline(
+            user_id,
+            data,
+            on_stage=lambda stage, progress: call.publish("stage", {"stage": stage, "progress": progress}),
+            on_tale_delta=(lambda text: call.publish("tale", {"text": text})) if stream_tale else None,
+            cache_policy=request.cache_policy,
+            generation_key=generation_key
+        )
+
+    return pipeline
+
+
+def start_or_join_generation(http_request: Request, request: UserAccessRequest, data: Questionnaire,
+                             generation_key: Optional[str], stream_tale: bool = False) -> InFlightCall:
+    """
+    Присоединяет запрос к уже идущей генерации с тем же ключом или запускает новую.
+
+    Присоединившийся запрос не проходит допуск: он не занимает место под генерацию
+    и не тратит токен лимита частоты. Запустивший запрос занимает место до конца
+    пайплайна, даже если сам отключится раньше других ожидающих.
+    Между проверкой и запуском нет await, поэтому одинаковые запросы не запустят
+    два пайплайна
+    """
+    pipeline = generation_pipeline(request, data, generation_key, stream_tale)
+
+    if generation_single_flight.get(generation_key) is not None:
+        return generation_single_flight.start(generation_key, pipeline)
+
+    client_key = get_client_key(http_request, request.user_id)
+    generation_admission.acquire(client_key)
+
+    call = generation_single_flight.start(generation_key, pipeline)
+    call.task.add_done_callback(lambda _: generation_admission.release(client_key))
+    return call
+
+
+@router.post("/generation-tale", response_model=StoryGenerationResponse)
+async def generate_tale_and_check_user(
+        http_request: Request,
+        request: UserAccessRequest,
+        data: Questionnaire,
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    try:
+        if request.user_id is not None:
+            # Только проверка, что пользователь существует
+            await get_or_create_user(request.user_id)
+        generation_key = get_coalescing_key(http_request, request.user_id, data, idempotency_key)
+
+        # Повторные и одновременные одинаковые запросы присоединяются к уже идущей генерации,
+        # остальные проходят допуск до обращения к провайдерам
+        call = start_or_join_generation(http_request, request, data, generation_key)
+        return await generation_single_flight.wait(call, is_disconnected=http_request.is_disconnected)
+
+    except AdmissionRejected as e:
+        raise e.to_http_exception()
+    except HTTPException:
+        raise
+    except ClientDisconnected:
+        raise HTTPException(
+            status_code=499,
+            detail="Client closed request"
+        )
+    except TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail=f"Генерация сказки не завершилась за {settings.story_generation_timeout} сек"
+        )
     except json.JSONDecodeError as e:
         raise HTTPException(
             status_code=500,
@@ -277,3 +693,151 @@ async def generate_tale_and_check_user(
             status_code=500,
             detail=f"Ошибка генерации сказки: {str(e)}"
         )
+
+
+@router.post("/generation-tale/jobs", response_model=GenerationJobResponse, status_code=202)
+async def submit_generation_job(
+        http_request: Request,
+        response: Response,
+        request: UserAccessRequest,
+        data: Questionnaire,
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """
+    Ставит генерацию сказки в фоновую очередь и сразу возвращает id задачи.
+    Статус и результат доступны через GET /jobs/{job_id}.
+    Одинаковый запрос, пока задача выполняется, получает id той же задачи.
+    Новая задача проходит лимит частоты и лимиты очереди (429/503 с Retry-After)
+    """
+    if request.user_id is not None:
+        # Только проверка, что пользователь существует
+        await get_or_create_user(request.user_id)
+    generation_key = get_coalescing_key(http_request, request.user_id, data, idempotency_key)
+
+    async def pipeline(on_stage: StageCallback) -> StoryGenerationResponse:
+        # Та же генерация, запущенная синхронным или потоковым запросом, не запускается второй раз
+        call = generation_single_flight.start(generation_key, generation_pipeline(request, data, generation_key))
+
+        def on_event(event: str, payload: dict) -> None:
+            if event == "stage":
+                on_stage(payload["stage"], payload["progress"])
+
+        call.subscribe(on_event)
+        try:
+            return await generation_single_flight.wait(call)
+        finally:
+            call.unsubscribe(on_event)
+
+    job = generation_job_manager.get_active(generation_key)
+    if job is None and generation_single_flight.get(generation_key) is not None:
+        # Генерация уже идет - задача только ждет ее результат, без лимитов и очереди
+        job = generation_job_manager.submit(pipeline, key=generation_key, queued=False)
+    elif job is None:
+        client_key = get_client_key(http_request, request.user_id)
+        try:
+            generation_job_manager.check_capacity(client_key)
+            generation_admission.take_token(client_key)
+        except AdmissionRejected as e:
+            raise e.to_http_exception()
+
+        job = generation_job_manager.submit(pipeline, key=generation_key, client_key=client_key)
+
+    response.headers["Location"] = f"/jobs/{job.id}"
+
+    return job_to_response(job)
+
+
+@router.get("/jobs/{job_id}", response_model=GenerationJobResponse)
+async def get_generation_job(job_id: uuid.UUID):
+    job = generation_job_manager.get(job_id)
+
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Job with ID {job_id} not found"
+        )
+
+    return job_to_response(job)
+
+
+@router.post("/generation-tale/stream")
+async def stream_tale_generation(
+        http_request: Request,
+        request: UserAccessRequest,
+        data: Questionnaire,
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """
+    Потоковая генерация сказки через Server-Sent Events.
+
+    События:
+    - stage: {"stage", "progress"} - начало очередного этапа пайплайна.
+      На этапе "expansion" текст сказки генерируется заново, клиент должен сбросить уже полученный текст
+    - tale: {"text"} - очередной фрагмент текста сказки
+    - result: StoryGenerationResponse - итог после озвучки и сохранения
+    - error: {"detail"} - ошибка генерации
+
+    Запрос с тем же ключом, что у уже идущей генерации, присоединяется к ней и получает
+    все ее события с начала. Если генерацию запустил синхронный запрос или фоновая задача,
+    фрагментов текста не будет - только этапы и результат
+    """
+    try:
+        if request.user_id is not None:
+            # Только проверка, что пользователь существует
+            await get_or_create_user(request.user_id)
+        generation_key = get_coalescing_key(http_request, request.user_id, data, idempotency_key)
+        call = start_or_join_generation(http_request, request, data, generation_key, stream_tale=True)
+    except AdmissionRejected as e:
+        raise e.to_http_exception()
+
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_event(event: str, payload: dict) -> None:
+        events.put_nowait((event, payload))
+
+    generation_single_flight.join(call)
+    call.subscribe(on_event)
+    call.task.add_done_callback(lambda _: events.put_nowait(None))
+
+    left = False
+
+    async def leave_generation() -> None:
+        """
+        Отключает клиента от генерации один раз. Вызывается и из генератора событий,
+        и фоновой задачей ответа: если клиент отключился до первой отправки, Starlette
+        может так и не начать итерацию генератора, и его finally не выполнится.
+        Генерация отменяется, когда отключился последний ожидающий клиент,
+        место под нее освобождается по завершении пайплайна
+        """
+        nonlocal left
+        if not left:
+            left = True
+            call.unsubscribe(on_event)
+            generation_single_flight.leave(call)
+
+    async def event_stream():
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield format_sse_event(*event)
+
+            try:
+                result = call.task.result()
+                yield format_sse_event("result", result.model_dump(mode="json"))
+            except (Exception, asyncio.CancelledError) as e:
+                yield format_sse_event("error", {"detail": f"Ошибка генерации сказки: {str(e)}"})
+
+        finally:
+            await leave_generation()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        },
+        background=BackgroundTask(leave_generation)
+    )
@@ -1,10 +1,13 @@
-from fastapi import APIRouter
-from sqlmodel import select, desc
+from typing import Optional
+
+from fastapi import APIRouter, Query
+from sqlmodel import select
 
 from app.database import SessionDep
-from app.models import Collection, Story
+from app.models import COLLECTION_PREVIEW_COLUMNS, STORY_PREVIEW_COLUMNS, Collection, Story
 from app.schemas import MainResponseSchema, CollectionPreviewResponseSchema, StoryPreviewResponseSchema
 from app.services.conversion_time import seconds_to_hms, seconds_to_minutes
+from app.services.pagination import InvalidCursor, keyset_page, page_size, split_page
 
 router = APIRouter()
 
@@ -12,6 +15,9 @@ router = APIRouter()
 async def get_home_data(
         user_id: str | None,
         session: SessionDep,
+        tales_cursor: Optional[str] = Query(None, description="next_tales_cursor предыдущей страницы"),
+        collections_cursor: Optional[str] = Query(None, description="next_collections_cursor предыдущей страницы"),
+        limit: Optional[int] = Query(None, ge=1, description="Размер страницы, не больше page_size_max"),
 ):
 
     if not user_id or user_id in ["null", "undefined", "anonymous"]:
@@ -20,15 +26,25 @@ async def get_home_data(
             collections=[]
         )
 
-    stmt_for_collection = select(Collection).where(Collection.user_id==user_id).order_by(
-        desc(Collection.created_at))
+    limit = page_size(limit)
+    try:
+        stmt_for_collection = keyset_page(
+            select(*COLLECTION_PREVIEW_COLUMNS).where(Collection.user_id == user_id),
+            Collection.created_at, Collection.id, collections_cursor, limit
+        )
+        stmt_for_stories = keyset_page(
+            select(*STORY_PREVIEW_COLUMNS).where(Story.user_id == user_id),
+            Story.created_at, Story.id, tales_cursor, limit
+        )
+    except InvalidCursor as e:
+        raise e.to_http_exception()
+
+    # Строки-кортежи только с колонками превью, ORM объекты не создаются
     result_collection = await session.execute(stmt_for_collection)
-    home_collections = result_collection.scalars().all()
+    home_collections, next_collections_cursor = split_page(result_collection.all(), limit)
 
-    stmt_for_stories = select(Story).where(Story.user_id == user_id).order_by(
-        desc(Story.created_at))
     result_stories = await session.execute(stmt_for_stories)
-    home_stories = result_stories.scalars().all()
+    home_stories, next_tales_cursor = split_page(result_stories.all(), limit)
 
     recent_collections = [
         CollectionPreviewResponseSchema(
@@ -54,5 +70,7 @@ async def get_home_data(
 
     return MainResponseSchema(
         recent_tales=recent_stories,
-        collections=recent_collections
+        collections=recent_collections,
+        next_tales_cursor=next_tales_cursor,
+        next_collections_cursor=next_collections_cursor
     )
\ No newline at end of file
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.auth_utils import verify_swagger_credentials
+from app.config import settings
+from app.services.metrics import registry
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(
+        authenticated_admin: str = Depends(verify_swagger_credentials)
+):
+    """
+    Метрики пайплайна генерации в текстовом формате Prometheus.
+    Как и /service_stats, доступны только с учетными данными документации
+    (в Prometheus - basic_auth в scrape_config)
+    """
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
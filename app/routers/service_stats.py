@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends
+
+from app.auth_utils import verify_swagger_credentials
+from app.database import get_pool_stats
+from app.routers.generation import yandex_audio_maker
+from app.services.admission import generation_admission
+from app.services.audio_encoding import audio_encoder
+from app.services.blocking_io import blocking_io
+from app.services.generation_jobs import generation_job_manager
+from app.services.openai_client import openai_client_manager
+from app.services.single_flight import generation_single_flight
+from app.services.storage import s3_storage
+from app.services.tale_cache import tale_cache
+from app.services.tts_cache import tts_chunk_cache
+
+router = APIRouter()
+
+
+@router.get("/service_stats", include_in_schema=False)
+async def get_service_stats(
+        authenticated_admin: str = Depends(verify_swagger_credentials)
+):
+    """Состояние пулов соединений к внешним сервисам"""
+    return {
+        "openai": openai_client_manager.get_stats(),
+        "database_pool": get_pool_stats(),
+        "yandex_speechkit": yandex_audio_maker.get_stats(),
+        "tale_cache": tale_cache.get_stats(),
+        "generation_single_flight": generation_single_flight.get_stats(),
+        "generation_admission": generation_admission.get_stats(),
+        "generation_jobs": generation_job_manager.get_stats(),
+        "blocking_io": blocking_io.get_stats(),
+        "audio_encoder": audio_encoder.get_stats(),
+        "s3_storage": s3_storage.get_stats(),
+        "tts_chunk_cache": tts_chunk_cache.get_stats(),
+        "accessed_by": authenticated_admin,
+        "access_time": datetime.now().isoformat()
+    }
@@ -113,6 +113,11 @@ class Questionnaire(BaseModel):
         description="Пол ребёнка"
     )
 
+    expressive_markup: bool = Field(
+        False,
+        description="Выразительная разметка через LLM (дольше), по умолчанию разметка по правилам"
+    )
+
 
     @validator('subcategories', always=True)
     def validate_subcategories(cls, subcategory_values, values):
@@ -222,6 +227,8 @@ class UserCollectionsResponseSchema(BaseModel):
 # Request/Response models
 class UserAccessRequest(BaseModel):
     user_id: Optional[uuid.UUID] = None
+    # "reuse" - можно получить готовую сказку из кэша, "fresh" - всегда новая генерация
+    cache_policy: Optional[Literal["reuse", "fresh"]] = None
 
 class StoryGenerationResponse(BaseModel):
     user_id: uuid.UUID
@@ -230,6 +237,17 @@ class StoryGenerationResponse(BaseModel):
     content: str
     url: str
 
+# Схема статуса фоновой генерации сказки
+class GenerationJobResponse(BaseModel):
+    job_id: uuid.UUID
+    status: Literal["pending", "running", "completed", "failed"]
+    stage: Optional[str] = None
+    progress: float = Field(0.0, ge=0.0, le=1.0)
+    created_at: datetime
+    updated_at: datetime
+    result: Optional[StoryGenerationResponse] = None
+    error: Optional[str] = None
+
 # Схема данных коллекций пользователя для превью
 class CollectionPreviewResponseSchema(BaseModel):
     id: uuid.UUID
@@ -250,11 +268,15 @@ class StoryPreviewResponseSchema(BaseModel):
 class MainResponseSchema(BaseModel):
     recent_tales: list[StoryPreviewResponseSchema]
     collections: list[CollectionPreviewResponseSchema]
+    # Курсоры следующих страниц (None - страниц больше нет), сказки и коллекции листаются независимо
+    next_tales_cursor: Optional[str] = None
+    next_collections_cursor: Optional[str] = None
 
 # Схема данных для детального просмотра коллекции
 class CollectionDetailsSchema(BaseModel):
     title: str
     stories: list[StoryPreviewResponseSchema]
+    next_cursor: Optional[str] = None  # Курсор следующей страницы сказок
 
 # Схема данных для экрана сказки
 class FairyTailsResponseSchema(BaseModel):
@@ -300,6 +322,11 @@ class FollowUpQuestionnaire(BaseModel):
         description="Длительность сказки в минутах (не более 60)"
     )
 
+    expressive_markup: bool = Field(
+        False,
+        description="Выразительная разметка через LLM (дольше), по умолчанию разметка по правилам"
+    )
+
 class AudioStoryResponse(BaseModel):
     id: uuid.UUID
     title: str
@@ -0,0 +1,158 @@
+import math
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from cachetools import TTLCache
+from fastapi import HTTPException, Request
+
+from app.config import settings
+
+
+class AdmissionRejected(Exception):
+    """Запрос не допущен к генерации: превышен лимит частоты или параллельности"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    def to_http_exception(self) -> HTTPException:
+        return HTTPException(
+            status_code=self.status_code,
+            detail=self.detail,
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+
+class TokenBucket:
+    """Корзина токенов: capacity запросов подряд, затем refill_per_second запросов в секунду"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        """Сколько секунд ждать следующего токена (0 - токен есть)"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.refill_per_second
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+def get_client_key(http_request: Request, user_id: Optional[uuid.UUID] = None) -> str:
+    """Лимиты считаются по пользователю, а для новых пользователей - по IP"""
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"ip:{http_request.client.host if http_request.client else 'unknown'}"
+
+
+class AdmissionController:
+    """
+    Допуск запросов к генерации сказок.
+
+    Каждый пайплайн держит соединения к OpenAI и TTS по несколько минут,
+    поэтому лишние запросы отклоняются сразу, а не встают в общую очередь:
+    - 429, если клиент исчерпал лимит запросов в минуту или уже запустил
+      max_concurrent_per_user генераций;
+    - 503, если во всем сервисе уже выполняется max_concurrent_total генераций.
+    Ответ содержит Retry-After.
+    """
+
+    def __init__(self, requests_per_minute: int, max_concurrent_per_user: int,
+                 max_concurrent_total: int, retry_after_seconds: int):
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrent_per_user = max_concurrent_per_user
+        self.max_concurrent_total = max_concurrent_total
+        self.retry_after_seconds = retry_after_seconds
+
+        # Корзины неактивных клиентов сами удаляются через 10 минут
+        self.buckets: TTLCache = TTLCache(maxsize=100_000, ttl=600)
+        self.active: Dict[str, int] = {}
+        self.active_total = 0
+        self.rejected_total = {"rate_limit": 0, "user_concurrency": 0, "global_concurrency": 0}
+
+    def _get_bucket(self, client_key: str) -> TokenBucket:
+        bucket = self.buckets.get(client_key)
+        if bucket is None:
+            bucket = TokenBucket(self.requests_per_minute, self.requests_per_minute / 60)
+        # Повторная запись продлевает срок жизни корзины
+        self.buckets[client_key] = bucket
+        return bucket
+
+    def acquire(self, client_key: str) -> None:
+        """Занимает место под генерацию или бросает AdmissionRejected"""
+        if self.active_total >= self.max_concurrent_total:
+            self.rejected_total["global_concurrency"] += 1
+            raise AdmissionRejected(
+                503,
+                "Сервис перегружен, попробуйте позже",
+                self.retry_after_seconds
+            )
+
+        if self.active.get(client_key, 0) >= self.max_concurrent_per_user:
+            self.rejected_total["user_concurrency"] += 1
+            raise AdmissionRejected(
+                429,
+                "Предыдущая генерация сказки еще не завершена",
+                self.retry_after_seconds
+            )
+
+        self.take_token(client_key)
+        self.active[client_key] = self.active.get(client_key, 0) + 1
+        self.active_total += 1
+
+    def take_token(self, client_key: str) -> None:
+        """Только лимит частоты - для запросов, которые не занимают место сразу (фоновые задачи)"""
+        bucket = self._get_bucket(client_key)
+        wait_time = bucket.wait_time()
+        if wait_time > 0:
+            self.rejected_total["rate_limit"] += 1
+            raise AdmissionRejected(
+                429,
+                "Слишком много запросов на генерацию, попробуйте позже",
+                wait_time
+            )
+        bucket.take()
+
+    def release(self, client_key: str) -> None:
+        self.active_total -= 1
+        self.active[client_key] -= 1
+        if self.active[client_key] == 0:
+            del self.active[client_key]
+
+    @contextmanager
+    def admit(self, client_key: str) -> Iterator[None]:
+        self.acquire(client_key)
+        try:
+            yield
+        finally:
+            self.release(client_key)
+
+    def get_stats(self) -> dict:
+        return {
+            "active_total": self.active_total,
+            "max_concurrent_total": self.max_concurrent_total,
+            "active_clients": len(self.active),
+            "rejected_total": dict(self.rejected_total),
+        }
+
+
+generation_admission = AdmissionController(
+    requests_per_minute=settings.rate_limit_requests_per_minute,
+    max_concurrent_per_user=settings.generation_max_concurrent_per_user,
+    max_concurrent_total=settings.generation_max_concurrent_total,
+    retry_after_seconds=settings.generation_retry_after_seconds
+)
@@ -0,0 +1,83 @@
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from app.config import settings
+
+
+def encode_wav_to_mp3(wav_data: bytes, bitrate: str) -> bytes:
+    """
+    Кодирует WAV (LINEAR16) в моно MP3. Выполняется в отдельном процессе,
+    поэтому pydub импортируется здесь, а не при загрузке модуля
+    """
+    from pydub import AudioSegment
+
+    segment = AudioSegment.from_wav(io.BytesIO(wav_data)).set_channels(1)
+    output = io.BytesIO()
+    segment.export(output, format="mp3", bitrate=bitrate)
+    return output.getvalue()
+
+
+class AudioEncoder:
+    """
+    Пул процессов для сжатия аудио Google Cloud TTS.
+
+    Google возвращает несжатый LINEAR16, который примерно в 10 раз больше MP3
+    с битрейтом для речи. Кодирование нагружает CPU, поэтому выполняется
+    в отдельных процессах (ffmpeg через pydub), а не в event loop и не в потоках
+    под GIL. Процессы запускаются через spawn: fork процесса с работающим
+    event loop и пулами потоков небезопасен.
+    """
+
+    def __init__(self, max_workers: int, bitrate: str):
+        self.max_workers = max_workers
+        self.bitrate = bitrate
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.encoded_total = 0
+        self.encoding_in_flight = 0
+        self.input_bytes_total = 0
+        self.output_bytes_total = 0
+
+    def start(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def encode_mp3(self, wav_data: bytes) -> bytes:
+        loop = asyncio.get_running_loop()
+        self.encoding_in_flight += 1
+        try:
+            mp3_data = await loop.run_in_executor(self.start(), encode_wav_to_mp3, wav_data, self.bitrate)
+        finally:
+            self.encoding_in_flight -= 1
+
+        self.encoded_total += 1
+        self.input_bytes_total += len(wav_data)
+        self.output_bytes_total += len(mp3_data)
+        return mp3_data
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+    def get_stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "bitrate": self.bitrate,
+            "encoded_total": self.encoded_total,
+            "encoding_in_flight": self.encoding_in_flight,
+            "compression_ratio": round(self.input_bytes_total / self.output_bytes_total, 2)
+            if self.output_bytes_total else None,
+        }
+
+
+audio_encoder = AudioEncoder(
+    max_workers=settings.audio_encoding_max_workers,
+    bitrate=settings.google_tts_mp3_bitrate
+)
@@ -1,21 +1,205 @@
+import asyncio
 import json
+import inspect
 import io
-import re
 import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
 
-import boto3
 import aiohttp
 import wave
 
 from app.config import settings
+from app.services import mp3
+from app.services.audio_encoding import audio_encoder
+from app.services.blocking_io import run_blocking
+from app.services.metrics import record_tts_characters, track_stage
+from app.services.ssml_segmenter import SSMLSegmenter, remove_outer_speak_tags, split_ssml
+from app.services.storage import s3_storage
+from app.services.streaming_upload import StreamingMp3Upload
+from app.services.tts_cache import tts_cache_key, tts_chunk_cache
 from datetime import datetime
 from dotenv import load_dotenv
 from google.cloud import texttospeech_v1 as texttospeech, storage
 from google.oauth2 import service_account
-from mutagen.mp3 import MP3
 
 load_dotenv()
 
+
+async def pack_p_blocks(p_blocks: AsyncIterator[str], max_chunk_size: int) -> AsyncIterator[str]:
+    """
+    Потоковый вариант split_by_p_tags: собирает приходящие <p> блоки в чанки
+    и отдает каждый чанк, как только следующий блок в него уже не помещается
+    """
+    segmenter = SSMLSegmenter(max_chunk_size)
+
+    async for p_block in p_blocks:
+        for chunk in segmenter.add(p_block):
+            yield chunk
+
+    last_chunk = segmenter.finish()
+    if last_chunk:
+        yield last_chunk
+
+
+async def synthesize_with_retry(synthesize: Callable[[str], Awaitable[tuple[bytes, float]]],
+                                ssml_chunk: str, index: int) -> tuple[bytes, float]:
+    """Озвучка одного чанка с повторами при ошибке (экспоненциальная задержка)"""
+    attempts = settings.tts_chunk_max_retries + 1
+
+    for attempt in range(1, attempts + 1):
+        try:
+            return await synthesize(ssml_chunk)
+        except Exception as e:
+            if attempt == attempts:
+                raise Exception(f"Ошибка при озвучке чанка {index}: {e}")
+
+            delay = settings.tts_chunk_retry_delay * 2 ** (attempt - 1)
+            print(f"Ошибка при озвучке чанка {index} (попытка {attempt}/{attempts}): {e}. "
+                  f"Повтор через {delay:.1f} сек")
+            await asyncio.sleep(delay)
+
+
+# Получатель аудио чанков в порядке следования (например, StreamingMp3Upload.add_chunk).
+# Может быть асинхронным: пока он не принял чанк, место в окне озвучки не освобождается
+ChunkSink = Callable[[bytes], Any]
+
+
+async def deliver_chunk(on_chunk: ChunkSink, audio_data: bytes) -> None:
+    result = on_chunk(audio_data)
+    if inspect.isawaitable(result):
+        await result
+
+
+async def write_chunks_in_order(tasks: list[asyncio.Task], window: asyncio.Semaphore,
+                                on_chunk: ChunkSink) -> float:
+    """
+    Передает аудио чанков получателю строго по порядку и возвращает общую длительность.
+    Место в окне освобождается только после передачи чанка, поэтому в памяти
+    одновременно не больше размера окна озвученных чанков. При ошибке остальные отменяются
+    """
+    total_duration = 0.0
+
+    try:
+        for task in tasks:
+            audio_data, duration = await task
+            await deliver_chunk(on_chunk, audio_data)
+            total_duration += duration
+            window.release()
+
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return total_duration
+
+
+async def synthesize_chunks(ssml_chunks: list[str],
+                            synthesize: Callable[[str], Awaitable[tuple[bytes, float]]],
+                            max_concurrency: int, on_chunk: ChunkSink) -> float:
+    """
+    Параллельная озвучка чанков: одновременно не больше max_concurrency чанков,
+    аудио передается в on_chunk в исходном порядке. Возвращает общую длительность
+    """
+    window = asyncio.Semaphore(max_concurrency)
+
+    async def synthesize_one(index: int, ssml_chunk: str) -> tuple[bytes, float]:
+        await window.acquire()
+        print(f"Озвучиваем чанк {index}/{len(ssml_chunks)} ({len(ssml_chunk)} символов)")
+        audio_data, duration = await synthesize_with_retry(synthesize, ssml_chunk, index)
+        print(f"  Длительность чанка {index}: {duration:.2f} секунд")
+        return audio_data, duration
+
+    tasks = [asyncio.create_task(synthesize_one(i + 1, chunk)) for i, chunk in enumerate(ssml_chunks)]
+    return await write_chunks_in_order(tasks, window, on_chunk)
+
+
+async def synthesize_chunk_queue(chunk_queue: asyncio.Queue,
+                                 synthesize: Callable[[str], Awaitable[tuple[bytes, float]]],
+                                 max_concurrency: int, on_chunk: ChunkSink) -> float:
+    """
+    TTS воркер: озвучивает чанки из очереди по мере их поступления,
+    не больше max_concurrency одновременно, и передает аудио в on_chunk в порядке чанков.
+    None в очереди означает, что чанков больше не будет.
+    """
+    window = asyncio.Semaphore(max_concurrency)
+
+    async def synthesize_one(index: int, chunk: str) -> tuple[bytes, float]:
+        await window.acquire()
+        print(f"Озвучиваем чанк {index} ({len(chunk)} символов)")
+        audio_data, duration = await synthesize_with_retry(synthesize, f"<speak>{chunk}</speak>", index)
+        print(f"  Длительность чанка {index}: {duration:.2f} секунд")
+        return audio_data, duration
+
+    tasks = []
+    try:
+        while True:
+            chunk = await chunk_queue.get()
+            if chunk is None:
+                break
+
+            # Если какой-то чанк уже окончательно не озвучился, дальше не продолжаем
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception():
+                    raise task.exception()
+
+            tasks.append(asyncio.create_task(synthesize_one(len(tasks) + 1, chunk)))
+
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return await write_chunks_in_order(tasks, window, on_chunk)
+
+
+def with_chunk_store(synthesize: Callable[[str], Awaitable[tuple[bytes, float]]],
+                     chunk_store=None) -> Callable[[str], Awaitable[tuple[bytes, float]]]:
+    """
+    Оборачивает озвучку чанка хранилищем уже озвученных чанков (см. generation_checkpoints):
+    готовый чанк берется из хранилища, новый - сохраняется в него
+    """
+    if chunk_store is None:
+        return synthesize
+
+    async def synthesize_with_store(ssml_chunk: str) -> tuple[bytes, float]:
+        stored = await chunk_store.load(ssml_chunk)
+        if stored is not None:
+            print("  Чанк взят из сохраненного прогресса")
+            return stored
+
+        audio_data, duration = await synthesize(ssml_chunk)
+        await chunk_store.save(ssml_chunk, audio_data, duration)
+        return audio_data, duration
+
+    return synthesize_with_store
+
+
+async def create_audio_from_p_blocks(p_blocks: AsyncIterator[str], max_chunk_size: int,
+                                     synthesize: Callable[[str], Awaitable[tuple[bytes, float]]],
+                                     max_concurrency: int, on_chunk: ChunkSink) -> float:
+    """
+    Конвейер разметка → озвучка: пока LLM размечает следующие абзацы,
+    уже собранные чанки озвучиваются TTS воркером
+    """
+    chunk_queue: asyncio.Queue = asyncio.Queue()
+    worker = asyncio.create_task(synthesize_chunk_queue(chunk_queue, synthesize, max_concurrency, on_chunk))
+
+    try:
+        async for chunk in pack_p_blocks(p_blocks, max_chunk_size):
+            # Если воркер уже упал, не ждем окончания разметки
+            if worker.done():
+                worker.result()
+            chunk_queue.put_nowait(chunk)
+
+        chunk_queue.put_nowait(None)
+        return await worker
+
+    except BaseException:
+        worker.cancel()
+        raise
+
+
 class YandexSpeechKitAudioMaker:
     """Класс для создания аудио через Yandex SpeechKit и загрузки в S3"""
 
@@ -23,83 +207,96 @@ class YandexSpeechKitAudioMaker:
         self.api_key = settings.yandex_api_key
         self.folder_id = settings.yandex_folder_id
 
-        self.selectel_domain = settings.selectel_domain
-
-        # Настраиваем Selectel S3
-        self.s3_client = boto3.client(
-            's3',
-            endpoint_url='https://s3.ru-1.storage.selcloud.ru',
-            aws_access_key_id=settings.selectel_access_key,
-            aws_secret_access_key=settings.selectel_secret_key,
-            region_name='ru-1',
-            config=boto3.session.Config(
-                s3={'addressing_style': 'virtual'}
+        # Общий клиент Selectel S3
+        self.storage = s3_storage
+
+        self.max_chunk_size = 4500
+        self.max_concurrency = settings.yandex_tts_max_concurrency
+
+        # Параметры голоса и звука, все они входят в ключ кэша озвучки
+        self.voice_params = {
+            'lang': 'ru-RU',
+            'voice': 'zahar',
+            'emotion': 'neutral',
+            'speed': 1.0,
+            'format': 'mp3',
+            'sampleRateHertz': 48000
+        }
+
+        # Общая сессия с пулом соединений: создается в lifespan приложения
+        self.http_session: Optional[aiohttp.ClientSession] = None
+        self.requests_total = 0
+        self.responses_total = 0
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Создает общую HTTP сессию к SpeechKit (DNS, TCP и TLS переиспользуются между чанками)"""
+        if self.http_session is not None and not self.http_session.closed:
+            return self.http_session
+
+        connector = aiohttp.TCPConnector(
+            limit=settings.yandex_tts_max_connections,
+            keepalive_timeout=settings.yandex_tts_keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=settings.yandex_tts_dns_cache_ttl,
+            enable_cleanup_closed=True
+        )
+
+        self.http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(
+                total=None,
+                connect=settings.yandex_tts_timeout_connect,
+                sock_read=settings.yandex_tts_timeout_read
             )
         )
 
-        self.bucket_name = settings.selectel_bucket_name
+        print(f"Yandex SpeechKit: пул соединений создан (limit={settings.yandex_tts_max_connections})")
+        return self.http_session
+
+    async def close(self) -> None:
+        if self.http_session is not None:
+            await self.http_session.close()
+        self.http_session = None
+
+    async def get_http_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую сессию (создает ее, если lifespan еще не запускался)"""
+        if self.http_session is None or self.http_session.closed:
+            return await self.start()
+        return self.http_session
+
+    def get_stats(self) -> dict:
+        """Статистика пула соединений для подбора лимитов"""
+        stats = {
+            "started": self.http_session is not None and not self.http_session.closed,
+            "max_connections": settings.yandex_tts_max_connections,
+            "requests_total": self.requests_total,
+            "responses_total": self.responses_total,
+            "in_flight_requests": self.requests_total - self.responses_total,
+        }
 
-        self.max_chunk_size = 4500
+        # aiohttp не дает публичного API для состояния пула, читаем его из коннектора
+        connector = self.http_session.connector if self.http_session else None
+        acquired = getattr(connector, "_acquired", None)
+        idle = getattr(connector, "_conns", None)
+
+        if acquired is not None and idle is not None:
+            stats["connections_active"] = len(acquired)
+            stats["connections_idle"] = sum(len(connections) for connections in idle.values())
+            stats["connections_total"] = stats["connections_active"] + stats["connections_idle"]
+
+        return stats
 
     def remove_outer_speak_tags(self, ssml_text: str) -> str:
         """
         ШАГ 2: Удаляем внешние <speak> и </speak> теги
         """
-        # Удаляем внешние speak теги, сохраняя все внутреннее содержимое
-        ssml_text = ssml_text.strip()
-
-        # Удаляем открывающий тег <speak> (может содержать атрибуты)
-        ssml_text = re.sub(r'^\s*<speak>', '', ssml_text, flags=re.IGNORECASE)
-
-        # Удаляем закрывающий тег </speak>
-        ssml_text = re.sub(r'</speak>\s*$', '', ssml_text, flags=re.IGNORECASE)
-
-        return ssml_text.strip()
+        return remove_outer_speak_tags(ssml_text)
 
     def split_by_p_tags(self, ssml_content: str) -> list[str]:
         """
-        ШАГ 3: Разделяем контент на чанки по <p> тегам
+        ШАГ 3: Разделяем контент на чанки по <p> тегам (слишком длинные абзацы - по <s> и <break/>)
         """
-        chunks = []
-
-        # Находим все <p>...</p> блоки
-        p_pattern = r'<p[^>]*>.*?</p>'
-        p_blocks = re.findall(p_pattern, ssml_content, re.DOTALL | re.IGNORECASE)
-
-        if not p_blocks:
-            # Если нет <p> тегов, возвращаем весь контент как один чанк
-            print("Предупреждение: <p> теги не найдены, используется весь контент как один чанк")
-            return [ssml_content]
-
-        print(f"Найдено {len(p_blocks)} абзацев (<p> тегов)")
-
-        current_chunk = ""
-
-        for i, p_block in enumerate(p_blocks):
-            # Проверяем, поместится ли текущий блок в чанк
-            test_chunk = current_chunk + p_block
-            test_chunk_with_speak = f"<speak>{test_chunk}</speak>"
-
-            if len(test_chunk_with_speak) <= self.max_chunk_size:
-                # Блок помещается, добавляем его к текущему чанку
-                current_chunk = test_chunk
-            else:
-                # Блок не помещается
-                if current_chunk:
-                    # Сохраняем накопленный чанк
-                    chunks.append(current_chunk)
-                    current_chunk = p_block
-                else:
-                    # Текущий блок слишком большой даже сам по себе
-                    print(f"Предупреждение: абзац {i + 1} слишком длинный ({len(p_block)} символов)")
-                    # Можно добавить дополнительную логику разделения длинного абзаца
-                    chunks.append(p_block)
-
-        # Добавляем последний чанк, если он не пустой
-        if current_chunk:
-            chunks.append(current_chunk)
-
-        return chunks
+        return split_ssml(ssml_content, self.max_chunk_size)
 
     def add_speak_tags_to_chunks(self, chunks: list[str]) -> list[str]:
         """
@@ -120,17 +317,17 @@ class YandexSpeechKitAudioMaker:
         return wrapped_chunks
 
     async def create_audio_chunk(self, ssml_chunk) -> tuple[bytes, float]:
-        """ШАГ 1: Создаем аудио из текста через Yandex SpeechKit"""
+        """ШАГ 1: Создаем аудио из текста через Yandex SpeechKit (или берем готовое из кэша озвучки)"""
+        cache_key = tts_cache_key(ssml_chunk, "yandex", **self.voice_params)
+        return await tts_chunk_cache.get_or_synthesize(
+            cache_key, "yandex", lambda: self.request_audio_chunk(ssml_chunk)
+        )
 
-        #
+    async def request_audio_chunk(self, ssml_chunk) -> tuple[bytes, float]:
+        """Запрос к Yandex SpeechKit"""
         data = {
             'ssml': ssml_chunk,
-            'lang': 'ru-RU',
-            'voice': 'zahar',
-            'emotion': 'neutral',
-            'speed': 1.0,
-            'format': 'mp3',
-            'sampleRateHertz': 48000,
+            **self.voice_params,
             'folderId': self.folder_id
         }
 
@@ -141,37 +338,28 @@ class YandexSpeechKitAudioMaker:
             "Content-Type": "application/x-www-form-urlencoded"
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, data=data) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Yandex SpeechKit API error {response.status}: {error_text}")
+        record_tts_characters("yandex", len(ssml_chunk))
 
-                audio_data = await response.read()
+        session = await self.get_http_session()
 
-        # Получаем длительность аудио
-        try:
-            audio_file = io.BytesIO(audio_data)
-            audio = MP3(audio_file)
-            duration = audio.info.length  # в секундах
-        except Exception as e:
-            print(f"Не удалось получить длительность аудио чанка: {e}")
-            duration = 0.0
+        with track_stage("tts_chunk", provider="yandex", model=data['voice']):
+            self.requests_total += 1
+            try:
+                async with session.post(url, headers=headers, data=data) as response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        raise Exception(f"Yandex SpeechKit API error {response.status}: {error_text}")
 
-        return audio_data, duration
+                    audio_data = await response.read()
+            finally:
+                self.responses_total += 1
 
-    @staticmethod
-    def concatenate_audio_files(audio_chunks: list[bytes]) -> bytes:
-        """
-        ШАГ 6: Соединяем аудио файлы
-        """
-        print(len(audio_chunks))
-        if len(audio_chunks) == 1:
-            return audio_chunks[0]
+        # Длительность по заголовкам MP3 фреймов
+        duration = mp3.get_duration(audio_data)
 
-        return b''.join(audio_chunks)
+        return audio_data, duration
 
-    async def create_audio_from_ssml(self, ssml_text: str) -> tuple[bytes, float]:
+    async def create_audio_from_ssml(self, ssml_text: str, on_chunk: ChunkSink, chunk_store=None) -> float:
         """
         ОСНОВНОЙ МЕТОД: Реализация вашего алгоритма
         1. Разметка уже есть (ssml_text)
@@ -179,9 +367,10 @@ class YandexSpeechKitAudioMaker:
         3. Разделяем по <p> тегам
         4. Добавляем <speak></speak> к каждому чанку
         5. Озвучиваем каждый чанк
-        6. Соединяем результаты
+        6. По порядку передаем аудио чанков в on_chunk (склейка и загрузка в S3)
         """
         print(f"Начинаем обработку SSML текста длиной {len(ssml_text)} символов")
+        synthesize = with_chunk_store(self.create_audio_chunk, chunk_store)
 
         # ШАГ 2: Удаляем внешние <speak></speak> теги
         content_without_speak = self.remove_outer_speak_tags(ssml_text)
@@ -194,70 +383,70 @@ class YandexSpeechKitAudioMaker:
         # Если все помещается в один чанк, используем исходный SSML
         if len(chunks) == 1 and len(ssml_text) <= self.max_chunk_size:
             print("Текст помещается в один чанк, используем как есть")
-            return await self.create_audio_chunk(ssml_text)
+            audio_data, duration = await synthesize_with_retry(synthesize, ssml_text, 1)
+            await deliver_chunk(on_chunk, audio_data)
+            return duration
 
         # ШАГ 4: Добавляем <speak></speak> к каждому чанку
         wrapped_chunks = self.add_speak_tags_to_chunks(chunks)
 
-        # ШАГ 5: Озвучиваем каждый чанк
-        audio_chunks = []
-        total_duration = 0.0
-
-        for i, chunk in enumerate(wrapped_chunks):
-            try:
-                print(f"Озвучиваем чанк {i + 1}/{len(wrapped_chunks)}")
-                audio_data, duration = await self.create_audio_chunk(chunk)
-                audio_chunks.append(audio_data)
-                total_duration += duration
-                print(f"  Длительность чанка: {duration:.2f} секунд")
+        # ШАГ 5-6: Озвучиваем чанки параллельно и по порядку передаем их дальше
+        return await synthesize_chunks(wrapped_chunks, synthesize, self.max_concurrency, on_chunk)
 
-            except Exception as e:
-                raise Exception(f"Ошибка при озвучке чанка {i + 1}: {e}")
-
-        # ШАГ 6: Соединяем аудио
-        print("Соединяем аудио чанки...")
-        combined_audio = self.concatenate_audio_files(audio_chunks)
-
-        print(f"Общая длительность: {total_duration:.2f} секунд")
-        return combined_audio, total_duration
-
-    def upload_to_s3(self, audio_data: bytes) -> str:
-        """ШАГ 2: Загружаем аудио в S3"""
+    def create_s3_upload(self) -> StreamingMp3Upload:
+        """Загрузка в S3, в которую аудио дописывается по мере озвучки"""
 
         # Создаем уникальное имя файла
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         unique_id = str(uuid.uuid4())[:8]
         filename = f"audio/yandex_tts_{timestamp}_{unique_id}.mp3"
 
-        # Загружаем в S3
-        self.s3_client.put_object(
-            Bucket=self.bucket_name,
-            Key=filename,
-            Body=audio_data,
-            ContentType='audio/mpeg',
-            ACL='public-read'
-        )
+        return StreamingMp3Upload(self.storage, filename)
+
+    async def make_story_audio_from_blocks(self, p_blocks: AsyncIterator[str], chunk_store=None) -> dict:
+        """
+        Потоковый вариант make_story_audio: <p> блоки разметки озвучиваются
+        по мере их поступления, не дожидаясь окончания разметки всей сказки
+        """
+        try:
+            async with self.create_s3_upload() as upload:
+                await create_audio_from_p_blocks(
+                    p_blocks, self.max_chunk_size, with_chunk_store(self.create_audio_chunk, chunk_store),
+                    self.max_concurrency, upload.add_chunk
+                )
+                print(f"Общая длительность: {upload.duration:.2f} секунд")
 
-        # Формируем URL
-        file_url = f"{self.selectel_domain}/{filename}"
+                with track_stage("s3_upload"):
+                    filename = await upload.complete()
+
+            return {
+                'url': self.storage.public_url(filename),
+                'duration': upload.duration,
+                'service': 'yandex_speechkit'
+            }
 
-        return file_url
+        except Exception as e:
+            raise Exception(f"Не удалось создать аудио через Yandex SpeechKit: {e}")
 
-    async def make_story_audio(self, story_text: str) -> dict:
+    async def make_story_audio(self, story_text: str, chunk_store=None) -> dict:
         """ГЛАВНАЯ ФУНКЦИЯ: Текст → Аудио (Yandex SpeechKit) → S3 → URL"""
 
         try:
-            # Шаг 1: Текст → Аудио через Yandex SpeechKit
-            audio_data, duration = await self.create_audio_from_ssml(
-                story_text
-            )
-
-            # Шаг 2: Аудио → S3
-            audio_url = self.upload_to_s3(audio_data)
+            async with self.create_s3_upload() as upload:
+                # Шаг 1: Текст → Аудио через Yandex SpeechKit, полные части сразу уходят в S3
+                await self.create_audio_from_ssml(
+                    story_text,
+                    on_chunk=upload.add_chunk,
+                    chunk_store=chunk_store
+                )
+
+                # Шаг 2: Дозагружаем остаток и Xing/Info заголовок
+                with track_stage("s3_upload"):
+                    filename = await upload.complete()
 
             return {
-                'url': audio_url,
-                'duration': duration,  # длительность в секундах
+                'url': self.storage.public_url(filename),
+                'duration': upload.duration,  # длительность в секундах
                 'service': 'yandex_speechkit'
             }
 
@@ -265,6 +454,10 @@ class YandexSpeechKitAudioMaker:
             raise Exception(f"Не удалось создать аудио через Yandex SpeechKit: {e}")
 
 
+# Лимит входа синхронного synthesize_speech в Google Cloud TTS (байты SSML)
+SHORT_AUDIO_MAX_BYTES = 5000
+
+
 class GoogleCloudAudioMaker:
     """Класс для создания длинных аудио через Google Cloud TTS и загрузки в S3"""
 
@@ -279,10 +472,11 @@ class GoogleCloudAudioMaker:
 
         self.project_id = settings.google_cloud_project_id
 
-        # Инициализируем клиент для длинных аудио
-        self.long_audio_client = texttospeech.TextToSpeechLongAudioSynthesizeClient(
-            credentials=self.credentials
-        )
+        # Асинхронный клиент создается при первом вызове, внутри event loop
+        self.short_audio_client: Optional[texttospeech.TextToSpeechAsyncClient] = None
+
+        # Long Audio - синхронный клиент: операция ждется блокирующим result(), поэтому в пуле потоков
+        self.long_audio_client = texttospeech.TextToSpeechLongAudioSynthesizeClient(credentials=self.credentials)
 
         # Инициализируем клиент для Google Cloud Storage
         self.gcs_client = storage.Client(credentials=self.credentials, project=self.project_id)
@@ -292,83 +486,32 @@ class GoogleCloudAudioMaker:
         if not self.temp_gcs_bucket:
             raise ValueError("TEMP_GCS_BUCKET_NAME environment variable not found")
 
-        self.selectel_domain = settings.selectel_domain
-
-        # Настраиваем Selectel S3
-        self.s3_client = boto3.client(
-            's3',
-            endpoint_url='https://s3.ru-1.storage.selcloud.ru',
-            aws_access_key_id=settings.selectel_access_key,
-            aws_secret_access_key=settings.selectel_secret_key,
-            region_name='ru-1',
-            config=boto3.session.Config(
-                s3={'addressing_style': 'virtual'}
-            )
-        )
+        # Общий клиент Selectel S3
+        self.storage = s3_storage
 
-        self.bucket_name = settings.selectel_bucket_name
+        # Чанки собираются под лимит синхронного API, чтобы не идти через Long Audio и GCS
+        self.max_chunk_size = 4500
+        self.max_concurrency = settings.google_tts_max_concurrency
 
-        self.max_chunk_size = 7000
+        self.speaking_rate = 0.9
+        self.volume_gain_db = -2.0
+
+    def get_short_audio_client(self) -> texttospeech.TextToSpeechAsyncClient:
+        if self.short_audio_client is None:
+            self.short_audio_client = texttospeech.TextToSpeechAsyncClient(credentials=self.credentials)
+        return self.short_audio_client
 
     def remove_outer_speak_tags(self, ssml_text: str) -> str:
         """
         ШАГ 2: Удаляем внешние <speak> и </speak> теги
         """
-        # Удаляем внешние speak теги, сохраняя все внутреннее содержимое
-        ssml_text = ssml_text.strip()
-
-        # Удаляем открывающий тег <speak> (может содержать атрибуты)
-        ssml_text = re.sub(r'^\s*<speak>', '', ssml_text, flags=re.IGNORECASE)
-
-        # Удаляем закрывающий тег </speak>
-        ssml_text = re.sub(r'</speak>\s*$', '', ssml_text, flags=re.IGNORECASE)
-
-        return ssml_text.strip()
+        return remove_outer_speak_tags(ssml_text)
 
     def split_by_p_tags(self, ssml_content: str) -> list[str]:
         """
-        ШАГ 3: Разделяем контент на чанки по <p> тегам
+        ШАГ 3: Разделяем контент на чанки по <p> тегам (слишком длинные абзацы - по <s> и <break/>)
         """
-        chunks = []
-
-        # Находим все <p>...</p> блоки
-        p_pattern = r'<p[^>]*>.*?</p>'
-        p_blocks = re.findall(p_pattern, ssml_content, re.DOTALL | re.IGNORECASE)
-
-        if not p_blocks:
-            # Если нет <p> тегов, возвращаем весь контент как один чанк
-            print("Предупреждение: <p> теги не найдены, используется весь контент как один чанк")
-            return [ssml_content]
-
-        print(f"Найдено {len(p_blocks)} абзацев (<p> тегов)")
-
-        current_chunk = ""
-
-        for i, p_block in enumerate(p_blocks):
-            # Проверяем, поместится ли текущий блок в чанк
-            test_chunk = current_chunk + p_block
-            test_chunk_with_speak = f"<speak>{test_chunk}</speak>"
-
-            if len(test_chunk_with_speak) <= self.max_chunk_size:
-                # Блок помещается, добавляем его к текущему чанку
-                current_chunk = test_chunk
-            else:
-                # Блок не помещается
-                if current_chunk:
-                    # Сохраняем накопленный чанк
-                    chunks.append(current_chunk)
-                    current_chunk = p_block
-                else:
-                    # Текущий блок слишком большой даже сам по себе
-                    print(f"Предупреждение: абзац {i + 1} слишком длинный ({len(p_block)} символов)")
-                    # Можно добавить дополнительную логику разделения длинного абзаца
-                    chunks.append(p_block)
-
-        # Добавляем последний чанк, если он не пустой
-        if current_chunk:
-            chunks.append(current_chunk)
-
-        return chunks
+        return split_ssml(ssml_content, self.max_chunk_size)
 
     def add_speak_tags_to_chunks(self, chunks: list[str]) -> list[str]:
         """
@@ -388,10 +531,22 @@ class GoogleCloudAudioMaker:
 
         return wrapped_chunks
 
-    async def create_audio_chunk(self, text: str,
-                                voice_name: str,
-                                language_code: str) -> tuple[bytes, float]:
-        """ШАГ 1: Создаем длинное аудио из текста через Google Cloud TTS Long Audio Synthesis"""
+    async def synthesize_short_audio(self, synthesis_input: texttospeech.SynthesisInput,
+                                     voice: texttospeech.VoiceSelectionParams,
+                                     audio_config: texttospeech.AudioConfig) -> bytes:
+        """Синхронный синтез (один запрос, без GCS) - для чанков до SHORT_AUDIO_MAX_BYTES"""
+        response = await self.get_short_audio_client().synthesize_speech(
+            input=synthesis_input,
+            voice=voice,
+            audio_config=audio_config
+        )
+        # Для LINEAR16 ответ уже содержит WAV заголовок
+        return response.audio_content
+
+    async def synthesize_long_audio(self, synthesis_input: texttospeech.SynthesisInput,
+                                    voice: texttospeech.VoiceSelectionParams,
+                                    audio_config: texttospeech.AudioConfig) -> bytes:
+        """Long Audio Synthesis через временный файл в GCS - только для слишком больших чанков"""
 
         # Создаем уникальное имя для временного файла в GCS
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -399,23 +554,6 @@ class GoogleCloudAudioMaker:
         temp_filename = f"temp_audio_{timestamp}_{unique_id}.wav"
         output_gcs_uri = f"gs://{self.temp_gcs_bucket}/{temp_filename}"
 
-        # Настройка входного текста
-        synthesis_input = texttospeech.SynthesisInput(ssml=text)
-
-        # Настройка голоса
-        voice = texttospeech.VoiceSelectionParams(
-            language_code=language_code,
-            name=voice_name,
-            ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
-        )
-
-        # Настройка аудио конфига
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.LINEAR16,
-            speaking_rate=0.9,
-            volume_gain_db=-2.0
-        )
-
         # Создаем запрос для длинного аудио синтеза
         request = texttospeech.SynthesizeLongAudioRequest(
             parent=f"projects/{self.project_id}/locations/global",
@@ -426,87 +564,123 @@ class GoogleCloudAudioMaker:
         )
 
         # Запускаем операцию синтеза
-        operation = self.long_audio_client.synthesize_long_audio(request=request)
+        operation = await run_blocking(self.long_audio_client.synthesize_long_audio, request=request)
 
-        # Ждем завершения операции
-        result = operation.result(timeout=1800)  # 30 минут timeout
+        # Ждем завершения операции: result() опрашивает операцию и блокирует поток до ее окончания
+        await run_blocking(operation.result, timeout=1800)  # 30 минут timeout
 
         # Скачиваем файл из GCS
         bucket = self.gcs_client.bucket(self.temp_gcs_bucket, user_project=self.project_id)
 
         blob = bucket.blob(temp_filename)
 
-        # Скачиваем аудио данные
-        audio_data = blob.download_as_bytes()
-
-        # Получаем длительность аудио
-        try:
-            audio_file = io.BytesIO(audio_data)
-            with wave.open(audio_file, 'rb') as wav_file:
-                frames = wav_file.getnframes()
-                sample_rate = wav_file.getframerate()
-                duration = frames / float(sample_rate)
-        except Exception as e:
-            print(f"Не удалось получить длительность аудио: {e}")
-            duration = 0.0
+        # Скачиваем аудио данные (клиент GCS синхронный, поэтому в пуле потоков)
+        audio_data = await run_blocking(blob.download_as_bytes)
 
         # Удаляем временный файл из GCS
         try:
-            blob.delete()
+            await run_blocking(blob.delete)
             print(f"Временный файл {temp_filename} удален из GCS")
         except Exception as e:
             print(f"Не удалось удалить временный файл из GCS: {e}")
 
-        return audio_data, duration
+        return audio_data
 
-    @staticmethod
-    def concatenate_audio_files(audio_chunks: list[bytes]) -> bytes:
+    async def create_audio_chunk(self, text: str,
+                                voice_name: str,
+                                language_code: str) -> tuple[bytes, float]:
         """
-        ШАГ 6: Соединяем аудио файлы
+        ШАГ 1: Создаем аудио из текста через Google Cloud TTS.
+        Чанки до SHORT_AUDIO_MAX_BYTES озвучиваются одним синхронным запросом,
+        Long Audio Synthesis с GCS используется только для более длинных
         """
-        print(len(audio_chunks))
-        if len(audio_chunks) == 1:
-            return audio_chunks[0]
 
-        # Создаем выходной буфер
-        output_buffer = io.BytesIO()
+        # Настройка входного текста
+        synthesis_input = texttospeech.SynthesisInput(ssml=text)
 
-        # Открываем первый файл, чтобы получить параметры
-        first_file = io.BytesIO(audio_chunks[0])
-        with wave.open(first_file, 'rb') as first_wav:
-            params = first_wav.getparams()
+        # Настройка голоса
+        voice = texttospeech.VoiceSelectionParams(
+            language_code=language_code,
+            name=voice_name,
+            ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
+        )
 
-            # Создаем выходной WAV файл с теми же параметрами
-            with wave.open(output_buffer, 'wb') as output_wav:
-                output_wav.setparams(params)
+        # Настройка аудио конфига
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+            speaking_rate=self.speaking_rate,
+            volume_gain_db=self.volume_gain_db
+        )
 
-                # Записываем данные из первого файла
-                output_wav.writeframes(first_wav.readframes(first_wav.getnframes()))
+        record_tts_characters("google", len(text))
 
-                # Добавляем данные из остальных файлов
-                for chunk in audio_chunks[1:]:
-                    chunk_buffer = io.BytesIO(chunk)
-                    with wave.open(chunk_buffer, 'rb') as chunk_wav:
-                        # Просто добавляем аудио данные, игнорируя заголовки
-                        output_wav.writeframes(chunk_wav.readframes(chunk_wav.getnframes()))
+        with track_stage("tts_chunk", provider="google", model=voice_name):
+            if len(text.encode("utf-8")) <= SHORT_AUDIO_MAX_BYTES:
+                audio_data = await self.synthesize_short_audio(synthesis_input, voice, audio_config)
+            else:
+                print(f"Чанк больше {SHORT_AUDIO_MAX_BYTES} байт, используем Long Audio Synthesis")
+                audio_data = await self.synthesize_long_audio(synthesis_input, voice, audio_config)
 
-        # Возвращаем склеенный файл как bytes
-        return output_buffer.getvalue()
+        # Получаем длительность аудио
+        try:
+            audio_file = io.BytesIO(audio_data)
+            with wave.open(audio_file, 'rb') as wav_file:
+                frames = wav_file.getnframes()
+                sample_rate = wav_file.getframerate()
+                duration = frames / float(sample_rate)
+        except Exception as e:
+            print(f"Не удалось получить длительность аудио: {e}")
+            duration = 0.0
+
+        return audio_data, duration
+
+    async def create_mp3_chunk(self, text: str,
+                               voice_name: str,
+                               language_code: str) -> tuple[bytes, float]:
+        """
+        Озвучивает чанк и сжимает LINEAR16 в MP3 в пуле процессов.
+        В кэше озвучки хранится уже сжатый MP3
+        """
+        async def synthesize() -> tuple[bytes, float]:
+            wav_data, duration = await self.create_audio_chunk(text, voice_name, language_code)
+
+            with track_stage("audio_encoding", provider="google", model=voice_name):
+                mp3_data = await audio_encoder.encode_mp3(wav_data)
+
+            return mp3_data, duration
+
+        cache_key = tts_cache_key(
+            text, "google",
+            voice=voice_name,
+            language=language_code,
+            speaking_rate=self.speaking_rate,
+            volume_gain_db=self.volume_gain_db,
+            format="mp3",
+            bitrate=audio_encoder.bitrate
+        )
+        return await tts_chunk_cache.get_or_synthesize(cache_key, "google", synthesize)
 
     async def create_audio_from_ssml(self, ssml_text: str,
                                      voice_name: str,
-                                     language_code: str) -> tuple[bytes, float]:
+                                     language_code: str,
+                                     on_chunk: ChunkSink,
+                                     chunk_store=None) -> float:
         """
         ОСНОВНОЙ МЕТОД: Реализация вашего алгоритма
         1. Разметка уже есть (ssml_text)
         2. Удаляем внешние <speak></speak>
         3. Разделяем по <p> тегам
         4. Добавляем <speak></speak> к каждому чанку
-        5. Озвучиваем каждый чанк
-        6. Соединяем результаты
+        5. Озвучиваем каждый чанк и сжимаем его в MP3
+        6. По порядку передаем аудио чанков в on_chunk (склейка и загрузка в S3)
         """
         print(f"Начинаем обработку SSML текста длиной {len(ssml_text)} символов")
 
+        async def synthesize_chunk(ssml_chunk: str) -> tuple[bytes, float]:
+            return await self.create_mp3_chunk(ssml_chunk, voice_name, language_code)
+
+        synthesize = with_chunk_store(synthesize_chunk, chunk_store)
+
         # ШАГ 2: Удаляем внешние <speak></speak> теги
         content_without_speak = self.remove_outer_speak_tags(ssml_text)
         print(f"Контент без внешних speak тегов: {len(content_without_speak)} символов")
@@ -518,74 +692,81 @@ class GoogleCloudAudioMaker:
         # Если все помещается в один чанк, используем исходный SSML
         if len(chunks) == 1 and len(ssml_text) <= self.max_chunk_size:
             print("Текст помещается в один чанк, используем как есть")
-            return await self.create_audio_chunk(ssml_text, voice_name, language_code)
+            audio_data, duration = await synthesize_with_retry(synthesize, ssml_text, 1)
+            await deliver_chunk(on_chunk, audio_data)
+            return duration
 
         # ШАГ 4: Добавляем <speak></speak> к каждому чанку
         wrapped_chunks = self.add_speak_tags_to_chunks(chunks)
 
-        # ШАГ 5: Озвучиваем каждый чанк
-        audio_chunks = []
-        total_duration = 0.0
+        # ШАГ 5-6: Озвучиваем чанки параллельно и по порядку передаем их дальше
+        return await synthesize_chunks(wrapped_chunks, synthesize, self.max_concurrency, on_chunk)
 
-        for i, chunk in enumerate(wrapped_chunks):
-            try:
-                print(f"Озвучиваем чанк {i + 1}/{len(wrapped_chunks)}")
-                audio_data, duration = await self.create_audio_chunk(chunk, voice_name, language_code)
-                audio_chunks.append(audio_data)
-                total_duration += duration
-                print(f"  Длительность чанка: {duration:.2f} секунд")
+    def create_s3_upload(self) -> StreamingMp3Upload:
+        """Загрузка в S3, в которую аудио дописывается по мере озвучки"""
 
-            except Exception as e:
-                raise Exception(f"Ошибка при озвучке чанка {i + 1}: {e}")
+        # Создаем уникальное имя файла
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        unique_id = str(uuid.uuid4())[:8]
+        filename = f"audio/gc_long_tts_{timestamp}_{unique_id}.mp3"
 
-        # ШАГ 6: Соединяем аудио
-        print("Соединяем аудио чанки...")
-        combined_audio = self.concatenate_audio_files(audio_chunks)
+        return StreamingMp3Upload(self.storage, filename)
 
-        print(f"Общая длительность: {total_duration:.2f} секунд")
-        return combined_audio, total_duration
+    async def make_story_audio_from_blocks(self, p_blocks: AsyncIterator[str],
+                                           voice_name: str,
+                                           language_code: str,
+                                           chunk_store=None) -> dict:
+        """
+        Потоковый вариант make_story_audio: <p> блоки разметки озвучиваются
+        по мере их поступления, не дожидаясь окончания разметки всей сказки
+        """
+        async def synthesize(ssml_chunk: str) -> tuple[bytes, float]:
+            return await self.create_mp3_chunk(ssml_chunk, voice_name, language_code)
 
-    def upload_to_s3(self, audio_data: bytes) -> str:
-        """ШАГ 2: Загружаем аудио в S3"""
+        try:
+            async with self.create_s3_upload() as upload:
+                await create_audio_from_p_blocks(
+                    p_blocks, self.max_chunk_size, with_chunk_store(synthesize, chunk_store),
+                    self.max_concurrency, upload.add_chunk
+                )
+                print(f"Общая длительность: {upload.duration:.2f} секунд")
 
-        # Создаем уникальное имя файла
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
-        filename = f"audio/gc_long_tts_{timestamp}_{unique_id}.wav"
-
-        # Загружаем в S3
-        self.s3_client.put_object(
-            Bucket=self.bucket_name,
-            Key=filename,
-            Body=audio_data,
-            ContentType='audio/wav',
-            ACL='public-read'
-        )
+                with track_stage("s3_upload"):
+                    filename = await upload.complete()
 
-        # Формируем URL
-        file_url = f"{self.selectel_domain}/{filename}"
+            return {
+                'url': self.storage.public_url(filename),
+                'duration': upload.duration,
+                'service': 'google_cloud_long_tts'
+            }
 
-        return file_url
+        except Exception as e:
+            raise Exception(f"Не удалось создать длинное аудио через Google Cloud TTS: {e}")
 
     async def make_story_audio(self, story_text: str,
                                voice_name: str,
-                               language_code: str) -> dict:
+                               language_code: str,
+                               chunk_store=None) -> dict:
         """ГЛАВНАЯ ФУНКЦИЯ: Длинный текст → Аудио (GC Long TTS) → S3 → URL"""
 
         try:
-            # Шаг 1: Длинный текст → Аудио через Google Cloud Long TTS
-            audio_data, duration = await self.create_audio_from_ssml(
-                story_text,
-                voice_name=voice_name,
-                language_code=language_code
-            )
-
-            # Шаг 2: Аудио → S3
-            audio_url = self.upload_to_s3(audio_data)
+            async with self.create_s3_upload() as upload:
+                # Шаг 1: Длинный текст → Аудио через Google Cloud TTS, полные части сразу уходят в S3
+                await self.create_audio_from_ssml(
+                    story_text,
+                    voice_name=voice_name,
+                    language_code=language_code,
+                    on_chunk=upload.add_chunk,
+                    chunk_store=chunk_store
+                )
+
+                # Шаг 2: Дозагружаем остаток и Xing/Info заголовок
+                with track_stage("s3_upload"):
+                    filename = await upload.complete()
 
             return {
-                'url': audio_url,
-                'duration': duration,  # длительность в секундах
+                'url': self.storage.public_url(filename),
+                'duration': upload.duration,  # длительность в секундах
                 'service': 'google_cloud_long_tts'
             }
 
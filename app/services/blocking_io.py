@@ -0,0 +1,59 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.config import settings
+
+
+class BlockingIOExecutor:
+    """
+    Отдельный ограниченный пул потоков для синхронных SDK (boto3, google-cloud-storage).
+
+    Блокирующие вызовы выполняются здесь, а не в event loop, поэтому загрузка
+    аудио или скачивание из GCS не останавливают обработку остальных запросов.
+    Собственный пул не конкурирует с пулом по умолчанию, которым пользуются
+    FastAPI и другие библиотеки, а его размер ограничивает нагрузку на хранилища.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.calls_total = 0
+        self.calls_in_flight = 0
+
+    def start(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="blocking-io")
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        self.calls_total += 1
+        self.calls_in_flight += 1
+        try:
+            return await loop.run_in_executor(self.start(), functools.partial(func, *args, **kwargs))
+        finally:
+            self.calls_in_flight -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+    def get_stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "calls_total": self.calls_total,
+            "calls_in_flight": self.calls_in_flight,
+            # Вызовы сверх max_workers ждут свободного потока
+            "calls_waiting": max(0, self.calls_in_flight - self.max_workers),
+        }
+
+
+blocking_io = BlockingIOExecutor(max_workers=settings.blocking_io_max_workers)
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Выполняет синхронный вызов в пуле blocking_io и ждет результат, не блокируя event loop"""
+    return await blocking_io.run(func, *args, **kwargs)
@@ -0,0 +1,177 @@
+import hashlib
+import uuid
+from datetime import datetime, UTC
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from app.config import settings
+from app.database import new_session
+from app.models import GenerationCheckpoint
+from app.services.storage import s3_storage
+
+# Этапы пайплайна в порядке выполнения
+CHECKPOINT_STAGES = ["created", "generated", "expanded", "marked_up", "voiced"]
+
+
+def stage_reached(checkpoint: GenerationCheckpoint, stage: str) -> bool:
+    return CHECKPOINT_STAGES.index(checkpoint.stage) >= CHECKPOINT_STAGES.index(stage)
+
+
+class ChunkCheckpointStore:
+    """
+    Аудио уже озвученных чанков одной генерации.
+    Чанк хранится в S3 под хешем своей SSML разметки, длительность - в метаданных объекта
+    """
+
+    def __init__(self, manager: "GenerationCheckpointManager", generation_id: uuid.UUID):
+        self.manager = manager
+        self.prefix = manager.chunk_prefix(generation_id)
+
+    def object_key(self, ssml_chunk: str) -> str:
+        return f"{self.prefix}{hashlib.sha256(ssml_chunk.encode('utf-8')).hexdigest()}"
+
+    async def load(self, ssml_chunk: str) -> Optional[tuple[bytes, float]]:
+        try:
+            stored = await s3_storage.get_object(self.object_key(ssml_chunk))
+        except Exception as e:
+            print(f"Не удалось прочитать сохраненный чанк: {e}")
+            return None
+
+        if stored is None:
+            return None
+        audio_data, metadata = stored
+        return audio_data, float(metadata.get("duration", 0.0))
+
+    async def save(self, ssml_chunk: str, audio_data: bytes, duration: float) -> None:
+        try:
+            await s3_storage.put_object(
+                self.object_key(ssml_chunk),
+                audio_data,
+                metadata={"duration": str(duration)}
+            )
+        except Exception as e:
+            # Без сохраненного чанка генерация продолжается, при повторе он будет озвучен заново
+            print(f"Не удалось сохранить озвученный чанк: {e}")
+
+
+class GenerationCheckpointManager:
+    """
+    Сохранение прогресса генерации сказки.
+
+    Результат каждого этапа (текст, расширенный текст, разметка, аудио чанков)
+    сохраняется под id генерации. Повторный запрос с тем же ключом продолжает
+    с первого незавершенного этапа, а не генерирует все заново.
+    После сохранения сказки прогресс удаляется. Прогресс старше ttl_seconds
+    не используется и удаляется при следующем обращении с тем же ключом
+    """
+
+    def __init__(self, enabled: bool, ttl_seconds: int):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def chunk_prefix(generation_id: uuid.UUID) -> str:
+        return f"checkpoints/{generation_id}/"
+
+    @staticmethod
+    def key_hash(user_id: uuid.UUID, generation_key: str) -> str:
+        return hashlib.sha256(f"{user_id}:{generation_key}".encode("utf-8")).hexdigest()
+
+    def is_persistent(self, checkpoint: GenerationCheckpoint) -> bool:
+        return self.enabled and bool(checkpoint.key_hash)
+
+    def is_expired(self, checkpoint: GenerationCheckpoint) -> bool:
+        now = datetime.now(UTC).replace(tzinfo=None)
+        return (now - checkpoint.updated_at).total_seconds() > self.ttl_seconds
+
+    async def start(self, user_id: uuid.UUID, generation_key: Optional[str]) -> GenerationCheckpoint:
+        """
+        Возвращает сохраненный прогресс генерации с этим ключом или начинает новый.
+        Без ключа или при выключенных чекпоинтах прогресс живет только в памяти
+        """
+        if not self.enabled or not generation_key:
+            return GenerationCheckpoint(user_id=user_id, key_hash="")
+
+        key_hash = self.key_hash(user_id, generation_key)
+
+        async with new_session() as session:
+            checkpoint = await self._get(session, key_hash)
+
+            if checkpoint and self.is_expired(checkpoint):
+                await self._delete_chunks(checkpoint.id)
+                await session.delete(checkpoint)
+                await session.commit()
+                checkpoint = None
+
+            if checkpoint:
+                print(f"Продолжаем генерацию {checkpoint.id} с этапа после '{checkpoint.stage}'")
+                return checkpoint
+
+            checkpoint = GenerationCheckpoint(user_id=user_id, key_hash=key_hash)
+            session.add(checkpoint)
+            try:
+                await session.commit()
+            except IntegrityError:
+                # Такую же генерацию одновременно начал другой процесс
+                await session.rollback()
+                return await self._get(session, key_hash)
+
+            await session.refresh(checkpoint)
+            return checkpoint
+
+    @staticmethod
+    async def _get(session, key_hash: str) -> Optional[GenerationCheckpoint]:
+        statement = select(GenerationCheckpoint).where(GenerationCheckpoint.key_hash == key_hash)
+        result = await session.execute(statement)
+        return result.scalars().first()
+
+    async def update(self, checkpoint: GenerationCheckpoint, **fields) -> None:
+        """Записывает результат завершенного этапа"""
+        for name, value in fields.items():
+            setattr(checkpoint, name, value)
+        checkpoint.updated_at = datetime.now(UTC).replace(tzinfo=None)
+
+        if not self.is_persistent(checkpoint):
+            return
+
+        try:
+            async with new_session() as session:
+                await session.merge(checkpoint)
+                await session.commit()
+        except Exception as e:
+            # Сбой сохранения прогресса не должен прерывать саму генерацию
+            print(f"Не удалось сохранить прогресс генерации {checkpoint.id}: {e}")
+
+    def chunk_store(self, checkpoint: GenerationCheckpoint) -> Optional[ChunkCheckpointStore]:
+        if not self.is_persistent(checkpoint):
+            return None
+        return ChunkCheckpointStore(self, checkpoint.id)
+
+    async def complete(self, checkpoint: GenerationCheckpoint) -> None:
+        """Сказка сохранена - прогресс больше не нужен"""
+        if not self.is_persistent(checkpoint):
+            return
+
+        try:
+            await self._delete_chunks(checkpoint.id)
+            async with new_session() as session:
+                stored = await session.get(GenerationCheckpoint, checkpoint.id)
+                if stored:
+                    await session.delete(stored)
+                    await session.commit()
+        except Exception as e:
+            print(f"Не удалось удалить прогресс генерации {checkpoint.id}: {e}")
+
+    async def _delete_chunks(self, generation_id: uuid.UUID) -> None:
+        try:
+            await s3_storage.delete_prefix(self.chunk_prefix(generation_id))
+        except Exception as e:
+            print(f"Не удалось удалить сохраненные чанки генерации {generation_id}: {e}")
+
+
+generation_checkpoints = GenerationCheckpointManager(
+    enabled=settings.generation_checkpoints_enabled,
+    ttl_seconds=settings.generation_checkpoint_ttl_seconds
+)
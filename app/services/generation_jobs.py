@@ -0,0 +1,189 @@
+import asyncio
+import contextlib
+import uuid
+from datetime import datetime, UTC
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+from app.services.admission import AdmissionRejected
+
+# Колбэк, через который пайплайн сообщает текущий этап и прогресс (0.0 - 1.0)
+StageCallback = Callable[[str, float], None]
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class GenerationJob:
+    """Состояние одной фоновой генерации сказки"""
+
+    def __init__(self, client_key: Optional[str] = None):
+        self.id = uuid.uuid4()
+        # Пользователь или IP, для которого считается лимит задач
+        self.client_key = client_key
+        self.status = JobStatus.PENDING
+        self.stage: Optional[str] = None
+        self.progress = 0.0
+        self.created_at = datetime.now(UTC).replace(tzinfo=None)
+        self.updated_at = self.created_at
+        self.result: Optional[Any] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def set_stage(self, stage: str, progress: float) -> None:
+        self.stage = stage
+        self.progress = progress
+        self.updated_at = datetime.now(UTC).replace(tzinfo=None)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+
+class GenerationJobManager:
+    """
+    Фоновый исполнитель генераций сказок.
+
+    Запросы получают id задачи сразу, а сам пайплайн выполняется в фоне.
+    Одновременно выполняется не больше max_concurrent_jobs пайплайнов,
+    остальные ждут своей очереди в статусе pending. Очередь ограничена:
+    - 429, если у клиента уже max_jobs_per_client незавершенных задач;
+    - 503, если в очереди уже max_pending_jobs задач.
+    Завершенные задачи хранятся в памяти ttl_seconds секунд.
+    """
+
+    def __init__(self, max_concurrent_jobs: int, ttl_seconds: int, max_pending_jobs: int,
+                 max_jobs_per_client: int, retry_after_seconds: int):
+        self.jobs: Dict[uuid.UUID, GenerationJob] = {}
+        # Ключ объединения → id незавершенной задачи с этим ключом
+        self.active_keys: Dict[str, uuid.UUID] = {}
+        self.ttl_seconds = ttl_seconds
+        self.max_pending_jobs = max_pending_jobs
+        self.max_jobs_per_client = max_jobs_per_client
+        self.retry_after_seconds = retry_after_seconds
+        self.rejected_total = {"client_jobs": 0, "queue_full": 0}
+        self._semaphore = asyncio.Semaphore(max_concurrent_jobs)
+
+    def get_active(self, key: Optional[str]) -> Optional[GenerationJob]:
+        """Незавершенная задача с этим ключом объединения"""
+        if key is None or key not in self.active_keys:
+            return None
+        return self.jobs[self.active_keys[key]]
+
+    def check_capacity(self, client_key: str) -> None:
+        """Бросает AdmissionRejected, если новую задачу ставить в очередь нельзя"""
+        unfinished = [job for job in self.jobs.values() if not job.is_finished]
+
+        if sum(1 for job in unfinished if job.client_key == client_key) >= self.max_jobs_per_client:
+            self.rejected_total["client_jobs"] += 1
+            raise AdmissionRejected(
+                429,
+                "Предыдущие генерации сказок еще не завершены",
+                self.retry_after_seconds
+            )
+
+        if sum(1 for job in unfinished if job.status == JobStatus.PENDING) >= self.max_pending_jobs:
+            self.rejected_total["queue_full"] += 1
+            raise AdmissionRejected(
+                503,
+                "Очередь генераций переполнена, попробуйте позже",
+                self.retry_after_seconds
+            )
+
+    def submit(self, pipeline: Callable[[StageCallback], Awaitable[Any]],
+               key: Optional[str] = None, client_key: Optional[str] = None,
+               queued: bool = True) -> GenerationJob:
+        """
+        Ставит пайплайн в очередь и возвращает созданную задачу.
+        Если задача с таким же ключом еще выполняется, возвращается она.
+        Лимиты очереди проверяет check_capacity до вызова.
+        queued=False - задача только ждет уже идущую генерацию и не занимает место в очереди
+        """
+        self._cleanup_expired()
+
+        active_job = self.get_active(key)
+        if active_job is not None:
+            return active_job
+
+        job = GenerationJob(client_key)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, pipeline, queued))
+
+        if key is not None:
+            self.active_keys[key] = job.id
+            job.task.add_done_callback(lambda _: self._release_key(key, job.id))
+
+        return job
+
+    def _release_key(self, key: str, job_id: uuid.UUID) -> None:
+        if self.active_keys.get(key) == job_id:
+            del self.active_keys[key]
+
+    def get(self, job_id: uuid.UUID) -> Optional[GenerationJob]:
+        self._cleanup_expired()
+        return self.jobs.get(job_id)
+
+    async def _run(self, job: GenerationJob, pipeline: Callable[[StageCallback], Awaitable[Any]],
+                   queued: bool) -> None:
+        try:
+            async with self._semaphore if queued else contextlib.nullcontext():
+                job.status = JobStatus.RUNNING
+                job.set_stage("started", 0.0)
+
+                job.result = await pipeline(job.set_stage)
+                job.status = JobStatus.COMPLETED
+                job.set_stage("done", 1.0)
+
+        except asyncio.CancelledError:
+            # В том числе задача, отмененная еще в очереди
+            job.status = JobStatus.FAILED
+            job.error = "Генерация отменена"
+            job.updated_at = datetime.now(UTC).replace(tzinfo=None)
+            raise
+
+        except Exception as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+            job.updated_at = datetime.now(UTC).replace(tzinfo=None)
+            print(f"Фоновая генерация {job.id} завершилась ошибкой: {e}")
+
+    def _cleanup_expired(self) -> None:
+        """Удаляем завершенные задачи, срок хранения которых истек"""
+        now = datetime.now(UTC).replace(tzinfo=None)
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.is_finished and (now - job.updated_at).total_seconds() > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def shutdown(self) -> None:
+        """Отменяем незавершенные задачи при остановке приложения"""
+        tasks = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+    def get_stats(self) -> dict:
+        unfinished = [job for job in self.jobs.values() if not job.is_finished]
+        return {
+            "pending": sum(1 for job in unfinished if job.status == JobStatus.PENDING),
+            "running": sum(1 for job in unfinished if job.status == JobStatus.RUNNING),
+            "max_pending_jobs": self.max_pending_jobs,
+            "rejected_total": dict(self.rejected_total),
+        }
+
+
+generation_job_manager = GenerationJobManager(
+    max_concurrent_jobs=settings.generation_jobs_max_concurrent,
+    ttl_seconds=settings.generation_jobs_ttl_seconds,
+    max_pending_jobs=settings.generation_jobs_max_pending,
+    max_jobs_per_client=settings.generation_jobs_max_per_user,
+    retry_after_seconds=settings.generation_retry_after_seconds
+)
@@ -0,0 +1,285 @@
+"""
+Метрики в текстовом формате Prometheus.
+
+Небольшой реестр без внешних зависимостей: Counter, Gauge и Histogram
+с метками. Метки пайплайна (язык, провайдер, модель, длительность сказки)
+хранятся в contextvars, поэтому этапы внутри сервисов (чанки TTS, загрузка
+в S3) получают их автоматически, без передачи через все вызовы.
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+# Границы бакетов для этапов пайплайна: от десятков миллисекунд до 20 минут
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+# Время, на которое берется соединение из пула БД: от миллисекунд до минут
+DB_CHECKOUT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+PIPELINE_LABELS = ("language", "provider", "model", "story_duration_minutes")
+
+pipeline_labels: ContextVar[Dict[str, str]] = ContextVar("pipeline_labels", default={})
+
+
+def escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.extend(f'{name}="{escape_label_value(value)}"' for name, value in extra.items())
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric(ABC):
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+
+    @abstractmethod
+    def render(self) -> list[str]:
+        """Строки метрики в текстовом формате Prometheus"""
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = STAGE_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Для каждой комбинации меток: счетчики бакетов, сумма и количество
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = [(key, (list(series[0]), series[1], series[2])) for key, series in self._values.items()]
+
+        lines = self.header()
+        for key, (bucket_counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                labels = format_labels(self.label_names, key, {"le": format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        # Функции, обновляющие метрики-снимки (например, состояние пула БД) перед выдачей
+        self.collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.register(Histogram(
+    "fairytails_pipeline_stage_duration_seconds",
+    "Duration of a story pipeline stage",
+    ("stage",) + PIPELINE_LABELS
+))
+
+STAGE_FAILURES = registry.register(Counter(
+    "fairytails_pipeline_stage_failures_total",
+    "Failed story pipeline stages",
+    ("stage",) + PIPELINE_LABELS
+))
+
+PIPELINES_IN_FLIGHT = registry.register(Gauge(
+    "fairytails_pipelines_in_flight",
+    "Story pipelines currently running",
+    ("endpoint",)
+))
+
+LLM_TOKENS = registry.register(Counter(
+    "fairytails_llm_tokens_total",
+    "LLM tokens consumed",
+    ("stage", "model", "type")
+))
+
+TTS_CHARACTERS = registry.register(Counter(
+    "fairytails_tts_characters_total",
+    "Characters of SSML sent to TTS providers",
+    ("provider", "language")
+))
+
+TTS_CACHE_REQUESTS = registry.register(Counter(
+    "fairytails_tts_cache_requests_total",
+    "TTS chunk cache lookups by result (disk, s3, miss)",
+    ("provider", "result")
+))
+
+DB_CONNECTION_CHECKOUT_DURATION = registry.register(Histogram(
+    "fairytails_db_connection_checkout_duration_seconds",
+    "Time a pooled database connection stays checked out",
+    buckets=DB_CHECKOUT_BUCKETS
+))
+
+DB_POOL_CONNECTIONS = registry.register(Gauge(
+    "fairytails_db_pool_connections",
+    "Database pool connections by state (checked_in, checked_out, overflow, size)",
+    ("state",)
+))
+
+DB_POOL_WAIT_DURATION = registry.register(Histogram(
+    "fairytails_db_pool_wait_duration_seconds",
+    "Time spent waiting for a connection from the database pool",
+    buckets=DB_CHECKOUT_BUCKETS
+))
+
+current_stage: ContextVar[str] = ContextVar("current_stage", default="")
+
+
+@contextmanager
+def track_pipeline(endpoint: str, **labels) -> Iterator[None]:
+    """Задает метки пайплайна для всех вложенных этапов и считает выполняющиеся пайплайны"""
+    token = pipeline_labels.set({name: str(labels.get(name, "")) for name in PIPELINE_LABELS})
+    PIPELINES_IN_FLIGHT.inc(endpoint=endpoint)
+    try:
+        yield
+    finally:
+        PIPELINES_IN_FLIGHT.dec(endpoint=endpoint)
+        pipeline_labels.reset(token)
+
+
+def update_pipeline_labels(**labels) -> None:
+    """Дополняет метки пайплайна, которые стали известны по ходу работы"""
+    pipeline_labels.set({**pipeline_labels.get(), **{name: str(value) for name, value in labels.items()}})
+
+
+@contextmanager
+def track_stage(stage: str, **overrides) -> Iterator[None]:
+    """
+    Измеряет длительность этапа и считает ошибки.
+    overrides заменяют метки пайплайна (например, model для этапа разметки).
+    """
+    labels = {**pipeline_labels.get(), **{name: str(value) for name, value in overrides.items()}}
+    stage_token = current_stage.set(stage)
+    start_time = time.perf_counter()
+
+    try:
+        yield
+    except Exception:
+        STAGE_FAILURES.inc(stage=stage, **labels)
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - start_time, stage=stage, **labels)
+        current_stage.reset(stage_token)
+
+
+def record_llm_usage(model: str, usage) -> None:
+    """Учитывает токены из usage ответа OpenAI"""
+    if usage is None:
+        return
+
+    stage = current_stage.get() or "unknown"
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, stage=stage, model=model, type="prompt")
+    LLM_TOKENS.inc(usage.completion_tokens or 0, stage=stage, model=model, type="completion")
+
+
+def record_tts_characters(provider: str, characters: int) -> None:
+    language = pipeline_labels.get().get("language", "")
+    TTS_CHARACTERS.inc(characters, provider=provider, language=language)
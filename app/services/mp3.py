@@ -0,0 +1,265 @@
+"""
+Склейка MP3 на уровне фреймов.
+
+Каждый чанк от TTS - самостоятельный MP3 файл со своими ID3 тегами и
+Xing/Info/VBRI заголовком. Простая склейка байтов оставляет эти заголовки
+внутри файла, и плееры неверно показывают длительность и перематывают.
+Здесь из чанков берутся только аудио фреймы, а в начало итогового файла
+записывается один Xing/Info заголовок с числом фреймов, размером и таблицей
+перемотки. Длительность считается по заголовкам фреймов, без декодирования.
+"""
+
+import struct
+from array import array
+from typing import BinaryIO, Iterator, Optional
+
+# Битрейты Layer III (кбит/с) по индексу из заголовка фрейма
+BITRATES_MPEG1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+BITRATES_MPEG2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+
+SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG 1
+    2: (22050, 24000, 16000),  # MPEG 2
+    0: (11025, 12000, 8000),  # MPEG 2.5
+}
+
+LAYER_3 = 1
+
+# Флаги Xing заголовка: число фреймов, размер потока, таблица перемотки
+XING_FLAGS = 0x0001 | 0x0002 | 0x0004
+XING_TOC_SIZE = 100
+
+
+class FrameHeader:
+    """Заголовок MPEG Layer III фрейма"""
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self.version_bits = (raw[1] >> 3) & 0x03
+        self.bitrate_index = (raw[2] >> 4) & 0x0F
+        self.sample_rate_index = (raw[2] >> 2) & 0x03
+        self.padding = (raw[2] >> 1) & 0x01
+        self.channel_mode = (raw[3] >> 6) & 0x03
+
+        self.is_mpeg1 = self.version_bits == 3
+        self.sample_rate = SAMPLE_RATES[self.version_bits][self.sample_rate_index]
+        self.samples_per_frame = 1152 if self.is_mpeg1 else 576
+        self.bitrate = self.bitrates[self.bitrate_index]
+        self.length = self.frame_length(self.bitrate_index, self.padding)
+
+    @property
+    def bitrates(self) -> tuple:
+        return BITRATES_MPEG1 if self.is_mpeg1 else BITRATES_MPEG2
+
+    @property
+    def side_info_size(self) -> int:
+        mono = self.channel_mode == 3
+        if self.is_mpeg1:
+            return 17 if mono else 32
+        return 9 if mono else 17
+
+    @property
+    def duration(self) -> float:
+        return self.samples_per_frame / self.sample_rate
+
+    def frame_length(self, bitrate_index: int, padding: int) -> int:
+        coefficient = 144 if self.is_mpeg1 else 72
+        return coefficient * self.bitrates[bitrate_index] * 1000 // self.sample_rate + padding
+
+    def same_format(self, other: "FrameHeader") -> bool:
+        return (self.version_bits, self.sample_rate_index) == (other.version_bits, other.sample_rate_index)
+
+
+def parse_frame_header(data: bytes, offset: int) -> Optional[FrameHeader]:
+    """Разбирает заголовок фрейма по смещению, None - если там не Layer III фрейм"""
+    if offset + 4 > len(data):
+        return None
+
+    b0, b1, b2 = data[offset], data[offset + 1], data[offset + 2]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    bitrate_index = (b2 >> 4) & 0x0F
+    sample_rate_index = (b2 >> 2) & 0x03
+
+    if version_bits == 1 or layer_bits != LAYER_3:
+        return None
+    if bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    return FrameHeader(bytes(data[offset:offset + 4]))
+
+
+def id3v2_size(data: bytes) -> int:
+    """Размер ID3v2 тега в начале файла (0, если тега нет)"""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    has_footer = data[5] & 0x10
+    return 10 + size + (10 if has_footer else 0)
+
+
+def audio_end(data: bytes) -> int:
+    """Конец аудио данных без ID3v1 тега в конце файла"""
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        return len(data) - 128
+    return len(data)
+
+
+def is_info_frame(data: bytes, offset: int, header: FrameHeader) -> bool:
+    """Фрейм с Xing/Info или VBRI заголовком вместо звука"""
+    xing_offset = offset + 4 + header.side_info_size
+    if data[xing_offset:xing_offset + 4] in (b"Xing", b"Info"):
+        return True
+    return data[offset + 36:offset + 40] == b"VBRI"
+
+
+def iter_frames(data: bytes) -> Iterator[tuple[int, FrameHeader]]:
+    """
+    Аудио фреймы MP3 файла: (смещение, заголовок).
+    ID3 теги и Xing/Info/VBRI фрейм пропускаются, после мусора поток
+    синхронизируется заново по двум подряд идущим заголовкам
+    """
+    offset = id3v2_size(data)
+    end = audio_end(data)
+    previous: Optional[FrameHeader] = None
+    first = True
+
+    while offset + 4 <= end:
+        header = parse_frame_header(data, offset)
+
+        if header is not None and offset + header.length <= end:
+            if previous is not None and header.same_format(previous):
+                synced = True
+            else:
+                # Без предыдущего фрейма проверяем, что следом идет еще один заголовок
+                next_offset = offset + header.length
+                next_header = parse_frame_header(data, next_offset)
+                synced = next_offset == end or (next_header is not None and next_header.same_format(header))
+
+            if synced:
+                if not (first and is_info_frame(data, offset, header)):
+                    yield offset, header
+                first = False
+                previous = header
+                offset += header.length
+                continue
+
+        # Потеряли синхронизацию - ищем следующий возможный заголовок
+        previous = None
+        next_sync = data.find(b"\xFF", offset + 1, end)
+        if next_sync == -1:
+            break
+        offset = next_sync
+
+
+def get_duration(data: bytes) -> float:
+    """Длительность MP3 по заголовкам фреймов (секунды)"""
+    return sum(header.duration for _, header in iter_frames(data))
+
+
+class Mp3StreamWriter:
+    """
+    Потоковая склейка MP3 чанков.
+
+    Чанки добавляются по порядку через add_chunk, и их аудио фреймы сразу
+    записываются в приемник байтов file (нужен только метод write, см. streaming_upload).
+    В начале потока резервируется место под Xing/Info фрейм: он известен только
+    в конце, когда посчитаны фреймы, размер и смещения для таблицы перемотки,
+    и собирается через build_info_frame
+    """
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.template: Optional[FrameHeader] = None
+        self.info_frame_size = 0
+        self.info_bitrate_index = 0
+
+        self.frame_count = 0
+        self.audio_bytes = 0
+        self.duration = 0.0
+        self.bitrates = set()
+        # Смещение каждого фрейма от начала аудио - для таблицы перемотки (4 байта на фрейм)
+        self.frame_offsets = array("I")
+
+    def add_chunk(self, data: bytes) -> float:
+        """Дописывает аудио фреймы чанка, возвращает длительность чанка"""
+        chunk_duration = 0.0
+        run_start = run_end = None
+
+        for offset, header in iter_frames(data):
+            if self.template is None:
+                self._start(header)
+            elif not header.same_format(self.template):
+                raise ValueError(
+                    f"Чанк в другом формате MP3: {header.sample_rate} Гц вместо {self.template.sample_rate} Гц"
+                )
+
+            # Соседние фреймы записываем одним куском
+            if run_end != offset:
+                self._write_run(data, run_start, run_end)
+                run_start = offset
+            run_end = offset + header.length
+
+            self.frame_offsets.append(self.audio_bytes)
+            self.audio_bytes += header.length
+            self.frame_count += 1
+            self.bitrates.add(header.bitrate)
+            chunk_duration += header.duration
+
+        self._write_run(data, run_start, run_end)
+        self.duration += chunk_duration
+        return chunk_duration
+
+    def _write_run(self, data: bytes, start: Optional[int], end: Optional[int]) -> None:
+        if start is not None:
+            self.file.write(memoryview(data)[start:end])
+
+    def _start(self, header: FrameHeader) -> None:
+        """Первый фрейм задает формат файла и размер Xing/Info фрейма"""
+        self.template = header
+
+        needed = 4 + header.side_info_size + 4 + 12 + XING_TOC_SIZE
+        bitrate_index = header.bitrate_index
+        while header.frame_length(bitrate_index, 0) < needed and bitrate_index < 14:
+            bitrate_index += 1
+
+        self.info_bitrate_index = bitrate_index
+        self.info_frame_size = header.frame_length(bitrate_index, 0)
+        self.file.write(bytes(self.info_frame_size))
+
+    def build_info_frame(self) -> bytes:
+        header = self.template
+        frame = bytearray(self.info_frame_size)
+
+        # Тот же формат, что у аудио, но без CRC и padding
+        frame[0] = 0xFF
+        frame[1] = header.raw[1] | 0x01
+        frame[2] = (self.info_bitrate_index << 4) | (header.sample_rate_index << 2) | (header.raw[2] & 0x01)
+        frame[3] = header.raw[3]
+
+        total_bytes = self.info_frame_size + self.audio_bytes
+        position = 4 + header.side_info_size
+
+        # "Info" - постоянный битрейт, "Xing" - переменный
+        frame[position:position + 4] = b"Xing" if len(self.bitrates) > 1 else b"Info"
+        frame[position + 4:position + 16] = struct.pack(">III", XING_FLAGS, self.frame_count, total_bytes)
+        frame[position + 16:position + 16 + XING_TOC_SIZE] = self.build_toc(total_bytes)
+
+        return bytes(frame)
+
+    def build_toc(self, total_bytes: int) -> bytes:
+        """Таблица перемотки: положение в файле (0-255) для каждого процента длительности"""
+        toc = bytearray(XING_TOC_SIZE)
+        if not self.frame_count:
+            return bytes(toc)
+
+        for percent in range(XING_TOC_SIZE):
+            frame_index = min(self.frame_count - 1, self.frame_count * percent // XING_TOC_SIZE)
+            offset = self.info_frame_size + self.frame_offsets[frame_index]
+            toc[percent] = min(255, offset * 256 // total_bytes)
+
+        return bytes(toc)
@@ -0,0 +1,120 @@
+import logging
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def is_http2_available() -> bool:
+    """HTTP/2 в httpx требует установленного пакета h2"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class OpenAIClientManager:
+    """
+    Единый на процесс AsyncOpenAI клиент с общим пулом соединений.
+
+    Клиент создается в lifespan приложения и переиспользуется всеми запросами,
+    поэтому TLS-рукопожатия, DNS и соединения не создаются заново на каждый вызов.
+    """
+
+    def __init__(self):
+        self.client: Optional[AsyncOpenAI] = None
+        self.http_client: Optional[httpx.AsyncClient] = None
+
+        # Счетчики для подбора размера пула
+        self.requests_total = 0
+        self.responses_total = 0
+
+    def start(self) -> AsyncOpenAI:
+        if self.client is not None:
+            return self.client
+
+        http2 = settings.openai_http2 and is_http2_available()
+        if settings.openai_http2 and not http2:
+            logger.warning("OPENAI_HTTP2 включен, но пакет h2 не установлен. Используется HTTP/1.1")
+
+        self.http_client = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(**settings.openai_timeout_config),
+            limits=httpx.Limits(
+                max_connections=settings.openai_max_connections,
+                max_keepalive_connections=settings.openai_max_keepalive_connections,
+                keepalive_expiry=settings.openai_keepalive_expiry
+            ),
+            event_hooks={
+                "request": [self._on_request],
+                "response": [self._on_response]
+            }
+        )
+
+        self.client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            max_retries=settings.openai_max_retries,
+            http_client=self.http_client
+        )
+
+        logger.info(
+            f"OpenAI client started (http2={http2}, "
+            f"max_connections={settings.openai_max_connections}, "
+            f"max_keepalive={settings.openai_max_keepalive_connections})"
+        )
+        return self.client
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.close()
+
+        self.client = None
+        self.http_client = None
+
+    def get_client(self) -> AsyncOpenAI:
+        """Возвращает общий клиент (создает его, если lifespan еще не запускался)"""
+        if self.client is None:
+            return self.start()
+        return self.client
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        self.requests_total += 1
+
+    async def _on_response(self, response: httpx.Response) -> None:
+        self.responses_total += 1
+
+    def get_stats(self) -> dict:
+        """Статистика пула соединений для подбора лимитов"""
+        stats = {
+            "started": self.client is not None,
+            "http2": bool(self.http_client and settings.openai_http2 and is_http2_available()),
+            "max_connections": settings.openai_max_connections,
+            "max_keepalive_connections": settings.openai_max_keepalive_connections,
+            "requests_total": self.requests_total,
+            "responses_total": self.responses_total,
+            "in_flight_requests": self.requests_total - self.responses_total,
+        }
+
+        # httpx не дает публичного API для состояния пула, читаем его из httpcore
+        transport = getattr(self.http_client, "_transport", None)
+        pool = getattr(transport, "_pool", None)
+        connections = getattr(pool, "connections", None)
+
+        if connections is not None:
+            stats["connections_total"] = len(connections)
+            stats["connections_idle"] = sum(1 for connection in connections if connection.is_idle())
+            stats["connections_active"] = stats["connections_total"] - stats["connections_idle"]
+
+        return stats
+
+
+openai_client_manager = OpenAIClientManager()
+
+
+def get_openai_client() -> AsyncOpenAI:
+    return openai_client_manager.get_client()
@@ -0,0 +1,66 @@
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+from app.config import settings
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или сформирован не сервером"""
+
+    def to_http_exception(self) -> HTTPException:
+        return HTTPException(status_code=400, detail=f"Некорректный курсор страницы: {self}")
+
+
+def encode_cursor(created_at: datetime, item_id: uuid.UUID) -> str:
+    """Непрозрачный для клиента курсор: позиция (created_at, id) последней записи страницы"""
+    payload = json.dumps({"created_at": created_at.isoformat(), "id": str(item_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["created_at"]), uuid.UUID(payload["id"])
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def page_size(limit: Optional[int]) -> int:
+    """Размер страницы не больше page_size_max"""
+    if not limit or limit < 1:
+        return settings.page_size_default
+    return min(limit, settings.page_size_max)
+
+
+def keyset_page(statement, created_at_column, id_column, cursor: Optional[str], limit: int):
+    """
+    Страница от новых записей к старым по ключу (created_at, id).
+
+    Вместо OFFSET запрос продолжается с позиции курсора, поэтому любая страница -
+    это чтение limit записей из индекса (владелец, created_at DESC, id DESC) независимо от
+    того, сколько записей у пользователя. id различает записи с одинаковым created_at.
+    Запрашивается limit + 1 запись, чтобы узнать, есть ли следующая страница
+    """
+    if cursor:
+        created_at, item_id = decode_cursor(cursor)
+        statement = statement.where(tuple_(created_at_column, id_column) < tuple_(created_at, item_id))
+
+    return statement.order_by(created_at_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+def split_page(rows: Sequence[Any], limit: int,
+               key: Callable[[Any], Tuple[datetime, uuid.UUID]] = lambda row: (row.created_at, row.id)
+               ) -> Tuple[list, Optional[str]]:
+    """Записи страницы и курсор следующей (None - если это последняя страница)"""
+    page = list(rows[:limit])
+    if len(rows) <= limit:
+        return page, None
+    return page, encode_cursor(*key(page[-1]))
@@ -0,0 +1,125 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Получатель событий работы (например, этапов пайплайна): имя события и данные
+EventListener = Callable[[str, dict], None]
+
+
+class ClientDisconnected(Exception):
+    """Клиент закрыл соединение, пока ждал результат"""
+
+
+class InFlightCall:
+    """
+    Выполняющийся пайплайн, число запросов, которые ждут его результат,
+    и события пайплайна. Присоединившийся позже получатель сначала
+    получает все уже опубликованные события
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.events: List[Tuple[str, dict]] = []
+        self.listeners: List[EventListener] = []
+
+    def publish(self, event: str, payload: dict) -> None:
+        self.events.append((event, payload))
+        for listener in list(self.listeners):
+            listener(event, payload)
+
+    def subscribe(self, listener: EventListener) -> None:
+        for event, payload in self.events:
+            listener(event, payload)
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener: EventListener) -> None:
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных запросов.
+
+    Первый запрос с ключом запускает работу, остальные с тем же ключом
+    присоединяются к ней и получают тот же результат. Работа отменяется,
+    только когда отключились все ожидающие клиенты.
+    Через один экземпляр идут все точки запуска генерации (синхронная,
+    потоковая и фоновые задачи), поэтому с одним ключом и одним чекпоинтом
+    одновременно выполняется не больше одного пайплайна.
+    """
+
+    def __init__(self, disconnect_poll_interval: float = 1.0):
+        self.disconnect_poll_interval = disconnect_poll_interval
+        self.calls: Dict[str, InFlightCall] = {}
+        self.coalesced_total = 0
+
+    def get(self, key: Optional[str]) -> Optional[InFlightCall]:
+        """Уже выполняющаяся работа с этим ключом"""
+        if key is None:
+            return None
+        return self.calls.get(key)
+
+    def start(self, key: Optional[str], factory: Callable[[InFlightCall], Awaitable[Any]]) -> InFlightCall:
+        """
+        Запускает работу или возвращает уже выполняющуюся с тем же ключом.
+        factory получает InFlightCall, чтобы публиковать события работы.
+        Работа без ключа не регистрируется - присоединиться к ней нельзя
+        """
+        call = self.get(key)
+        if call is not None:
+            self.coalesced_total += 1
+            print(f"Запрос присоединен к уже выполняющейся генерации ({call.waiters} ожидающих)")
+            return call
+
+        call = InFlightCall()
+        call.task = asyncio.create_task(factory(call))
+        if key is not None:
+            self.calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        return call
+
+    def join(self, call: InFlightCall) -> None:
+        call.waiters += 1
+
+    def leave(self, call: InFlightCall) -> None:
+        call.waiters -= 1
+        if call.waiters == 0 and not call.task.done():
+            print("Все клиенты отключились, отменяем генерацию")
+            call.task.cancel()
+
+    async def wait(self, call: InFlightCall,
+                   is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> Any:
+        """Ждет результат работы, пока клиент на связи"""
+        self.join(call)
+        try:
+            return await self._wait(call.task, is_disconnected)
+        finally:
+            self.leave(call)
+
+    async def _wait(self, task: asyncio.Task,
+                    is_disconnected: Optional[Callable[[], Awaitable[bool]]]) -> Any:
+        # shield: отмена одного ожидающего не должна отменять общую работу
+        if is_disconnected is None:
+            return await asyncio.shield(task)
+
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=self.disconnect_poll_interval)
+            if done:
+                return task.result()
+            if await is_disconnected():
+                raise ClientDisconnected()
+
+    def _forget(self, key: str, call: InFlightCall) -> None:
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+    def get_stats(self) -> dict:
+        return {
+            "in_flight": len(self.calls),
+            "waiters": sum(call.waiters for call in self.calls.values()),
+            "coalesced_total": self.coalesced_total,
+        }
+
+
+generation_single_flight = SingleFlight()
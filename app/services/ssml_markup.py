@@ -0,0 +1,214 @@
+"""
+Локальная разметка SSML по правилам, которые раньше описывались в промптах
+markup_prompt.py: <p> на абзац, <s> на предложение и реплику, паузы после
+точек и запятых, паузы вокруг диалогов. Используются только теги,
+поддерживаемые и Yandex SpeechKit, и Google Cloud TTS: <speak>, <p>, <s>, <break>.
+"""
+
+import re
+from xml.sax.saxutils import escape
+
+# Паузы в миллисекундах для каждого провайдера
+PAUSE_PROFILES = {
+    "yandex": {
+        "sentence": 1500,  # после точки и многоточия
+        "exclamation": 800,  # после ! и ?
+        "comma": 500,
+        "dialogue": 400,  # до и после реплики персонажа
+    },
+    "google": {
+        "sentence": 600,
+        "exclamation": 400,
+        "comma": 250,
+        "dialogue": 400,
+    },
+}
+
+# Сокращения, после которых точка не завершает предложение.
+# «т.д.», «т.п.» и «etc.» обычно стоят в конце предложения, поэтому их здесь нет:
+# перед заглавной буквой это граница, а перед строчной граница и так не ставится
+ABBREVIATIONS = {
+    "РУС": {"т.е", "т.к", "др", "пр", "г", "гг", "ул", "им", "см", "стр", "тыс", "млн", "руб", "коп"},
+    "ENG": {"mr", "mrs", "ms", "dr", "st", "prof", "sr", "jr", "vs", "e.g", "i.e", "mt"},
+    "FRA": {"m", "mme", "mlle", "dr", "st", "ste", "p.ex", "av", "bd"},
+}
+
+DASHES = "—–"
+OPENING_QUOTES = "«“„\"'"
+
+# Кандидат на границу предложения: знаки конца предложения (с закрывающими кавычками) и пробел
+SENTENCE_END_PATTERN = re.compile(r'([.!?…]+[»”"\')]*)(\s+)')
+
+# Реплики в кавычках
+QUOTED_PATTERN = re.compile(r'(«[^»]*»|“[^”]*”|„[^“”]*[“”]|"[^"]*")')
+
+# Смена реплики и слов автора в строке, начинающейся с тире: «— Привет! — сказал кот.»
+DASH_SWITCH_PATTERN = re.compile(r'(?<=[,.!?…])\s+(?=[%s]\s)' % DASHES)
+
+# Запятая внутри текста (не между цифрами)
+COMMA_PATTERN = re.compile(r',(?=\s)')
+
+
+def get_provider(language: str) -> str:
+    """Русский озвучивается через Yandex, остальные языки - через Google"""
+    return "yandex" if language == "РУС" else "google"
+
+
+def split_paragraphs(text: str) -> list[str]:
+    return [paragraph.strip() for paragraph in re.split(r'\n+', text) if paragraph.strip()]
+
+
+def is_sentence_start(text: str) -> bool:
+    """Начинается ли текст как новое предложение (с заглавной, цифры, кавычки или тире с заглавной)"""
+    text = text.lstrip()
+    if not text:
+        return False
+
+    if text[0] in DASHES:
+        text = text[1:].lstrip()
+        if not text:
+            return False
+
+    return text[0].isupper() or text[0].isdigit() or text[0] in OPENING_QUOTES
+
+
+def ends_with_abbreviation(text: str, language: str) -> bool:
+    match = re.search(r'(\w+(?:\.\w+)*)\.$', text)
+    if not match:
+        return False
+
+    word = match.group(1).lower()
+    # Одиночная заглавная буква - инициал
+    if len(word) == 1 and match.group(1).isupper() and language != "FRA":
+        return True
+
+    return word in ABBREVIATIONS.get(language, set())
+
+
+def split_sentences(paragraph: str, language: str) -> list[str]:
+    sentences = []
+    start = 0
+
+    for match in SENTENCE_END_PATTERN.finditer(paragraph):
+        end = match.end(1)
+        candidate = paragraph[start:end]
+
+        if not is_sentence_start(paragraph[match.end():]):
+            continue
+        if match.group(1).startswith(".") and ends_with_abbreviation(candidate, language):
+            continue
+
+        sentences.append(candidate.strip())
+        start = match.end()
+
+    tail = paragraph[start:].strip()
+    if tail:
+        sentences.append(tail)
+
+    return sentences
+
+
+def merge_punctuation_only(segments: list[tuple[str, bool]]) -> list[tuple[str, bool]]:
+    """Фрагменты из одной пунктуации приклеиваем к предыдущему, чтобы не терять знаки"""
+    merged = []
+    for text, is_dialogue in segments:
+        if merged and not re.search(r'\w', text):
+            previous_text, previous_dialogue = merged[-1]
+            merged[-1] = (f"{previous_text}{text}", previous_dialogue)
+        elif text:
+            merged.append((text, is_dialogue))
+    return merged
+
+
+def split_dialogue(sentence: str) -> list[tuple[str, bool]]:
+    """
+    Делит предложение на реплики персонажей и слова автора.
+    Возвращает список (текст, является_ли_репликой).
+    """
+    if QUOTED_PATTERN.search(sentence):
+        segments = []
+        position = 0
+        for match in QUOTED_PATTERN.finditer(sentence):
+            narration = sentence[position:match.start()].strip()
+            if narration:
+                segments.append((narration, False))
+            segments.append((match.group(0), True))
+            position = match.end()
+
+        tail = sentence[position:].strip()
+        if tail:
+            segments.append((tail, False))
+
+        return merge_punctuation_only(segments)
+
+    if sentence[0] in DASHES:
+        parts = DASH_SWITCH_PATTERN.split(sentence)
+        # Строка с тире начинается с реплики, дальше реплика и слова автора чередуются
+        return merge_punctuation_only([(part.strip(), i % 2 == 0) for i, part in enumerate(parts)])
+
+    return [(sentence, False)]
+
+
+def break_tag(milliseconds: int) -> str:
+    return f'<break time="{milliseconds}ms"/>'
+
+
+def add_break(parts: list[str], milliseconds: int) -> None:
+    """Добавляет паузу; подряд идущие паузы объединяются в одну, самую длинную"""
+    if parts and parts[-1].startswith("<break"):
+        previous = int(re.search(r'\d+', parts[-1]).group(0))
+        parts[-1] = break_tag(max(previous, milliseconds))
+    else:
+        parts.append(break_tag(milliseconds))
+
+
+def markup_segment(text: str, pauses: dict) -> str:
+    """Экранирует текст и расставляет паузы после запятых"""
+    return COMMA_PATTERN.sub(f",{break_tag(pauses['comma'])}", escape(text))
+
+
+def sentence_pause(text: str, pauses: dict) -> int:
+    stripped = text.rstrip('»”"\') ')
+    if stripped.endswith(("!", "?")):
+        return pauses["exclamation"]
+    return pauses["sentence"]
+
+
+def markup_paragraph(paragraph: str, language: str, pauses: dict) -> str:
+    parts = []
+
+    for sentence in split_sentences(paragraph, language):
+        segments = split_dialogue(sentence)
+
+        for i, (text, is_dialogue) in enumerate(segments):
+            is_last = i == len(segments) - 1
+
+            if is_dialogue and parts:
+                add_break(parts, pauses["dialogue"])
+
+            parts.append(f"<s>{markup_segment(text, pauses)}</s>")
+
+            if is_last:
+                pause = sentence_pause(text, pauses)
+                if is_dialogue:
+                    pause = max(pause, pauses["dialogue"])
+                add_break(parts, pause)
+            elif is_dialogue:
+                add_break(parts, pauses["dialogue"])
+
+    # Пауза после последнего предложения не нужна: ее дает сам <p>
+    if parts and parts[-1].startswith("<break"):
+        parts.pop()
+
+    return f"<p>{''.join(parts)}</p>"
+
+
+def build_ssml_markup(tale_text: str, language: str) -> str:
+    """
+    Детерминированная SSML разметка сказки для провайдера озвучки языка.
+    Выполняется за миллисекунды и не требует обращения к LLM.
+    """
+    pauses = PAUSE_PROFILES[get_provider(language)]
+    paragraphs = [markup_paragraph(paragraph, language, pauses) for paragraph in split_paragraphs(tale_text)]
+
+    return f"<speak>{''.join(paragraphs)}</speak>"
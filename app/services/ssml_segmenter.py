@@ -0,0 +1,204 @@
+"""
+Разбиение SSML разметки сказки на чанки для TTS.
+
+Абзацы <p> собираются в чанки за один проход: длина текущего чанка хранится
+числом, а части склеиваются один раз при выдаче чанка, поэтому время работы
+линейно по длине разметки. Абзац, который сам не помещается в чанк, делится
+на несколько абзацев по границам <s>, затем <s> - по паузам <break/>, и только
+в крайнем случае - по пробелам. Каждая часть оборачивается в те же открывающий
+и закрывающий теги, поэтому разметка остается корректной.
+"""
+
+import re
+from typing import Iterator, Optional
+
+SPEAK_WRAPPER_SIZE = len("<speak></speak>")
+
+P_PATTERN = re.compile(r'<p(?:\s[^>]*)?>.*?</p>', re.DOTALL | re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+ELEMENT_PATTERN = re.compile(r'^(<[^>]+>)(.*)(</[^>]+>)$', re.DOTALL)
+
+
+def remove_outer_speak_tags(ssml_text: str) -> str:
+    ssml_text = re.sub(r'^\s*<speak(?:\s[^>]*)?>', '', ssml_text.strip(), flags=re.IGNORECASE)
+    return re.sub(r'</speak>\s*$', '', ssml_text, flags=re.IGNORECASE).strip()
+
+
+def iter_nodes(content: str) -> Iterator[str]:
+    """
+    Узлы верхнего уровня: элементы целиком (<s>...</s>), одиночные теги (<break/>)
+    и текст между ними. Вложенность считается по парным тегам
+    """
+    depth = 0
+    node_start = 0
+    position = 0
+
+    for match in TAG_PATTERN.finditer(content):
+        tag = match.group(0)
+
+        if depth == 0 and match.start() > position:
+            yield content[position:match.start()]
+            node_start = match.start()
+
+        if tag.startswith("</"):
+            depth -= 1
+            if depth <= 0:
+                depth = 0
+                yield content[node_start:match.end()]
+                node_start = match.end()
+        elif tag.endswith("/>") or tag.startswith(("<?", "<!")):
+            if depth == 0:
+                yield tag
+                node_start = match.end()
+        else:
+            if depth == 0:
+                node_start = match.start()
+            depth += 1
+
+        position = match.end()
+
+    if depth:
+        # Незакрытый элемент - отдаем остаток как есть
+        yield content[node_start:]
+    elif position < len(content):
+        yield content[position:]
+
+
+def split_text(text: str, limit: int) -> Iterator[str]:
+    """Последний вариант: текст делится по пробелам, слово длиннее limit режется"""
+    piece_start = 0
+    last_space = -1
+
+    for i, char in enumerate(text):
+        if char.isspace():
+            last_space = i
+        if i + 1 - piece_start > limit:
+            if last_space == i:
+                # Лимит превысил сам пробел: часть заканчивается перед ним, пробел отбрасывается
+                yield text[piece_start:i]
+                piece_start = i + 1
+                continue
+            cut = last_space + 1 if last_space >= piece_start else i
+            yield text[piece_start:cut]
+            piece_start = cut
+
+    if piece_start < len(text):
+        yield text[piece_start:]
+
+
+def split_node(node: str, limit: int) -> Iterator[str]:
+    """Делит слишком длинный узел на части не длиннее limit"""
+    nodes = list(iter_nodes(node))
+    if len(nodes) > 1:
+        # Несколько узлов подряд (например, контент без <p>)
+        yield from pack_nodes(iter(nodes), limit)
+        return
+
+    if not node.startswith("<"):
+        yield from split_text(node, limit)
+        return
+
+    match = ELEMENT_PATTERN.match(node)
+    if match is None:
+        # Одиночный тег не делится
+        yield node
+        return
+
+    open_tag, inner, close_tag = match.groups()
+    inner_limit = limit - len(open_tag) - len(close_tag)
+    if inner_limit <= 0:
+        yield node
+        return
+
+    for piece in pack_nodes(iter_nodes(inner), inner_limit):
+        yield f"{open_tag}{piece}{close_tag}"
+
+
+def pack_nodes(nodes: Iterator[str], limit: int) -> Iterator[str]:
+    """Жадно собирает соседние узлы в части не длиннее limit, длинные узлы делит"""
+    parts: list[str] = []
+    size = 0
+
+    for node in nodes:
+        pieces = [node] if len(node) <= limit else split_node(node, limit)
+
+        for piece in pieces:
+            if parts and size + len(piece) > limit:
+                yield "".join(parts)
+                parts, size = [], 0
+            parts.append(piece)
+            size += len(piece)
+
+    if parts:
+        yield "".join(parts)
+
+
+class SSMLSegmenter:
+    """
+    Потоковая упаковка <p> блоков в чанки не длиннее max_chunk_size вместе с <speak>.
+
+    add() принимает очередной блок и возвращает чанки, которые уже заполнены,
+    finish() - последний чанк. Чанки отдаются без внешних <speak>
+    """
+
+    def __init__(self, max_chunk_size: int):
+        self.max_chunk_size = max_chunk_size
+        self.limit = max_chunk_size - SPEAK_WRAPPER_SIZE
+        self.blocks_count = 0
+        self.split_blocks_count = 0
+
+        self._parts: list[str] = []
+        self._size = 0
+
+    def add(self, block: str) -> list[str]:
+        self.blocks_count += 1
+        chunks = []
+
+        if len(block) > self.limit:
+            pieces = list(split_node(block, self.limit))
+            self.split_blocks_count += 1
+            print(f"Абзац {self.blocks_count} длиннее чанка ({len(block)} символов), "
+                  f"разделен на {len(pieces)} части")
+        else:
+            pieces = [block]
+
+        for piece in pieces:
+            if self._parts and self._size + len(piece) > self.limit:
+                chunks.append(self._flush())
+            self._parts.append(piece)
+            self._size += len(piece)
+
+        return chunks
+
+    def finish(self) -> Optional[str]:
+        return self._flush() if self._parts else None
+
+    def _flush(self) -> str:
+        chunk = "".join(self._parts)
+        self._parts, self._size = [], 0
+        return chunk
+
+
+def split_ssml(ssml_content: str, max_chunk_size: int) -> list[str]:
+    """
+    Делит SSML (без внешних <speak>) на чанки по <p> блокам.
+    Если <p> нет, весь контент делится по <s>, <break/> и пробелам
+    """
+    segmenter = SSMLSegmenter(max_chunk_size)
+    chunks = []
+
+    blocks_found = False
+    for match in P_PATTERN.finditer(ssml_content):
+        blocks_found = True
+        chunks.extend(segmenter.add(match.group(0)))
+
+    if not blocks_found:
+        print("Предупреждение: <p> теги не найдены, контент делится по предложениям")
+        return list(pack_nodes(iter_nodes(ssml_content), segmenter.limit)) if ssml_content else []
+
+    last_chunk = segmenter.finish()
+    if last_chunk:
+        chunks.append(last_chunk)
+
+    print(f"Найдено {segmenter.blocks_count} абзацев (<p> тегов), чанков: {len(chunks)}")
+    return chunks
@@ -0,0 +1,191 @@
+import threading
+from typing import Any, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from app.config import settings
+from app.services.blocking_io import run_blocking
+
+# Лимит delete_objects в S3 на один запрос
+DELETE_BATCH_SIZE = 1000
+
+
+def is_not_found(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "NotFound")
+
+
+class S3Storage:
+    """
+    Общий клиент Selectel S3 для всего приложения.
+
+    Один boto3 клиент (он потокобезопасен) с пулом max_pool_connections
+    соединений и повторами запросов вместо отдельных клиентов в каждом сервисе.
+    boto3 синхронный, поэтому все операции выполняются в пуле blocking_io
+    и не блокируют event loop. Клиент создается при первом обращении
+    под блокировкой: первое обращение может прийти сразу из нескольких потоков пула
+    """
+
+    def __init__(self, endpoint_url: str, region_name: str, bucket_name: str, domain: str,
+                 max_pool_connections: int, max_attempts: int):
+        self.endpoint_url = endpoint_url
+        self.region_name = region_name
+        self.bucket_name = bucket_name
+        self.domain = domain
+        self.max_pool_connections = max_pool_connections
+        self.max_attempts = max_attempts
+
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.requests_total: dict[str, int] = {}
+        self.errors_total = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = boto3.client(
+                        's3',
+                        endpoint_url=self.endpoint_url,
+                        aws_access_key_id=settings.selectel_access_key,
+                        aws_secret_access_key=settings.selectel_secret_key,
+                        region_name=self.region_name,
+                        config=Config(
+                            s3={'addressing_style': 'virtual'},
+                            max_pool_connections=self.max_pool_connections,
+                            retries={'max_attempts': self.max_attempts, 'mode': 'standard'}
+                        )
+                    )
+        return self._client
+
+    def public_url(self, key: str) -> str:
+        return f"{self.domain}/{key}"
+
+    async def _call(self, operation: str, **kwargs) -> Any:
+        self.requests_total[operation] = self.requests_total.get(operation, 0) + 1
+        try:
+            return await run_blocking(getattr(self.client, operation), Bucket=self.bucket_name, **kwargs)
+        except Exception as e:
+            # Отсутствие объекта - обычный ответ, а не сбой хранилища
+            if not (isinstance(e, ClientError) and is_not_found(e)):
+                self.errors_total += 1
+            raise
+
+    async def put_object(self, key: str, body, content_type: Optional[str] = None,
+                         public: bool = False, metadata: Optional[dict] = None) -> None:
+        params = {"Key": key, "Body": body}
+        if content_type:
+            params["ContentType"] = content_type
+        if public:
+            params["ACL"] = 'public-read'
+        if metadata:
+            params["Metadata"] = metadata
+        await self._call("put_object", **params)
+
+    async def get_object(self, key: str) -> Optional[tuple[bytes, dict]]:
+        """Содержимое и метаданные объекта, None - если объекта нет"""
+        def read_object():
+            response = self.client.get_object(Bucket=self.bucket_name, Key=key)
+            return response["Body"].read(), response.get("Metadata", {})
+
+        self.requests_total["get_object"] = self.requests_total.get("get_object", 0) + 1
+        try:
+            return await run_blocking(read_object)
+        except ClientError as e:
+            if is_not_found(e):
+                return None
+            self.errors_total += 1
+            raise
+
+    async def head_object(self, key: str) -> Optional[dict]:
+        """Размер, тип и метаданные объекта без скачивания, None - если объекта нет"""
+        try:
+            return await self._call("head_object", Key=key)
+        except ClientError as e:
+            if is_not_found(e):
+                return None
+            raise
+
+    async def delete_object(self, key: str) -> None:
+        await self._call("delete_object", Key=key)
+
+    async def delete_objects(self, keys: list[str]) -> None:
+        """Удаление пачками по DELETE_BATCH_SIZE ключей"""
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[start:start + DELETE_BATCH_SIZE]
+            await self._call(
+                "delete_objects",
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+            )
+
+    async def list_keys(self, prefix: str) -> list[str]:
+        keys = []
+        continuation_token = None
+
+        while True:
+            params = {"Prefix": prefix}
+            if continuation_token:
+                params["ContinuationToken"] = continuation_token
+            response = await self._call("list_objects_v2", **params)
+
+            keys.extend(item["Key"] for item in response.get("Contents", []))
+            if not response.get("IsTruncated"):
+                return keys
+            continuation_token = response["NextContinuationToken"]
+
+    async def delete_prefix(self, prefix: str) -> None:
+        keys = await self.list_keys(prefix)
+        if keys:
+            await self.delete_objects(keys)
+
+    async def create_multipart_upload(self, key: str, content_type: Optional[str] = None,
+                                      public: bool = False) -> str:
+        params = {"Key": key}
+        if content_type:
+            params["ContentType"] = content_type
+        if public:
+            params["ACL"] = 'public-read'
+        response = await self._call("create_multipart_upload", **params)
+        return response["UploadId"]
+
+    async def upload_part(self, key: str, upload_id: str, part_number: int, body: bytes) -> dict:
+        response = await self._call(
+            "upload_part",
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=body
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    async def complete_multipart_upload(self, key: str, upload_id: str, parts: list[dict]) -> None:
+        await self._call(
+            "complete_multipart_upload",
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": sorted(parts, key=lambda part: part["PartNumber"])}
+        )
+
+    async def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        await self._call("abort_multipart_upload", Key=key, UploadId=upload_id)
+
+    def get_stats(self) -> dict:
+        return {
+            "bucket": self.bucket_name,
+            "max_pool_connections": self.max_pool_connections,
+            "max_attempts": self.max_attempts,
+            "requests_total": dict(self.requests_total),
+            "errors_total": self.errors_total,
+        }
+
+
+s3_storage = S3Storage(
+    endpoint_url=settings.selectel_endpoint_url,
+    region_name=settings.selectel_region,
+    bucket_name=settings.selectel_bucket_name,
+    domain=settings.selectel_domain,
+    max_pool_connections=settings.s3_max_pool_connections,
+    max_attempts=settings.s3_max_attempts
+)
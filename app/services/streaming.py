@@ -0,0 +1,146 @@
+import json
+import re
+from typing import Any
+
+# Однобуквенные escape-последовательности JSON
+JSON_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+
+
+class JsonStringFieldExtractor:
+    """
+    Инкрементально извлекает значение строкового поля из JSON,
+    который приходит от LLM по кусочкам (stream=True).
+
+    feed() принимает очередной фрагмент ответа и возвращает только
+    новые раскодированные символы значения поля.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.value = ""
+        self.finished = False
+
+        self._key_pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._started = False
+
+    def feed(self, chunk: str) -> str:
+        if self.finished:
+            return ""
+
+        self._buffer += chunk
+
+        # Ищем начало значения: "field": "
+        if not self._started:
+            match = self._key_pattern.search(self._buffer)
+            if not match:
+                return ""
+            self._started = True
+            self._buffer = self._buffer[match.end():]
+
+        decoded = []
+        buffer = self._buffer
+        i = 0
+
+        while i < len(buffer):
+            char = buffer[i]
+
+            if char == '"':
+                # Конец строкового значения
+                self.finished = True
+                i += 1
+                break
+
+            if char != '\\':
+                decoded.append(char)
+                i += 1
+                continue
+
+            # Escape-последовательность может быть разрезана между фрагментами
+            if i + 1 >= len(buffer):
+                break
+
+            escape = buffer[i + 1]
+            if escape != 'u':
+                decoded.append(JSON_ESCAPES.get(escape, escape))
+                i += 2
+                continue
+
+            if i + 6 > len(buffer):
+                break
+
+            code = int(buffer[i + 2:i + 6], 16)
+            if 0xD800 <= code <= 0xDBFF:
+                # Суррогатная пара: ждем вторую половину \uXXXX
+                if i + 12 > len(buffer):
+                    break
+                low = int(buffer[i + 8:i + 12], 16)
+                code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                i += 12
+            else:
+                i += 6
+
+            decoded.append(chr(code))
+
+        self._buffer = buffer[i:]
+
+        text = "".join(decoded)
+        self.value += text
+        return text
+
+
+def format_sse_event(event: str, data: Any) -> str:
+    """Форматирует событие Server-Sent Events"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class SSMLParagraphSplitter:
+    """
+    Инкрементально выделяет завершенные <p>...</p> блоки из SSML разметки,
+    которая приходит от LLM по кусочкам.
+
+    feed() возвращает блоки, закрывающий тег которых уже получен.
+    finish() вызывается после окончания потока: если в разметке не оказалось
+    ни одного <p>, весь контент (без внешних <speak>) возвращается одним блоком.
+    """
+
+    P_PATTERN = re.compile(r'<p(?:\s[^>]*)?>.*?</p>', re.DOTALL | re.IGNORECASE)
+
+    def __init__(self):
+        self.blocks_count = 0
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        self._buffer += text
+
+        blocks = []
+        last_end = 0
+        for match in self.P_PATTERN.finditer(self._buffer):
+            blocks.append(match.group(0))
+            last_end = match.end()
+
+        if blocks:
+            self._buffer = self._buffer[last_end:]
+            self.blocks_count += len(blocks)
+
+        return blocks
+
+    def finish(self) -> list[str]:
+        if self.blocks_count:
+            return []
+
+        content = re.sub(r'^\s*<speak[^>]*>', '', self._buffer.strip(), flags=re.IGNORECASE)
+        content = re.sub(r'</speak>\s*$', '', content, flags=re.IGNORECASE).strip()
+        self._buffer = ""
+
+        return [content] if content else []
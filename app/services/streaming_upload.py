@@ -0,0 +1,127 @@
+from typing import Optional
+
+from app.config import settings
+from app.services import mp3
+from app.services.storage import S3Storage
+
+# Минимальный размер части multipart загрузки в S3 (кроме последней)
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class PartBuffer:
+    """Приемник байтов для Mp3StreamWriter: накапливает данные до отправки очередной части"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data) -> int:
+        self.data += data
+        return len(data)
+
+    def take(self, size: int) -> bytes:
+        part = bytes(self.data[:size])
+        del self.data[:size]
+        return part
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+class StreamingMp3Upload:
+    """
+    Загрузка MP3 в S3 по мере озвучки.
+
+    Чанки склеиваются по фреймам (mp3.Mp3StreamWriter), и каждые part_size байт
+    сразу уходят в S3 очередной частью multipart загрузки, поэтому загрузка идет
+    параллельно с озвучкой, а в памяти держится не больше пары частей.
+    Первая часть начинается с Xing/Info фрейма, который известен только в конце,
+    поэтому она хранится до complete и отправляется последней (S3 собирает файл
+    по номерам частей, а не по порядку загрузки). Если аудио меньше двух частей,
+    multipart не открывается и файл загружается одним put_object
+    """
+
+    def __init__(self, storage: S3Storage, key: str,
+                 content_type: str = "audio/mpeg", part_size: Optional[int] = None):
+        self.storage = storage
+        self.key = key
+        self.content_type = content_type
+        self.part_size = max(S3_MIN_PART_SIZE, part_size or settings.s3_multipart_part_size)
+
+        self.buffer = PartBuffer()
+        self.writer = mp3.Mp3StreamWriter(self.buffer)
+        self.first_part: Optional[bytes] = None
+
+        self.upload_id: Optional[str] = None
+        self.parts: list[dict] = []
+
+    @property
+    def duration(self) -> float:
+        return self.writer.duration
+
+    async def add_chunk(self, data: bytes) -> float:
+        """Дописывает чанк и отправляет накопившиеся полные части"""
+        chunk_duration = self.writer.add_chunk(data)
+
+        if self.first_part is None and len(self.buffer) >= self.part_size:
+            self.first_part = self.buffer.take(self.part_size)
+
+        while self.first_part is not None and len(self.buffer) >= self.part_size:
+            await self._upload_part(self.buffer.take(self.part_size))
+
+        return chunk_duration
+
+    async def _upload_part(self, body: bytes, part_number: Optional[int] = None) -> None:
+        if self.upload_id is None:
+            self.upload_id = await self.storage.create_multipart_upload(
+                self.key, content_type=self.content_type, public=True
+            )
+
+        # Номер 1 зарезервирован за первой частью с Xing/Info фреймом
+        part_number = part_number or len(self.parts) + 2
+        self.parts.append(await self.storage.upload_part(self.key, self.upload_id, part_number, body))
+
+    def _with_info_frame(self, head: bytes) -> bytes:
+        info_frame = self.writer.build_info_frame()
+        return info_frame + head[len(info_frame):]
+
+    async def complete(self) -> str:
+        """Отправляет оставшиеся данные и первую часть, возвращает ключ файла в S3"""
+        if self.writer.template is None:
+            raise ValueError("В чанках нет ни одного MP3 фрейма")
+
+        try:
+            if self.upload_id is None:
+                # Аудио меньше двух частей - одна обычная загрузка
+                body = self._with_info_frame((self.first_part or b"") + self.buffer.take(len(self.buffer)))
+                await self.storage.put_object(self.key, body, content_type=self.content_type, public=True)
+                return self.key
+
+            if len(self.buffer):
+                await self._upload_part(self.buffer.take(len(self.buffer)))
+            await self._upload_part(self._with_info_frame(self.first_part), part_number=1)
+
+            await self.storage.complete_multipart_upload(self.key, self.upload_id, self.parts)
+            print(f"Аудио загружено в S3 частями: {len(self.parts)}")
+            return self.key
+
+        except BaseException:
+            await self.abort()
+            raise
+
+    async def abort(self) -> None:
+        """Отменяет незавершенную multipart загрузку, чтобы S3 не хранил загруженные части"""
+        if self.upload_id is None:
+            return
+
+        upload_id, self.upload_id = self.upload_id, None
+        try:
+            await self.storage.abort_multipart_upload(self.key, upload_id)
+        except Exception as e:
+            print(f"Не удалось отменить multipart загрузку {self.key}: {e}")
+
+    async def __aenter__(self) -> "StreamingMp3Upload":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            await self.abort()
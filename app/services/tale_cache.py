@@ -0,0 +1,113 @@
+import hashlib
+import json
+from typing import Optional
+
+from cachetools import TTLCache
+
+from app.config import settings
+from app.schemas import Questionnaire
+
+
+class CachedTale:
+    """Готовая сказка: текст, разметка и загруженное аудио"""
+
+    def __init__(self, title: str, tale_text: str, markup_text: str, audio_url: str, duration: float):
+        self.title = title
+        self.tale_text = tale_text
+        self.markup_text = markup_text
+        self.audio_url = audio_url
+        self.duration = duration
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.tale_text.encode("utf-8")) + len(self.markup_text.encode("utf-8"))
+
+    def to_audio_data(self) -> dict:
+        return {
+            "url": self.audio_url,
+            "duration": self.duration,
+            "service": "tale_cache"
+        }
+
+
+def normalize_text(value: str) -> str:
+    return " ".join(str(value).split()).casefold()
+
+
+def normalize_list(values: list) -> list:
+    return sorted({normalize_text(value) for value in values if str(value).strip()})
+
+
+def questionnaire_cache_key(data: Questionnaire) -> str:
+    """
+    Канонический хеш анкеты. Порядок элементов списков, регистр и лишние
+    пробелы не влияют на ключ, возраст учитывается только в полных годах.
+    """
+    normalized = {
+        "age_years": data.age_years,
+        "interest_category": normalize_list(data.interest_category),
+        "subcategories": normalize_list(data.subcategories),
+        "target_words": normalize_list(data.target_words),
+        "soft_skills": normalize_list(data.soft_skills),
+        "ethnography_choice": normalize_text(data.ethnography_choice),
+        "story_duration_minutes": data.story_duration_minutes,
+        "language": data.language.value,
+        "gender": data.gender.value,
+        "expressive_markup": data.expressive_markup,
+    }
+
+    payload = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TaleCache:
+    """
+    Кэш готовых сказок по хешу анкеты.
+
+    Записи живут ttl_seconds, при превышении max_size_bytes вытесняются
+    давно не использованные (LRU). Попадание в кэш пропускает генерацию,
+    разметку и озвучку целиком.
+    """
+
+    def __init__(self, enabled: bool, ttl_seconds: int, max_size_bytes: int):
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._cache = TTLCache(
+            maxsize=max_size_bytes,
+            ttl=ttl_seconds,
+            getsizeof=lambda entry: entry.size_bytes
+        )
+
+    def get(self, data: Questionnaire) -> Optional[CachedTale]:
+        if not self.enabled:
+            return None
+
+        entry = self._cache.get(questionnaire_cache_key(data))
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, data: Questionnaire, entry: CachedTale) -> None:
+        if not self.enabled or entry.size_bytes > self._cache.maxsize:
+            return
+        self._cache[questionnaire_cache_key(data)] = entry
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._cache),
+            "size_bytes": self._cache.currsize,
+            "max_size_bytes": self._cache.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+tale_cache = TaleCache(
+    enabled=settings.tale_cache_enabled,
+    ttl_seconds=settings.tale_cache_ttl_seconds,
+    max_size_bytes=settings.tale_cache_max_size_mb * 1024 * 1024
+)
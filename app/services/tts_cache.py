@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import json
+import os
+import struct
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from app.config import settings
+from app.services.blocking_io import run_blocking
+from app.services.metrics import TTS_CACHE_REQUESTS
+from app.services.storage import s3_storage
+
+# В начале файла на диске - длительность чанка (double), дальше аудио
+DURATION_HEADER = struct.Struct(">d")
+
+
+def tts_cache_key(ssml_chunk: str, provider: str, **params) -> str:
+    """Хеш SSML чанка вместе со всеми параметрами, от которых зависит звук"""
+    payload = json.dumps(
+        {"ssml": ssml_chunk, "provider": provider, "params": params},
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSChunkCache:
+    """
+    Кэш озвученных чанков по содержимому.
+
+    Одинаковый SSML с тем же голосом и параметрами звука всегда дает одно и то же
+    аудио, поэтому повтор после сбоя, продолжения с похожим текстом и перегенерации
+    берут готовый чанк вместо запроса к Yandex/Google.
+    Два уровня:
+    - локальный диск с вытеснением давно не использованных файлов (LRU) при
+      превышении max_size_bytes;
+    - S3 (если включен) - общий для всех инстансов, найденный там чанк
+      копируется на диск.
+    """
+
+    def __init__(self, enabled: bool, directory: str, max_size_bytes: int, s3_enabled: bool):
+        self.enabled = enabled
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self.s3_enabled = s3_enabled
+
+        # Ключ -> размер файла, от давно использованных к недавним
+        self._index: Optional[OrderedDict[str, int]] = None
+        self._index_lock = asyncio.Lock()
+        self.size_bytes = 0
+        self.hits = {"disk": 0, "s3": 0}
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    @staticmethod
+    def _s3_key(key: str) -> str:
+        return f"tts-cache/{key}"
+
+    def _scan(self) -> OrderedDict:
+        """Восстанавливает индекс по файлам на диске, порядок LRU - по времени последнего доступа"""
+        entries = []
+        os.makedirs(self.directory, exist_ok=True)
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+
+        return OrderedDict((name, size) for _, name, size in sorted(entries))
+
+    async def _get_index(self) -> OrderedDict:
+        async with self._index_lock:
+            if self._index is None:
+                self._index = await run_blocking(self._scan)
+                self.size_bytes = sum(self._index.values())
+                print(f"Кэш озвучки: {len(self._index)} чанков, {self.size_bytes // (1024 * 1024)} МБ")
+        return self._index
+
+    async def start(self) -> None:
+        if self.enabled:
+            await self._get_index()
+
+    def _read_file(self, key: str) -> tuple[bytes, float]:
+        path = self._path(key)
+        with open(path, "rb") as file:
+            data = file.read()
+        # mtime отмечает последнее использование - по нему строится LRU после перезапуска
+        os.utime(path)
+        (duration,) = DURATION_HEADER.unpack_from(data)
+        return data[DURATION_HEADER.size:], duration
+
+    def _write_file(self, key: str, audio_data: bytes, duration: float) -> int:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(DURATION_HEADER.pack(duration))
+            file.write(audio_data)
+        os.replace(temp_path, path)
+        return DURATION_HEADER.size + len(audio_data)
+
+    def _remove_files(self, keys: list[str]) -> None:
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    async def _get_from_disk(self, key: str) -> Optional[tuple[bytes, float]]:
+        index = await self._get_index()
+        if key not in index:
+            return None
+
+        index.move_to_end(key)
+        try:
+            return await run_blocking(self._read_file, key)
+        except (OSError, struct.error) as e:
+            print(f"Не удалось прочитать чанк из кэша озвучки: {e}")
+            self.size_bytes -= index.pop(key, 0)
+            return None
+
+    async def _put_to_disk(self, key: str, audio_data: bytes, duration: float) -> None:
+        index = await self._get_index()
+        size = await run_blocking(self._write_file, key, audio_data, duration)
+
+        self.size_bytes += size - index.pop(key, 0)
+        index[key] = size
+
+        # Вытесняем давно не использованные чанки
+        evicted = []
+        while self.size_bytes > self.max_size_bytes and len(index) > 1:
+            old_key, old_size = index.popitem(last=False)
+            self.size_bytes -= old_size
+            evicted.append(old_key)
+
+        if evicted:
+            await run_blocking(self._remove_files, evicted)
+
+    async def get(self, key: str, provider: str) -> Optional[tuple[bytes, float]]:
+        if not self.enabled:
+            return None
+
+        try:
+            cached = await self._get_from_disk(key)
+        except Exception as e:
+            print(f"Кэш озвучки на диске недоступен: {e}")
+            cached = None
+
+        if cached is not None:
+            self._count(provider, "disk")
+            return cached
+
+        if self.s3_enabled:
+            try:
+                stored = await s3_storage.get_object(self._s3_key(key))
+            except Exception as e:
+                print(f"Не удалось прочитать чанк из кэша озвучки в S3: {e}")
+                stored = None
+
+            if stored is not None:
+                audio_data, metadata = stored
+                duration = float(metadata.get("duration", 0.0))
+                try:
+                    await self._put_to_disk(key, audio_data, duration)
+                except Exception as e:
+                    print(f"Не удалось сохранить чанк в кэш озвучки: {e}")
+                self._count(provider, "s3")
+                return audio_data, duration
+
+        self._count(provider, "miss")
+        return None
+
+    async def put(self, key: str, audio_data: bytes, duration: float) -> None:
+        """Сбой записи в кэш не должен прерывать озвучку"""
+        if not self.enabled:
+            return
+
+        try:
+            await self._put_to_disk(key, audio_data, duration)
+        except Exception as e:
+            print(f"Не удалось сохранить чанк в кэш озвучки: {e}")
+
+        if self.s3_enabled:
+            try:
+                await s3_storage.put_object(
+                    self._s3_key(key),
+                    audio_data,
+                    metadata={"duration": str(duration)}
+                )
+            except Exception as e:
+                print(f"Не удалось сохранить чанк в кэш озвучки в S3: {e}")
+
+    async def get_or_synthesize(self, key: str, provider: str,
+                                synthesize: Callable[[], Awaitable[tuple[bytes, float]]]) -> tuple[bytes, float]:
+        """Готовый чанк из кэша или озвучка с сохранением результата"""
+        cached = await self.get(key, provider)
+        if cached is not None:
+            return cached
+
+        audio_data, duration = await synthesize()
+        await self.put(key, audio_data, duration)
+        return audio_data, duration
+
+    def _count(self, provider: str, result: str) -> None:
+        if result == "miss":
+            self.misses += 1
+        else:
+            self.hits[result] += 1
+        TTS_CACHE_REQUESTS.inc(provider=provider, result=result)
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "s3_enabled": self.s3_enabled,
+            "entries": len(self._index) if self._index is not None else None,
+            "size_bytes": self.size_bytes,
+            "max_size_bytes": self.max_size_bytes,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+        }
+
+
+tts_chunk_cache = TTSChunkCache(
+    enabled=settings.tts_cache_enabled,
+    directory=settings.tts_cache_dir,
+    max_size_bytes=settings.tts_cache_max_size_mb * 1024 * 1024,
+    s3_enabled=settings.tts_cache_s3_enabled
+)
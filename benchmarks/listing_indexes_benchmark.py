@@ -0,0 +1,158 @@
+"""
+EXPLAIN до и после составных индексов для выборок списков (миграция 7d2a9c41e5b8).
+
+В отдельной схеме создаются таблицы user/collection/story с прежними индексами
+(только первичные ключи и ix_*_id), заполняются синтетическими данными
+(по умолчанию миллион сказок), и для запросов главной страницы и страницы
+коллекции печатается EXPLAIN (ANALYZE, BUFFERS) без новых индексов и с ними.
+Рабочие таблицы не затрагиваются, схема удаляется в конце (кроме --keep).
+
+Нужен PostgreSQL 13+ (gen_random_uuid). Запуск из корня репозитория:
+    python -m benchmarks.listing_indexes_benchmark --database-url postgresql+asyncpg://...
+Без --database-url берется DATABASE_URL из окружения.
+"""
+
+import argparse
+import asyncio
+import os
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+SCHEMA = "listing_indexes_benchmark"
+
+CREATE_TABLES = [
+    f'CREATE SCHEMA {SCHEMA}',
+    f'''CREATE TABLE {SCHEMA}."user" (
+        id uuid PRIMARY KEY,
+        created_at timestamp NOT NULL
+    )''',
+    f'''CREATE TABLE {SCHEMA}.collection (
+        id uuid PRIMARY KEY,
+        created_at timestamp NOT NULL,
+        title varchar(50) NOT NULL,
+        total_Listening_time integer NOT NULL,
+        user_id uuid NOT NULL REFERENCES {SCHEMA}."user" (id)
+    )''',
+    f'''CREATE TABLE {SCHEMA}.story (
+        id uuid PRIMARY KEY,
+        created_at timestamp NOT NULL,
+        title varchar(50) NOT NULL,
+        content_story text,
+        duration_seconds integer NOT NULL,
+        user_id uuid NOT NULL REFERENCES {SCHEMA}."user" (id),
+        collection_id uuid NOT NULL REFERENCES {SCHEMA}.collection (id)
+    )''',
+    # Индексы из первоначальной миграции 651c507b2b07
+    f'CREATE INDEX ix_user_id ON {SCHEMA}."user" (id)',
+    f'CREATE INDEX ix_collection_id ON {SCHEMA}.collection (id)',
+    f'CREATE INDEX ix_story_id ON {SCHEMA}.story (id)',
+]
+
+# Коллекция n принадлежит пользователю n % users, сказка n - коллекции n % collections
+SEED = [
+    '''INSERT INTO {schema}."user" (id, created_at)
+       SELECT gen_random_uuid(), now() - random() * interval '365 days'
+       FROM generate_series(1, :users)''',
+    '''INSERT INTO {schema}.collection (id, created_at, title, total_Listening_time, user_id)
+       SELECT gen_random_uuid(), now() - random() * interval '365 days', 'Коллекция ' || n, 0, u.id
+       FROM generate_series(0, :collections - 1) AS n
+       JOIN (SELECT id, row_number() OVER (ORDER BY id) - 1 AS rn FROM {schema}."user") AS u
+         ON u.rn = n % :users''',
+    '''INSERT INTO {schema}.story (id, created_at, title, content_story, duration_seconds, user_id, collection_id)
+       SELECT gen_random_uuid(), now() - random() * interval '365 days', 'Сказка ' || n,
+              repeat('Жил-был маленький лисенок. ', 40), 600 + (random() * 1800)::int, c.user_id, c.id
+       FROM generate_series(0, :stories - 1) AS n
+       JOIN (SELECT id, user_id, row_number() OVER (ORDER BY id) - 1 AS rn FROM {schema}.collection) AS c
+         ON c.rn = n % :collections''',
+]
+
+LISTING_INDEXES = [
+    'CREATE INDEX CONCURRENTLY ix_story_user_id_created_at ON {schema}.story (user_id, created_at DESC, id DESC)',
+    ('CREATE INDEX CONCURRENTLY ix_story_collection_id_created_at '
+     'ON {schema}.story (collection_id, created_at DESC, id DESC)'),
+    ('CREATE INDEX CONCURRENTLY ix_collection_user_id_created_at '
+     'ON {schema}.collection (user_id, created_at DESC, id DESC)'),
+]
+
+# Те же запросы, что строят home.py и collections_detail.py для первой страницы
+# (page_size_default + 1 запись). Значения (UUID из таблиц) подставляются в текст:
+# EXPLAIN не всегда принимает параметры запроса
+QUERIES = {
+    "home: коллекции": ("SELECT * FROM {schema}.collection WHERE user_id = '{user_id}' "
+                        "ORDER BY created_at DESC, id DESC LIMIT 21"),
+    "home: сказки": ("SELECT * FROM {schema}.story WHERE user_id = '{user_id}' "
+                     "ORDER BY created_at DESC, id DESC LIMIT 21"),
+    "коллекция: сказки": ("SELECT * FROM {schema}.story WHERE collection_id = '{collection_id}' "
+                          "ORDER BY created_at DESC, id DESC LIMIT 21"),
+}
+
+
+def sql(statement: str, **values):
+    return text(statement.format(schema=SCHEMA, **values))
+
+
+async def explain_all(connection, params: dict) -> dict:
+    plans = {}
+    for name, query in QUERIES.items():
+        result = await connection.execute(sql(f"EXPLAIN (ANALYZE, BUFFERS) {query}", **params))
+        plans[name] = [row[0] for row in result]
+    return plans
+
+
+def print_plans(title: str, plans: dict) -> None:
+    print(f"\n===== {title} =====")
+    for name, lines in plans.items():
+        print(f"\n--- {name}")
+        print("\n".join(lines))
+
+
+async def main(args) -> None:
+    engine = create_async_engine(args.database_url, isolation_level="AUTOCOMMIT")
+
+    try:
+        async with engine.connect() as connection:
+            await connection.execute(sql("DROP SCHEMA IF EXISTS {schema} CASCADE"))
+            for statement in CREATE_TABLES:
+                await connection.execute(text(statement))
+
+            print(f"Заполнение: {args.users} пользователей, {args.collections} коллекций, {args.stories} сказок")
+            sizes = {"users": args.users, "collections": args.collections, "stories": args.stories}
+            for statement in SEED:
+                await connection.execute(sql(statement), sizes)
+            await connection.execute(sql("ANALYZE {schema}.collection"))
+            await connection.execute(sql("ANALYZE {schema}.story"))
+
+            # Случайные пользователь и коллекция - у всех примерно одинаковое число записей
+            row = (await connection.execute(sql(
+                "SELECT user_id, collection_id FROM {schema}.story ORDER BY random() LIMIT 1"
+            ))).one()
+            params = {"user_id": row.user_id, "collection_id": row.collection_id}
+
+            print_plans("без составных индексов", await explain_all(connection, params))
+
+            for statement in LISTING_INDEXES:
+                await connection.execute(sql(statement))
+            await connection.execute(sql("ANALYZE {schema}.collection"))
+            await connection.execute(sql("ANALYZE {schema}.story"))
+
+            print_plans("с составными индексами", await explain_all(connection, params))
+
+            if not args.keep:
+                await connection.execute(sql("DROP SCHEMA {schema} CASCADE"))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--collections", type=int, default=100_000)
+    parser.add_argument("--stories", type=int, default=1_000_000)
+    parser.add_argument("--keep", action="store_true", help="не удалять схему с данными")
+    arguments = parser.parse_args()
+
+    if not arguments.database_url:
+        parser.error("нужен --database-url или DATABASE_URL")
+    asyncio.run(main(arguments))
@@ -0,0 +1,144 @@
+"""
+Бенчмарк выборки превью сказок: полные ORM объекты Story против колонок превью.
+
+В отдельной схеме (schema_translate_map, таблицы из app.models) создается
+пользователь с 200 сказками по 30 минут. Затем одна и та же выборка сказок
+пользователя выполняется двумя способами:
+- select(Story) и scalars().all(), как было до проекции;
+- select(*STORY_PREVIEW_COLUMNS) и all(), как сейчас в home.py и collections_detail.py.
+
+Для каждого способа печатается медиана времени и объем полученных данных.
+Объем считается на клиенте по длине значений в UTF-8, то есть по тексту, который
+драйвер получил от сервера. Это оценка, а не подсчет байтов протокола.
+Рабочие таблицы не затрагиваются, схема удаляется в конце (кроме --keep).
+
+Запуск из корня репозитория:
+    python -m benchmarks.preview_projection_benchmark --database-url postgresql+asyncpg://...
+Без --database-url берется DATABASE_URL из окружения.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel, select
+
+from app.models import STORY_PREVIEW_COLUMNS, Collection, Story, User
+
+SCHEMA = "preview_projection_benchmark"
+
+# Около 130 слов в минуту при спокойном чтении сказки
+WORDS_PER_MINUTE = 130
+WORDS = ("жил был маленький лисенок который очень любил смотреть на звезды "
+         "однажды вечером он вышел на поляну и увидел что луна светит ярче обычного").split()
+
+
+def make_story_text(minutes: int, rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(minutes * WORDS_PER_MINUTE))
+
+
+def payload_size(rows) -> int:
+    """Объем значений в строках результата или ORM объектах (UTF-8)"""
+    size = 0
+    for row in rows:
+        values = row.model_dump().values() if isinstance(row, SQLModel) else row
+        size += sum(len(str(value).encode("utf-8")) for value in values if value is not None)
+    return size
+
+
+async def seed(session_factory, stories: int, minutes: int):
+    rng = random.Random(1)
+    now = datetime.now()
+
+    async with session_factory() as session:
+        user = User()
+        collection = Collection(title="Бенчмарк", user_id=user.id)
+        session.add(user)
+        session.add(collection)
+        await session.flush()
+
+        for n in range(stories):
+            session.add(Story(
+                title=f"Сказка {n}",
+                content_story=make_story_text(minutes, rng),
+                audio_url=f"https://example.com/audio/{n}.mp3",
+                duration_seconds=minutes * 60,
+                age_in_months=60,
+                interests=["космос", "животные", "приключения"],
+                user_id=user.id,
+                collection_id=collection.id,
+                created_at=now - timedelta(minutes=n)
+            ))
+        await session.commit()
+        return user.id
+
+
+async def measure(session_factory, load, repeats: int):
+    timings = []
+    rows = []
+    for _ in range(repeats):
+        async with session_factory() as session:
+            start = time.perf_counter()
+            rows = await load(session)
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings), rows
+
+
+async def main(args) -> None:
+    engine = create_async_engine(args.database_url).execution_options(schema_translate_map={None: SCHEMA})
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    tables = [User.__table__, Collection.__table__, Story.__table__]
+
+    try:
+        async with engine.begin() as connection:
+            await connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+            await connection.run_sync(lambda sync_connection: SQLModel.metadata.create_all(
+                sync_connection, tables=tables
+            ))
+
+        print(f"Заполнение: {args.stories} сказок по {args.minutes} мин")
+        user_id = await seed(session_factory, args.stories, args.minutes)
+
+        async def load_full(session):
+            result = await session.execute(
+                select(Story).where(Story.user_id == user_id).order_by(Story.created_at.desc())
+            )
+            return result.scalars().all()
+
+        async def load_preview(session):
+            result = await session.execute(
+                select(*STORY_PREVIEW_COLUMNS).where(Story.user_id == user_id).order_by(Story.created_at.desc())
+            )
+            return result.all()
+
+        print(f"{'выборка':<22}{'медиана, мс':>14}{'строк':>8}{'данных, КБ':>14}")
+        for label, load in (("select(Story)", load_full), ("колонки превью", load_preview)):
+            median, rows = await measure(session_factory, load, args.repeats)
+            print(f"{label:<22}{median * 1000:>14.2f}{len(rows):>8}{payload_size(rows) / 1024:>14.1f}")
+
+    finally:
+        if not args.keep:
+            async with engine.begin() as connection:
+                await connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--stories", type=int, default=200)
+    parser.add_argument("--minutes", type=int, default=30)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="не удалять схему с данными")
+    arguments = parser.parse_args()
+
+    if not arguments.database_url:
+        parser.error("нужен --database-url или DATABASE_URL")
+    asyncio.run(main(arguments))
@@ -0,0 +1,119 @@
+"""
+Бенчмарк разбиения SSML на чанки: прежний split_by_p_tags против ssml_segmenter.
+
+Сказки на 30 и 60 минут собираются из синтетического текста и размечаются
+build_ssml_markup (как в режиме markup_mode=rules). Кроме времени проверяется,
+что каждый чанк вместе с <speak> не длиннее лимита и является корректным XML.
+
+Запуск из корня репозитория:
+    python -m benchmarks.ssml_segmenter_benchmark
+"""
+
+import contextlib
+import io
+import random
+import re
+import statistics
+import time
+import xml.etree.ElementTree as ElementTree
+
+from app.services.ssml_markup import build_ssml_markup
+from app.services.ssml_segmenter import remove_outer_speak_tags, split_ssml
+
+# Около 130 слов в минуту при спокойном чтении сказки
+WORDS_PER_MINUTE = 130
+MAX_CHUNK_SIZE = 4500
+REPEATS = 20
+
+WORDS = ("жил был маленький лисенок который очень любил смотреть на звезды "
+         "однажды вечером он вышел на поляну и увидел что луна светит ярче обычного").split()
+
+
+def make_story(minutes: int, seed: int = 1, long_paragraph_every: int = 0) -> str:
+    """Текст сказки с абзацами по 3-8 предложений; при long_paragraph_every - с очень длинными абзацами"""
+    rng = random.Random(seed)
+    words_left = minutes * WORDS_PER_MINUTE
+    paragraphs = []
+
+    while words_left > 0:
+        long_paragraph = long_paragraph_every and len(paragraphs) % long_paragraph_every == 0
+        sentences = []
+        for _ in range(rng.randint(60, 90) if long_paragraph else rng.randint(3, 8)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+            sentence = " ".join(words).capitalize()
+            if rng.random() < 0.3:
+                sentence = sentence.replace(" ", ", ", 1)
+            sentences.append(sentence + rng.choice(".!?"))
+            words_left -= len(words)
+        paragraphs.append(" ".join(sentences))
+
+    return "\n\n".join(paragraphs)
+
+
+def legacy_split_by_p_tags(ssml_content: str, max_chunk_size: int) -> list[str]:
+    """Прежний алгоритм из audio_maker (без отладочного вывода)"""
+    chunks = []
+    p_blocks = re.findall(r'<p[^>]*>.*?</p>', ssml_content, re.DOTALL | re.IGNORECASE)
+    current_chunk = ""
+
+    for p_block in p_blocks:
+        test_chunk = current_chunk + p_block
+        if len(f"<speak>{test_chunk}</speak>") <= max_chunk_size:
+            current_chunk = test_chunk
+        elif current_chunk:
+            chunks.append(current_chunk)
+            current_chunk = p_block
+        else:
+            chunks.append(p_block)
+
+    if current_chunk:
+        chunks.append(current_chunk)
+    return chunks
+
+
+def check_chunks(chunks: list[str]) -> int:
+    """Число чанков, которые длиннее лимита или не являются корректным XML"""
+    invalid = 0
+    for chunk in chunks:
+        wrapped = f"<speak>{chunk}</speak>"
+        try:
+            ElementTree.fromstring(wrapped)
+        except ElementTree.ParseError:
+            invalid += 1
+            continue
+        if len(wrapped) > MAX_CHUNK_SIZE:
+            invalid += 1
+    return invalid
+
+
+def measure(split, content: str) -> tuple[float, list[str]]:
+    timings = []
+    chunks = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        chunks = split(content, MAX_CHUNK_SIZE)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), chunks
+
+
+def main() -> None:
+    cases = [
+        ("30 мин", make_story(30)),
+        ("60 мин", make_story(60)),
+        ("60 мин, длинные абзацы", make_story(60, long_paragraph_every=5)),
+    ]
+
+    print(f"{'сказка':<24}{'SSML, симв.':>12}{'алгоритм':>12}{'медиана, мс':>14}{'чанков':>8}{'плохих':>8}")
+    for name, story in cases:
+        content = remove_outer_speak_tags(build_ssml_markup(story, "ru"))
+
+        for label, split in (("прежний", legacy_split_by_p_tags), ("новый", split_ssml)):
+            # Подавляем служебный вывод split_ssml, чтобы он не искажал замер
+            with contextlib.redirect_stdout(io.StringIO()):
+                median, chunks = measure(split, content)
+            print(f"{name:<24}{len(content):>12}{label:>12}{median * 1000:>14.2f}"
+                  f"{len(chunks):>8}{check_chunks(chunks):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Допуск к генерации: корзина токенов, лимиты параллельности и порядок их проверки."""
+
+import pytest
+
+from app.services import admission
+from app.services.admission import AdmissionController, AdmissionRejected, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return clock
+
+
+def make_controller(requests_per_minute=60, per_user=1, total=2) -> AdmissionController:
+    return AdmissionController(
+        requests_per_minute=requests_per_minute,
+        max_concurrent_per_user=per_user,
+        max_concurrent_total=total,
+        retry_after_seconds=30
+    )
+
+
+def test_token_bucket_refills_over_time(clock):
+    bucket = TokenBucket(capacity=3, refill_per_second=0.5)
+
+    for _ in range(3):
+        assert bucket.wait_time() == 0
+        bucket.take()
+    assert bucket.wait_time() == pytest.approx(2.0)
+
+    clock.now += 1
+    assert bucket.wait_time() == pytest.approx(1.0)
+
+    clock.now += 1
+    assert bucket.wait_time() == 0
+    bucket.take()
+    assert bucket.wait_time() == pytest.approx(2.0)
+
+
+def test_token_bucket_does_not_exceed_capacity(clock):
+    bucket = TokenBucket(capacity=2, refill_per_second=1)
+
+    clock.now += 3600
+    for _ in range(2):
+        assert bucket.wait_time() == 0
+        bucket.take()
+
+    assert bucket.wait_time() == pytest.approx(1.0)
+
+
+def test_rate_limit_rejects_with_retry_after(clock):
+    controller = make_controller(requests_per_minute=2, per_user=10, total=10)
+
+    controller.take_token("user:a")
+    controller.take_token("user:a")
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.take_token("user:a")
+
+    assert rejected.value.status_code == 429
+    # Токен появляется через 30 секунд при 2 запросах в минуту
+    assert rejected.value.retry_after == 30
+    assert rejected.value.to_http_exception().headers == {"Retry-After": "30"}
+    assert controller.rejected_total["rate_limit"] == 1
+
+    # Лимит считается по клиенту
+    controller.take_token("user:b")
+
+    clock.now += 30
+    controller.take_token("user:a")
+
+
+def test_per_user_concurrency_limit_and_release(clock):
+    controller = make_controller(per_user=1, total=10)
+
+    controller.acquire("user:a")
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("user:a")
+    assert rejected.value.status_code == 429
+    assert controller.rejected_total["user_concurrency"] == 1
+
+    controller.acquire("user:b")
+    controller.release("user:a")
+    controller.acquire("user:a")
+
+    assert controller.active_total == 2
+
+
+def test_global_limit_is_checked_before_per_user_limit(clock):
+    controller = make_controller(per_user=1, total=2)
+    controller.acquire("user:a")
+    controller.acquire("user:b")
+
+    # user:a упирается в оба лимита - ответ 503, чтобы клиент ждал освобождения сервиса
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("user:a")
+
+    assert rejected.value.status_code == 503
+    assert controller.rejected_total == {"rate_limit": 0, "user_concurrency": 0, "global_concurrency": 1}
+
+
+def test_rejected_request_does_not_spend_token(clock):
+    controller = make_controller(requests_per_minute=2, per_user=1, total=10)
+    controller.acquire("user:a")
+
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("user:a")
+    controller.release("user:a")
+
+    # Второй токен не потрачен отклоненным запросом
+    controller.acquire("user:a")
+
+
+def test_admit_releases_slot_on_error(clock):
+    controller = make_controller()
+
+    with pytest.raises(RuntimeError):
+        with controller.admit("user:a"):
+            assert controller.active == {"user:a": 1}
+            raise RuntimeError("сбой генерации")
+
+    assert controller.active == {}
+    assert controller.active_total == 0
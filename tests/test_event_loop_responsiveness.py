@@ -0,0 +1,116 @@
+"""
+Озвучка через Google Long Audio и загрузка в S3 не должны останавливать event loop.
+
+Синхронные SDK (ожидание операции Long Audio, скачивание и удаление файла в GCS,
+boto3 put_object) заменены заглушками с time.sleep. Пока идет вызов, отдельная
+корутина проверяет, насколько event loop опаздывает с ее пробуждением: если бы
+вызов выполнялся в самом loop, задержка была бы не меньше времени time.sleep.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.services import audio_maker
+from app.services.audio_maker import GoogleCloudAudioMaker
+from app.services.storage import s3_storage
+
+BLOCKING_CALL_SECONDS = 0.3
+TICK_SECONDS = 0.01
+MAX_LOOP_LAG_SECONDS = 0.1
+
+
+class FakeBlob:
+    def download_as_bytes(self) -> bytes:
+        time.sleep(BLOCKING_CALL_SECONDS)
+        return b"RIFF-audio"
+
+    def delete(self) -> None:
+        time.sleep(BLOCKING_CALL_SECONDS)
+
+
+class FakeBucket:
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob()
+
+
+class FakeGCSClient:
+    def bucket(self, name: str, user_project: str = None) -> FakeBucket:
+        return FakeBucket()
+
+
+class FakeOperation:
+    def result(self, timeout: float = None) -> None:
+        time.sleep(BLOCKING_CALL_SECONDS)
+
+
+class FakeLongAudioClient:
+    def synthesize_long_audio(self, request) -> FakeOperation:
+        return FakeOperation()
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.put_keys = []
+
+    def put_object(self, **params) -> dict:
+        time.sleep(BLOCKING_CALL_SECONDS)
+        self.put_keys.append(params["Key"])
+        return {}
+
+
+async def run_with_loop_lag(awaitable):
+    """Результат awaitable и наибольшее опоздание тикера за время его выполнения"""
+    loop = asyncio.get_running_loop()
+    lags = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            started_at = loop.time()
+            await asyncio.sleep(TICK_SECONDS)
+            lags.append(loop.time() - started_at - TICK_SECONDS)
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    try:
+        result = await awaitable
+    finally:
+        stop.set()
+        await ticker_task
+
+    return result, max(lags)
+
+
+@pytest.fixture
+def google_audio_maker(monkeypatch):
+    # Конструктор требует учетные данные Google, поэтому нужные атрибуты задаются вручную
+    maker = GoogleCloudAudioMaker.__new__(GoogleCloudAudioMaker)
+    maker.project_id = "test-project"
+    maker.temp_gcs_bucket = "test-bucket"
+    maker.gcs_client = FakeGCSClient()
+    maker.long_audio_client = FakeLongAudioClient()
+    monkeypatch.setattr(audio_maker.texttospeech, "SynthesizeLongAudioRequest", lambda **params: params)
+    return maker
+
+
+@pytest.mark.asyncio
+async def test_long_audio_synthesis_keeps_loop_responsive(google_audio_maker):
+    audio_data, max_lag = await run_with_loop_lag(
+        google_audio_maker.synthesize_long_audio(synthesis_input=None, voice=None, audio_config=None)
+    )
+
+    assert audio_data == b"RIFF-audio"
+    assert max_lag < MAX_LOOP_LAG_SECONDS
+
+
+@pytest.mark.asyncio
+async def test_s3_put_object_keeps_loop_responsive(monkeypatch):
+    client = FakeS3Client()
+    monkeypatch.setattr(s3_storage, "_client", client)
+
+    _, max_lag = await run_with_loop_lag(s3_storage.put_object("audio/test.mp3", b"mp3", public=True))
+
+    assert client.put_keys == ["audio/test.mp3"]
+    assert max_lag < MAX_LOOP_LAG_SECONDS
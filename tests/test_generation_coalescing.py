@@ -0,0 +1,101 @@
+"""
+Объединение одинаковых запросов генерации: Idempotency-Key действует только
+в пределах одного клиента, чужой запрос с тем же ключом запускает свою генерацию.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.routers import generation
+from app.schemas import LanguageEnum, Questionnaire, StoryGenerationResponse, UserAccessRequest
+from app.services.single_flight import generation_single_flight
+
+IDEMPOTENCY_KEY = "same-key"
+
+
+def make_http_request(host: str = "127.0.0.1"):
+    return SimpleNamespace(client=SimpleNamespace(host=host))
+
+
+@pytest.fixture
+def questionnaire() -> Questionnaire:
+    # Анкета не проверяется и не хешируется: у запросов есть Idempotency-Key
+    return Questionnaire.model_construct(language=LanguageEnum.RUSSIAN)
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    """Пайплайн без провайдеров: сказка принадлежит пользователю, для которого запущена"""
+    started = []
+    release = asyncio.Event()
+
+    async def run_generation_pipeline(user_id, data, **kwargs):
+        started.append(user_id)
+        await release.wait()
+        return StoryGenerationResponse(
+            user_id=user_id,
+            created_at=datetime.now(),
+            title=f"Сказка {user_id}",
+            content=f"Текст для {user_id}",
+            url=f"https://example.com/{user_id}.mp3"
+        )
+
+    monkeypatch.setattr(generation, "run_generation_pipeline", run_generation_pipeline)
+    return SimpleNamespace(started=started, release=release)
+
+
+def start(user_id: uuid.UUID, questionnaire: Questionnaire, host: str = "127.0.0.1"):
+    http_request = make_http_request(host)
+    request = UserAccessRequest(user_id=user_id)
+    key = generation.get_coalescing_key(http_request, user_id, questionnaire, IDEMPOTENCY_KEY)
+    return generation.start_or_join_generation(http_request, request, questionnaire, key)
+
+
+def test_idempotency_key_is_scoped_by_client(questionnaire):
+    first_user, second_user = uuid.uuid4(), uuid.uuid4()
+
+    def key(user_id, host="127.0.0.1"):
+        return generation.get_coalescing_key(make_http_request(host), user_id, questionnaire, IDEMPOTENCY_KEY)
+
+    assert key(first_user) != key(second_user)
+    assert key(None, "10.0.0.1") != key(None, "10.0.0.2")
+    assert key(first_user) == key(first_user, "10.0.0.2")
+
+
+@pytest.mark.asyncio
+async def test_same_idempotency_key_from_two_users_is_not_shared(questionnaire, fake_pipeline):
+    first_user, second_user = uuid.uuid4(), uuid.uuid4()
+
+    first_call = start(first_user, questionnaire)
+    second_call = start(second_user, questionnaire)
+    assert first_call is not second_call
+
+    fake_pipeline.release.set()
+    first_result, second_result = await asyncio.gather(
+        generation_single_flight.wait(first_call),
+        generation_single_flight.wait(second_call)
+    )
+
+    assert sorted(fake_pipeline.started) == sorted([first_user, second_user])
+    assert first_result.user_id == first_user
+    assert second_result.user_id == second_user
+    assert first_result.content != second_result.content
+
+
+@pytest.mark.asyncio
+async def test_retry_from_same_user_joins_running_generation(questionnaire, fake_pipeline):
+    user_id = uuid.uuid4()
+
+    first_call = start(user_id, questionnaire)
+    retry_call = start(user_id, questionnaire)
+    assert retry_call is first_call
+
+    fake_pipeline.release.set()
+    result = await generation_single_flight.wait(first_call)
+
+    assert fake_pipeline.started == [user_id]
+    assert result.user_id == user_id
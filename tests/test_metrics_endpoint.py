@@ -0,0 +1,28 @@
+"""/metrics закрыт теми же учетными данными, что и /service_stats."""
+
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import metrics
+
+
+@pytest.fixture
+def client() -> TestClient:
+    app = FastAPI()
+    app.include_router(metrics.router)
+    return TestClient(app)
+
+
+def test_metrics_require_credentials(client):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", auth=(os.environ["DOCS_USERNAME"], "wrong")).status_code == 401
+
+
+def test_metrics_with_credentials(client):
+    response = client.get("/metrics", auth=(os.environ["DOCS_USERNAME"], os.environ["DOCS_PASSWORD"]))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
@@ -0,0 +1,140 @@
+"""
+Разбор и склейка MP3 по фреймам (app.services.mp3).
+
+Фикстуры в tests/fixtures - короткие моно MP3 с ID3 тегом и LAME Info фреймом,
+как чанки от TTS. Число аудио фреймов сверяется с полем frames их Info заголовка,
+склеенный файл проверяется тем же разбором и декодированием через ffmpeg.
+"""
+
+import array
+import io
+import shutil
+import struct
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from app.services import mp3
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+CHUNK_1S = "chunk_24k_1s.mp3"
+CHUNK_05S = "chunk_24k_05s.mp3"
+CHUNK_44K = "chunk_44k_02s.mp3"
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="нужен ffmpeg для декодирования")
+
+
+def read_fixture(name: str) -> bytes:
+    return (FIXTURES / name).read_bytes()
+
+
+def info_frame_fields(data: bytes) -> tuple[bytes, int, int]:
+    """Метка (Xing/Info), число фреймов и размер потока из Xing/Info заголовка первого фрейма"""
+    offset = mp3.id3v2_size(data)
+    header = mp3.parse_frame_header(data, offset)
+    position = offset + 4 + header.side_info_size
+    tag = data[position:position + 4]
+    flags, frames, size = struct.unpack(">III", data[position + 4:position + 16])
+    assert flags & 0x0003 == 0x0003
+    return tag, frames, size
+
+
+def concatenate(*names: str) -> tuple[bytes, mp3.Mp3StreamWriter]:
+    """Склейка как в streaming_upload: Info фрейм записывается на зарезервированное место"""
+    buffer = io.BytesIO()
+    writer = mp3.Mp3StreamWriter(buffer)
+    for name in names:
+        writer.add_chunk(read_fixture(name))
+
+    data = buffer.getvalue()
+    info_frame = writer.build_info_frame()
+    return info_frame + data[len(info_frame):], writer
+
+
+@pytest.mark.parametrize("name", [CHUNK_1S, CHUNK_05S, CHUNK_44K])
+def test_frame_count_matches_info_header(name):
+    data = read_fixture(name)
+    _, expected_frames, _ = info_frame_fields(data)
+
+    frames = list(mp3.iter_frames(data))
+
+    assert len(frames) == expected_frames
+    # ID3 тег и Info фрейм не считаются аудио фреймами
+    assert frames[0][0] > mp3.id3v2_size(data)
+    assert not mp3.is_info_frame(data, frames[0][0], frames[0][1])
+
+
+@pytest.mark.parametrize("name, seconds", [(CHUNK_1S, 1.0), (CHUNK_05S, 0.5), (CHUNK_44K, 0.2)])
+def test_duration_from_frame_headers(name, seconds):
+    data = read_fixture(name)
+    frames = list(mp3.iter_frames(data))
+    header = frames[0][1]
+
+    duration = mp3.get_duration(data)
+
+    assert duration == pytest.approx(len(frames) * header.samples_per_frame / header.sample_rate)
+    # Кодер добавляет задержку и дополняет последний фрейм - не больше пары фреймов
+    assert seconds <= duration < seconds + 3 * header.duration
+
+
+def test_resync_after_garbage():
+    data = read_fixture(CHUNK_05S)
+    frames = list(mp3.iter_frames(data))
+
+    # Мусор с байтами синхронизации внутри потока пропускается
+    first_audio = frames[0][0]
+    damaged = data[:first_audio] + b"\xFF\xFB\x00garbage\xFF" + data[first_audio:]
+
+    assert len(list(mp3.iter_frames(damaged))) == len(frames)
+
+
+def test_concatenated_file_has_single_info_frame():
+    data, writer = concatenate(CHUNK_1S, CHUNK_05S, CHUNK_1S)
+    chunk_frames = [len(list(mp3.iter_frames(read_fixture(name)))) for name in (CHUNK_1S, CHUNK_05S, CHUNK_1S)]
+
+    tag, frames, size = info_frame_fields(data)
+
+    assert tag == b"Info"
+    assert frames == writer.frame_count == sum(chunk_frames)
+    assert size == len(data)
+    # Внутри файла нет ID3 тегов и Info фреймов чанков
+    assert data.count(b"ID3") == 0
+    assert data.count(b"Info") == 1
+    assert len(list(mp3.iter_frames(data))) == frames
+    assert mp3.get_duration(data) == pytest.approx(writer.duration)
+
+
+def test_toc_is_monotonic():
+    _, writer = concatenate(CHUNK_1S, CHUNK_05S)
+    toc = writer.build_toc(writer.info_frame_size + writer.audio_bytes)
+
+    assert len(toc) == mp3.XING_TOC_SIZE
+    assert list(toc) == sorted(toc)
+
+
+def test_chunk_in_other_format_is_rejected():
+    writer = mp3.Mp3StreamWriter(io.BytesIO())
+    writer.add_chunk(read_fixture(CHUNK_1S))
+
+    with pytest.raises(ValueError):
+        writer.add_chunk(read_fixture(CHUNK_44K))
+
+
+@requires_ffmpeg
+def test_concatenated_file_decodes():
+    data, writer = concatenate(CHUNK_1S, CHUNK_05S, CHUNK_1S)
+
+    # Декодирование в 16-битный PCM; -v error: любые жалобы декодера попадут в stderr
+    result = subprocess.run(
+        ["ffmpeg", "-v", "error", "-f", "mp3", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "pipe:1"],
+        input=data, capture_output=True, check=False
+    )
+    samples = array.array("h", result.stdout)
+
+    assert result.returncode == 0
+    assert result.stderr == b""
+    # Декодер убирает задержку кодера по Info заголовку, поэтому допуск - несколько фреймов
+    assert len(samples) / 24000 == pytest.approx(writer.duration, abs=0.15)
+    assert max(samples) > 1000
@@ -0,0 +1,150 @@
+"""
+Keyset пагинация списков (app.services.pagination): курсоры и обход страниц.
+Страницы выбираются настоящими запросами keyset_page в SQLite в памяти по таблицам
+из app.models, в том числе когда у многих записей одинаковый created_at.
+"""
+
+import base64
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlmodel import SQLModel, select
+
+from app.config import settings
+from app.models import STORY_PREVIEW_COLUMNS, Collection, Story, User
+from app.services.pagination import (InvalidCursor, decode_cursor, encode_cursor, keyset_page, page_size,
+                                     split_page)
+
+CREATED_AT = datetime(2026, 10, 18, 12, 0, 0, 123456)
+
+
+def test_cursor_round_trip():
+    item_id = uuid.uuid4()
+
+    cursor = encode_cursor(CREATED_AT, item_id)
+
+    assert decode_cursor(cursor) == (CREATED_AT, item_id)
+    # Курсор передается в query string: без padding и символов, требующих экранирования
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+
+@pytest.mark.parametrize("cursor", [
+    "не-base64!",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    base64.urlsafe_b64encode(b'{"created_at": "2026-10-18T12:00:00"}').decode(),
+    base64.urlsafe_b64encode(b'{"created_at": "yesterday", "id": "1"}').decode(),
+    base64.urlsafe_b64encode(b'["2026-10-18T12:00:00", "1"]').decode(),
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursor) as error:
+        decode_cursor(cursor)
+
+    assert error.value.to_http_exception().status_code == 400
+
+
+@pytest.mark.parametrize("limit, expected", [
+    (None, settings.page_size_default),
+    (0, settings.page_size_default),
+    (-5, settings.page_size_default),
+    (7, 7),
+    (settings.page_size_max + 1, settings.page_size_max),
+])
+def test_page_size(limit, expected):
+    assert page_size(limit) == expected
+
+
+def test_split_page_boundaries():
+    rows = [(CREATED_AT, uuid.uuid4()) for _ in range(4)]
+
+    def key(row):
+        return row
+
+    # Ровно limit записей - последняя страница
+    assert split_page(rows[:3], 3, key) == (rows[:3], None)
+    # limit + 1 записей - курсор указывает на последнюю запись страницы
+    page, cursor = split_page(rows, 3, key)
+    assert page == rows[:3]
+    assert decode_cursor(cursor) == rows[2]
+    assert split_page([], 3, key) == ([], None)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine, tables=[User.__table__, Collection.__table__, Story.__table__])
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def add_stories(session: Session, created_at_values: list[datetime]) -> uuid.UUID:
+    user = User()
+    collection = Collection(title="Коллекция", user_id=user.id)
+    session.add_all([user, collection])
+    for n, created_at in enumerate(created_at_values):
+        session.add(Story(
+            title=f"Сказка {n}",
+            content_story="Жил-был лисенок.",
+            audio_url=f"https://example.com/{n}.mp3",
+            duration_seconds=60,
+            age_in_months=60,
+            interests=[],
+            user_id=user.id,
+            collection_id=collection.id,
+            created_at=created_at
+        ))
+    session.commit()
+    return user.id
+
+
+def read_all_pages(session: Session, user_id: uuid.UUID, limit: int) -> list[list]:
+    pages = []
+    cursor = None
+    while True:
+        statement = keyset_page(
+            select(*STORY_PREVIEW_COLUMNS).where(Story.user_id == user_id),
+            Story.created_at, Story.id, cursor, limit
+        )
+        page, cursor = split_page(session.execute(statement).all(), limit)
+        pages.append(page)
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, 12, 20])
+def test_pages_with_equal_created_at(session, limit):
+    # Группы записей с одинаковым created_at, в том числе на границах страниц
+    created_at_values = [CREATED_AT] * 7 + [CREATED_AT - timedelta(seconds=1)] * 3 + [CREATED_AT + timedelta(days=1)] * 2
+    user_id = add_stories(session, created_at_values)
+
+    pages = read_all_pages(session, user_id, limit)
+    rows = [row for page in pages for row in page]
+
+    expected = session.execute(
+        select(*STORY_PREVIEW_COLUMNS).where(Story.user_id == user_id).order_by(Story.created_at.desc(), Story.id.desc())
+    ).all()
+    # Каждая запись ровно один раз и в том же порядке, что при выборке без страниц
+    assert [row.id for row in rows] == [row.id for row in expected]
+    assert all(len(page) == limit for page in pages[:-1])
+    assert 0 < len(pages[-1]) <= limit
+
+
+def test_other_users_stories_are_not_paged(session):
+    user_id = add_stories(session, [CREATED_AT] * 3)
+    add_stories(session, [CREATED_AT] * 3)
+
+    rows = [row for page in read_all_pages(session, user_id, 2) for row in page]
+
+    assert len(rows) == 3
+
+
+def test_listing_indexes_match_cursor_order():
+    for table, owner in ((Story.__table__, "user_id"), (Story.__table__, "collection_id"),
+                         (Collection.__table__, "user_id")):
+        index = next(index for index in table.indexes if index.name == f"ix_{table.name}_{owner}_created_at")
+        columns = [str(expression).split(".")[-1] for expression in index.expressions]
+
+        assert columns == [owner, "created_at DESC", "id DESC"]
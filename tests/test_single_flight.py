@@ -0,0 +1,128 @@
+"""Объединение одинаковых запросов: общий результат, отмена без ожидающих, события."""
+
+import asyncio
+
+import pytest
+
+from app.services.single_flight import ClientDisconnected, SingleFlight
+
+
+def make_factory(started: list, release: asyncio.Event, result=None, error: Exception = None):
+    async def factory(call):
+        started.append(call)
+        call.publish("stage", {"stage": "generation"})
+        await release.wait()
+        if error is not None:
+            raise error
+        return result
+
+    return factory
+
+
+@pytest.mark.asyncio
+async def test_joiner_gets_leader_result():
+    flight = SingleFlight()
+    started, release = [], asyncio.Event()
+    factory = make_factory(started, release, result="сказка")
+
+    leader = flight.start("key", factory)
+    joiner = flight.start("key", factory)
+    assert joiner is leader
+
+    waiters = [asyncio.create_task(flight.wait(leader)), asyncio.create_task(flight.wait(joiner))]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == ["сказка", "сказка"]
+    assert len(started) == 1
+    assert flight.coalesced_total == 1
+    # После завершения ключ свободен, следующий запрос запускает новую работу
+    assert flight.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_joiner_gets_leader_exception():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    factory = make_factory([], release, error=ValueError("ошибка генерации"))
+
+    call = flight.start("key", factory)
+    waiters = [asyncio.create_task(flight.wait(flight.start("key", factory))) for _ in range(2)]
+    await asyncio.sleep(0)
+    release.set()
+
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    assert all(isinstance(result, ValueError) and str(result) == "ошибка генерации" for result in results)
+    assert call.task.done()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_when_last_waiter_leaves():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    call = flight.start("key", make_factory([], release))
+
+    first = asyncio.create_task(flight.wait(call))
+    second = asyncio.create_task(flight.wait(call))
+    await asyncio.sleep(0)
+
+    # Отмена одного ожидающего не отменяет общую работу
+    first.cancel()
+    await asyncio.gather(first, return_exceptions=True)
+    await asyncio.sleep(0)
+    assert not call.task.done()
+    assert call.waiters == 1
+
+    second.cancel()
+    await asyncio.gather(second, return_exceptions=True)
+    await asyncio.gather(call.task, return_exceptions=True)
+    assert call.task.cancelled()
+    assert flight.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_disconnected_client_leaves():
+    flight = SingleFlight(disconnect_poll_interval=0.01)
+    call = flight.start("key", make_factory([], asyncio.Event()))
+
+    async def is_disconnected() -> bool:
+        return True
+
+    with pytest.raises(ClientDisconnected):
+        await flight.wait(call, is_disconnected=is_disconnected)
+
+    await asyncio.gather(call.task, return_exceptions=True)
+    assert call.task.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_late_subscriber_gets_event_history():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    call = flight.start("key", make_factory([], release, result="сказка"))
+    await asyncio.sleep(0)
+
+    call.publish("stage", {"stage": "markup"})
+    received = []
+    call.subscribe(lambda event, payload: received.append((event, payload["stage"])))
+    call.publish("stage", {"stage": "audio"})
+
+    assert received == [("stage", "generation"), ("stage", "markup"), ("stage", "audio")]
+    release.set()
+    assert await flight.wait(call) == "сказка"
+
+
+@pytest.mark.asyncio
+async def test_call_without_key_is_not_shared():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    started = []
+    factory = make_factory(started, release, result="сказка")
+
+    first = flight.start(None, factory)
+    second = flight.start(None, factory)
+    release.set()
+
+    assert first is not second
+    assert await flight.wait(first) == await flight.wait(second) == "сказка"
+    assert len(started) == 2
@@ -0,0 +1,120 @@
+"""
+Разметка SSML по правилам (app.services.ssml_markup) для русского (Yandex),
+английского и французского (Google): разметка разбирается как XML, и
+последовательность предложений и пауз сверяется с профилем пауз провайдера.
+"""
+
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+
+from app.services.ssml_markup import PAUSE_PROFILES, build_ssml_markup, split_sentences
+
+
+def parse(markup: str) -> list[list[tuple[str, object]]]:
+    """
+    Абзацы разметки: в каждом - последовательность ("s", текст без тегов)
+    и ("break", миллисекунды). Паузы внутри <s> (после запятых) тоже попадают в список
+    """
+    root = ElementTree.fromstring(markup)
+    assert root.tag == "speak"
+
+    paragraphs = []
+    for paragraph in root:
+        assert paragraph.tag == "p"
+        items = []
+        for element in paragraph:
+            assert element.tag in ("s", "break")
+            if element.tag == "break":
+                items.append(("break", int(element.get("time").removesuffix("ms"))))
+                continue
+            items.append(("s", "".join(element.itertext())))
+            for inner in element:
+                assert inner.tag == "break"
+                items.append(("comma", int(inner.get("time").removesuffix("ms"))))
+        paragraphs.append(items)
+    return paragraphs
+
+
+def test_russian_uses_yandex_pauses():
+    pauses = PAUSE_PROFILES["yandex"]
+    markup = build_ssml_markup(
+        "Лисенок любил звезды, луну и т.д. Однажды он вышел на поляну!\n"
+        "— Привет! — сказал кот. Они пошли домой.",
+        "РУС"
+    )
+
+    assert parse(markup) == [
+        [
+            ("s", "Лисенок любил звезды, луну и т.д."),
+            ("comma", pauses["comma"]),
+            ("break", pauses["sentence"]),
+            ("s", "Однажды он вышел на поляну!"),
+        ],
+        [
+            ("s", "— Привет!"),
+            ("break", pauses["dialogue"]),
+            ("s", "— сказал кот."),
+            ("break", pauses["sentence"]),
+            ("s", "Они пошли домой."),
+        ],
+    ]
+
+
+def test_english_uses_google_pauses():
+    pauses = PAUSE_PROFILES["google"]
+    markup = build_ssml_markup('Mr. Fox loved the stars, the moon, etc. One night he said, "Hello!" Then he left.', "ENG")
+
+    assert parse(markup) == [[
+        ("s", "Mr. Fox loved the stars, the moon, etc."),
+        ("comma", pauses["comma"]),
+        ("comma", pauses["comma"]),
+        ("break", pauses["sentence"]),
+        ("s", "One night he said,"),
+        ("break", pauses["dialogue"]),
+        ("s", '"Hello!"'),
+        ("break", pauses["dialogue"]),
+        ("s", "Then he left."),
+    ]]
+
+
+def test_french_uses_google_pauses():
+    pauses = PAUSE_PROFILES["google"]
+    markup = build_ssml_markup("M. Renard aimait la lune, etc. Un soir il dit « Bonjour ! » et partit. Fin ?", "FRA")
+
+    assert parse(markup) == [[
+        ("s", "M. Renard aimait la lune, etc."),
+        ("comma", pauses["comma"]),
+        ("break", pauses["sentence"]),
+        ("s", "Un soir il dit"),
+        ("break", pauses["dialogue"]),
+        ("s", "« Bonjour ! »"),
+        ("break", pauses["dialogue"]),
+        ("s", "et partit."),
+        ("break", pauses["sentence"]),
+        ("s", "Fin ?"),
+    ]]
+
+
+def test_special_characters_are_escaped():
+    markup = build_ssml_markup("Лисенок & кот <друзья>.", "РУС")
+
+    assert parse(markup) == [[("s", "Лисенок & кот <друзья>.")]]
+
+
+@pytest.mark.parametrize("language, paragraph, expected", [
+    # т.д., т.п. и etc. перед заглавной буквой завершают предложение
+    ("РУС", "Он ел кашу, сметану и т.д. Однажды он ушел.", ["Он ел кашу, сметану и т.д.", "Однажды он ушел."]),
+    ("РУС", "Там грибы, ягоды и т.п. Потом пошел дождь.", ["Там грибы, ягоды и т.п.", "Потом пошел дождь."]),
+    ("ENG", "He ate apples, pears, etc. Then he slept.", ["He ate apples, pears, etc.", "Then he slept."]),
+    ("FRA", "Des pommes, des poires, etc. Puis il dormit.", ["Des pommes, des poires, etc.", "Puis il dormit."]),
+    # Перед строчной буквой граница не ставится
+    ("РУС", "Он ел кашу и т.д. и ушел.", ["Он ел кашу и т.д. и ушел."]),
+    # Остальные сокращения и инициалы предложение не завершают
+    ("РУС", "Он спал, т.е. Лисенок отдыхал.", ["Он спал, т.е. Лисенок отдыхал."]),
+    ("РУС", "Сказку написал А. Пушкин.", ["Сказку написал А. Пушкин."]),
+    ("ENG", "Dr. Owl met Mr. Fox. They talked.", ["Dr. Owl met Mr. Fox.", "They talked."]),
+    ("FRA", "Mme. Chouette vit M. Renard. Ils parlèrent.", ["Mme. Chouette vit M. Renard.", "Ils parlèrent."]),
+])
+def test_split_sentences(language, paragraph, expected):
+    assert split_sentences(paragraph, language) == expected
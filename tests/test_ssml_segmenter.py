@@ -0,0 +1,71 @@
+"""
+Чанки SSML для Google TTS не должны быть длиннее max_chunk_size вместе с <speak>,
+иначе синхронный API отклонит запрос. Проверяются деление абзацев <p>,
+контент без <p> и длинные предложения без <break/>, которые делятся по пробелам.
+"""
+
+import random
+import re
+
+import pytest
+
+from app.services.ssml_segmenter import split_ssml, split_text
+
+WORDS = ("жил был лисенок он любил смотреть на звезды однажды вечером вышел "
+         "на поляну и увидел что луна светит ярче обычного").split()
+
+
+def make_sentence(rng: random.Random, words: int, with_breaks: bool) -> str:
+    parts = []
+    for _ in range(words):
+        parts.append(rng.choice(WORDS))
+        if with_breaks and rng.random() < 0.1:
+            parts.append('<break time="300ms"/>')
+    return f"<s>{' '.join(parts)}.</s>"
+
+
+def make_ssml(rng: random.Random, with_paragraphs: bool, with_breaks: bool) -> str:
+    paragraphs = []
+    for _ in range(rng.randint(1, 8)):
+        # Встречаются и очень длинные предложения, которые делятся только по пробелам
+        sentences = [make_sentence(rng, rng.choice([5, 20, 200]), with_breaks) for _ in range(rng.randint(1, 6))]
+        paragraphs.append("".join(sentences))
+    if with_paragraphs:
+        return "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+    return "".join(paragraphs)
+
+
+def words_of(ssml: str) -> list[str]:
+    return re.sub(r"<[^>]+>", " ", ssml).split()
+
+
+def test_split_text_does_not_exceed_limit_when_space_is_over_limit():
+    assert list(split_text("aaaa bbbb cccc", 4)) == ["aaaa", "bbbb", "cccc"]
+
+
+@pytest.mark.parametrize("limit", [1, 4, 7, 50])
+def test_split_text_pieces_fit_limit(limit):
+    rng = random.Random(limit)
+    text = " ".join(rng.choice(WORDS + ["а" * 12]) for _ in range(300))
+
+    pieces = list(split_text(text, limit))
+
+    assert all(len(piece) <= limit for piece in pieces)
+    # Пробел на границе частей может быть отброшен, длинное слово - разрезано
+    assert "".join("".join(pieces).split()) == "".join(text.split())
+
+
+@pytest.mark.parametrize("with_paragraphs", [True, False])
+@pytest.mark.parametrize("with_breaks", [True, False])
+@pytest.mark.parametrize("max_chunk_size", [300, 1000, 4500])
+def test_chunks_fit_max_chunk_size(with_paragraphs, with_breaks, max_chunk_size):
+    rng = random.Random(max_chunk_size)
+
+    for _ in range(30):
+        ssml = make_ssml(rng, with_paragraphs, with_breaks)
+        chunks = split_ssml(ssml, max_chunk_size)
+
+        assert chunks
+        assert all(len(f"<speak>{chunk}</speak>") <= max_chunk_size for chunk in chunks)
+        # Текст не теряется и не повторяется
+        assert [word for chunk in chunks for word in words_of(chunk)] == words_of(ssml)
@@ -0,0 +1,36 @@
+"""Общий клиент S3 создается один раз, даже если первые обращения идут из нескольких потоков."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services import storage
+from app.services.storage import S3Storage
+
+THREADS = 8
+
+
+def test_client_is_created_once_under_concurrent_first_access(monkeypatch):
+    created = []
+
+    def create_client(*args, **kwargs):
+        # Медленное создание, как у boto3 (загрузка моделей сервиса), расширяет окно гонки
+        time.sleep(0.05)
+        client = object()
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(storage.boto3, "client", create_client)
+    s3 = S3Storage(endpoint_url="https://s3.example.com", region_name="ru-1", bucket_name="test-bucket",
+                   domain="https://test.example.com", max_pool_connections=10, max_attempts=3)
+    barrier = threading.Barrier(THREADS)
+
+    def first_access():
+        barrier.wait()
+        return s3.client
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        clients = list(executor.map(lambda _: first_access(), range(THREADS)))
+
+    assert len(created) == 1
+    assert all(client is created[0] for client in clients)
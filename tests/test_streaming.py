@@ -0,0 +1,78 @@
+"""
+JsonStringFieldExtractor: значение поля из JSON, пришедшего произвольными фрагментами.
+Ответ режется во всех точках, в том числе внутри escape-последовательностей
+(\\", \\uXXXX, суррогатные пары), и склеенный результат сравнивается с json.loads.
+"""
+
+import json
+
+import pytest
+
+from app.services.streaming import JsonStringFieldExtractor
+
+TALES = [
+    "Жил-был лисенок.",
+    'Он сказал: "Привет!"\nИ ушел\tдомой \\ в лес.',
+    "Звезды ✨ и луна 🌙, смайлик 🦊 - суррогатные пары в \\uXXXX",
+    "Управляющие символы: \b\f\r и /слеш/",
+    "",
+]
+
+
+def documents():
+    for tale in TALES:
+        for ensure_ascii in (True, False):
+            for separators in ((", ", ": "), (",", ":")):
+                # Поле не первое, и перед ним строка с кавычками и именем поля внутри
+                yield json.dumps({"title": 'Про "tale": сказка', "tale": tale, "word_count": 3},
+                                 ensure_ascii=ensure_ascii, separators=separators)
+    # Экранирование, которое json.dumps не использует: \/ и \u в верхнем регистре
+    yield '{\n  "tale" :\n  "\\/путь\\/ \\u00E9t\\u00c9"\n}'
+
+
+def feed_all(chunks: list[str]) -> tuple[str, JsonStringFieldExtractor]:
+    extractor = JsonStringFieldExtractor("tale")
+    text = "".join(extractor.feed(chunk) for chunk in chunks)
+    return text, extractor
+
+
+@pytest.mark.parametrize("document", list(documents()))
+def test_split_at_every_offset(document):
+    expected = json.loads(document)["tale"]
+
+    for offset in range(len(document) + 1):
+        text, extractor = feed_all([document[:offset], document[offset:]])
+
+        assert text == expected, f"разрез на позиции {offset}"
+        assert extractor.value == expected
+        assert extractor.finished
+
+
+@pytest.mark.parametrize("document", list(documents()))
+def test_char_by_char(document):
+    text, extractor = feed_all(list(document))
+
+    assert text == json.loads(document)["tale"]
+    assert extractor.finished
+
+
+def test_split_inside_surrogate_pair_at_every_pair_of_offsets():
+    document = json.dumps({"tale": "a🦊b"})
+    start = document.index("\\ud83e")
+
+    for first in range(start, start + 12):
+        for second in range(first, start + 13):
+            text, _ = feed_all([document[:first], document[first:second], document[second:]])
+            assert text == "a🦊b", f"разрезы на позициях {first} и {second}"
+
+
+def test_no_output_before_field_and_after_end():
+    extractor = JsonStringFieldExtractor("tale")
+
+    assert extractor.feed('{"title": "Сказка", "ta') == ""
+    assert extractor.feed('le": "Жил') == "Жил"
+    assert not extractor.finished
+    assert extractor.feed('-был", "word_count": 2}') == "-был"
+    assert extractor.finished
+    assert extractor.feed('"tale": "еще"') == ""
+    assert extractor.value == "Жил-был"